@@ -0,0 +1,127 @@
+"""
+任务名称
+name: OKX BTC 横盘突破策略
+定时规则
+cron: 5 */5 * * * *
+基于 横盘突破策略*.pine 的Python移植（utils/sideways_breakout.py），无需TradingView Webhook中转
+策略说明：
+- 默认运行V3合约版参数，可通过环境变量 SIDEWAYS_VARIANT 切换 v1 / v2 / v3 / btc
+- 每次拉取最近300根5m K线预热流式指标，只对最新一根已完结K线的信号开仓
+- 止盈止损按信号输出的百分比（含ATR风控/波动率分层）计算，随委托附带
+- 仓位按信号的size_pct分层：保证金 = QTY_USDT × size_pct / max_risk_pct（v2/btc波动率分层，v1/v3固定）
+- 存在未成交委托时跳过本次开仓
+- 采用限价单，以信号K线收盘价挂单
+"""
+
+import os
+from utils.okx_utils import (
+    get_kline_data, get_orders_pending, build_order_params,
+    init_trade_api, get_env_var, get_shanghai_time
+)
+from utils.retry_policy import start_run_deadline
+from utils.notification_service import notification_service
+from utils.sideways_breakout import SidewaysBreakoutAdapter, VARIANTS
+
+# ========== 策略参数 ==========
+INST_ID = "BTC-USDT-SWAP"
+BAR = "5m"
+LIMIT = 300
+VARIANT = os.environ.get("SIDEWAYS_VARIANT", "v3")
+LEVERAGE = 10  # 杠杆倍数
+QTY_USDT = 10  # 基准保证金10USDT（对应max_risk_pct，按波动率分层缩放）
+CONTRACT_FACE_VALUE = 0.01  # BTC合约面值
+MIN_QTY = 0.01
+
+
+# ========== 信号分析 ==========
+def analyze_signal(klines):
+    """
+    :param klines: OKX返回的K线（倒序，data[0]可能未完结）
+    :return: 最新一根已完结K线的信号，无信号返回 None
+    """
+    confirmed = [k for k in klines if str(k[-1]) != "0"]
+    if len(confirmed) < 2:
+        return None
+    adapter = SidewaysBreakoutAdapter(VARIANT, INST_ID, BAR)
+    signals = adapter.on_bar(confirmed)
+    return signals[0] if signals else None
+
+
+def position_margin(raw):
+    """
+    按信号的size_pct（Pine中的波动率分层仓位，单位%）缩放基准保证金；
+    range类版本不输出size_pct，按基准保证金下单
+    """
+    size_pct = raw.get('size_pct')
+    base_pct = VARIANTS[VARIANT].get('max_risk_pct')
+    if size_pct is None or not base_pct:
+        return QTY_USDT
+    return QTY_USDT * float(size_pct) / base_pct
+
+
+# ========== 主流程 ==========
+def main():
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
+    if VARIANT not in VARIANTS:
+        print(f"[{get_shanghai_time()}] [ERROR] 未知策略版本: {VARIANT}")
+        return
+    api_key = get_env_var("OKX_API_KEY")
+    secret_key = get_env_var("OKX_SECRET_KEY")
+    passphrase = get_env_var("OKX_PASSPHRASE")
+    flag = get_env_var("OKX_FLAG", default="0")
+    trade_api = init_trade_api(api_key, secret_key, passphrase, flag)
+
+    klines = get_kline_data(api_key, secret_key, passphrase, INST_ID, BAR, limit=LIMIT, flag=flag)
+    if not klines or len(klines) < 60:
+        print(f"[{get_shanghai_time()}] [ERROR] K线数据不足，终止执行")
+        return
+
+    orders = get_orders_pending(trade_api, INST_ID)
+    if orders:
+        print(f"[{get_shanghai_time()}] [INFO] 存在未成交委托，跳过本次开仓")
+        return
+
+    signal = analyze_signal(klines)
+    if not signal:
+        print(f"[{get_shanghai_time()}] [INFO] 横盘突破{VARIANT}: 未满足开仓条件")
+        return
+    raw = signal['raw']
+    print(f"[{get_shanghai_time()}] [SIGNAL] {signal['signal']} 收盘价={signal['entry_price']} "
+          f"区间=[{raw['low_range']}, {raw['high_range']}] 止盈={raw['tp_pct']}% 止损={raw['sl_pct']:.3f}% 仓位={raw.get('size_pct', '-')}")
+
+    margin = position_margin(raw)
+    qty = round(margin * LEVERAGE / signal['entry_price'] / CONTRACT_FACE_VALUE, 2)
+    if qty < MIN_QTY:
+        print(f"[{get_shanghai_time()}] [INFO] 下单数量过小(<{MIN_QTY})，跳过")
+        return
+    order_params = build_order_params(
+        inst_id=INST_ID,
+        side=signal['side'],
+        entry_price=round(signal['entry_price'], 1),
+        size=qty,
+        pos_side=signal['pos_side'],
+        take_profit=round(signal['take_profit'], 1),
+        stop_loss=round(signal['stop_loss'], 1),
+        prefix="BTCSB"
+    )
+    print(f"[{get_shanghai_time()}] [INFO] 下单参数: {order_params}")
+    order_result = trade_api.place_order(**order_params)
+    print(f"[{get_shanghai_time()}] [INFO] 下单结果: {order_result}")
+    notification_service.send_trading_notification(
+        account_name=f"BTC 横盘突破{VARIANT}",
+        inst_id=INST_ID,
+        signal_type=signal['pos_side'],
+        entry_price=signal['entry_price'],
+        size=qty,
+        margin=margin,
+        take_profit_price=signal['take_profit'],
+        stop_loss_price=signal['stop_loss'],
+        success=(order_result and order_result.get('code') == '0'),
+        error_msg=order_result.get('msg', '') if order_result else '',
+        order_params=order_params,
+        order_result=order_result
+    )
+
+
+if __name__ == "__main__":
+    main()
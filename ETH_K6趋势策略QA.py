@@ -15,11 +15,13 @@ cron: 3 */5 * * * *
 
 import os
 from utils.okx_utils import (
-    get_kline_data, get_orders_pending, cancel_pending_open_orders,
-    build_order_params, generate_clord_id, send_bark_notification,
-    init_trade_api, get_env_var, get_shanghai_time
+    get_kline_data, build_order_params, send_bark_notification,
+    init_trade_api, get_env_var, get_shanghai_time, deterministic_clord_id
 )
 from utils.notification_service import notification_service
+from utils.order_manager import OrderManager
+from utils.instruments import INSTRUMENTS
+from utils.retry_policy import start_run_deadline
 
 # ========== 策略参数 ==========
 INST_ID = "ETH-USDT-SWAP"
@@ -91,11 +93,14 @@ def analyze_signal(klines):
 
 # ========== 主流程 ==========
 def main():
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
     api_key = get_env_var("OKX_API_KEY")
     secret_key = get_env_var("OKX_SECRET_KEY")
     passphrase = get_env_var("OKX_PASSPHRASE")
     flag = get_env_var("OKX_FLAG", "0")
     trade_api = init_trade_api(api_key, secret_key, passphrase, flag)
+    # 预加载合约规格，下单参数按 tickSz / lotSz 取整
+    INSTRUMENTS.warm([INST_ID])
     if TEST_MODE:
         klines = FAKE_KLINES_SHORT
         print(f"[{get_shanghai_time()}] [INFO] 已启用假K线数据进行测试")
@@ -105,54 +110,27 @@ def main():
         print(f"[{get_shanghai_time()}] [ERROR] K线数据不足，终止执行")
         return
     latest_close = float(klines[1][4])
-    orders = get_orders_pending(trade_api, INST_ID)
-    cancel_flag = False
-    for order in orders:
-        ord_type = order.get('ordType', '')
-        side = order.get('side', '')
-        pos_side = order.get('posSide', '')
-        attach_algo = order.get('attachAlgoOrds', [])
-        tp_px = None
-        for algo in attach_algo:
-            if 'tpTriggerPx' in algo:
-                tp_px = float(algo['tpTriggerPx'])
-        if ord_type == 'limit' and side == 'buy' and pos_side == 'long' and tp_px:
-            if latest_close >= tp_px:
-                print(f"[{get_shanghai_time()}] [INFO] 多单委托止盈已到，撤销委托: {order['ordId']}")
-                cancel_pending_open_orders(trade_api, INST_ID)
-                cancel_flag = True
-        if ord_type == 'limit' and side == 'sell' and pos_side == 'short' and tp_px:
-            if latest_close <= tp_px:
-                print(f"[{get_shanghai_time()}] [INFO] 空单委托止盈已到，撤销委托: {order['ordId']}")
-                cancel_pending_open_orders(trade_api, INST_ID)
-                cancel_flag = True
-    if cancel_flag:
-        print(f"[{get_shanghai_time()}] [INFO] 已撤销委托，重新获取K线与信号，继续尝试开仓")
-        if TEST_MODE:
-            klines = FAKE_KLINES_SHORT
-        else:
-            klines = get_kline_data(api_key, secret_key, passphrase, INST_ID, BAR, limit=LIMIT)
-        if not klines or len(klines) < 6:
-            print(f"[{get_shanghai_time()}] [ERROR] K线数据不足，终止执行")
-            return
-        latest_close = float(klines[1][4])
-        # 重新获取未成交委托
-        orders = get_orders_pending(trade_api, INST_ID)
-        if orders:
-            print(f"[{get_shanghai_time()}] [INFO] 撤单后仍有未成交委托，跳过本次开仓")
-            return
-    if orders:
+    # 止盈价已被越过的限价开仓单不再单独撤销：有新信号时改单复用，无信号时再撤销
+    manager = OrderManager(trade_api, INST_ID)
+    orders = manager.refresh()
+    stale = manager.stale_entries(latest_close)
+    for order in stale:
+        print(f"[{get_shanghai_time()}] [INFO] {'多' if order['posSide'] == 'long' else '空'}单委托止盈已到: {order['ordId']}")
+    if len(orders) > len(stale):
         print(f"[{get_shanghai_time()}] [INFO] 存在未成交委托，跳过本次开仓")
+        manager.cancel(stale)
         return
-    print(f"[{get_shanghai_time()}] [INFO] 无未成交委托，进入信号判断")
+    print(f"[{get_shanghai_time()}] [INFO] 无有效未成交委托，进入信号判断")
     signal = analyze_signal(klines)
     qty = round(QTY_USDT / signal.get('entry_price', latest_close) / CONTRACT_FACE_VALUE, 2)
     print(f"[{get_shanghai_time()}] [INFO] 本次计算下单数量: {qty:.2f}")
     if not signal['can_entry']:
         print(f"[{get_shanghai_time()}] [INFO] 未满足开仓条件")
+        manager.cancel(stale)
         return
     if qty < 0.01:
         print(f"[{get_shanghai_time()}] [INFO] 下单数量过小(<0.01)，跳过")
+        manager.cancel(stale)
         return
     order_params = build_order_params(
         inst_id=INST_ID,
@@ -162,11 +140,15 @@ def main():
         pos_side=signal['pos_side'],
         take_profit=round(signal['take_profit'], 2),
         stop_loss=round(signal['stop_loss'], 2),
-        prefix="ETH"
+        prefix="ETH",
+        # 由K线时间戳确定的 clOrdId，重试不会重复下单
+        cl_ord_id=deterministic_clord_id("ETH_K6", "", INST_ID, klines[1][0], signal['order_side'], "ETH"),
+        attach_algo_cl_ord_id=deterministic_clord_id("ETH_K6", "", INST_ID, klines[1][0], signal['order_side'], "ETH",
+                                                     salt="tpsl")
     )
     print(f"[{get_shanghai_time()}] [INFO] 下单参数: {order_params}")
-    order_result = trade_api.place_order(**order_params)
-    print(f"[{get_shanghai_time()}] [INFO] 下单结果: {order_result}")
+    action, order_result = manager.submit(order_params, reuse=stale)
+    print(f"[{get_shanghai_time()}] [INFO] 下单结果({action}): {order_result}")
     pos_side = signal.get('pos_side')
     signal_type = str(pos_side) if isinstance(pos_side, str) and pos_side in ('long', 'short') else "无信号"
     notification_service.send_trading_notification(
@@ -20,6 +20,7 @@ from utils.okx_utils import (
     get_trade_api, get_orders_pending, cancel_pending_open_orders,
     build_order_params, send_bark_notification, get_env_var
 )
+from utils.retry_policy import start_run_deadline
 
 
 # ========== 参数设置 ==========
@@ -37,7 +38,41 @@ CONTRACT_FACE_VALUE = 0.01  # ETH-USDT-SWAP每张合约面值
 logger = logging.getLogger("VINE-5m-大振幅反转开仓策略")
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s][%(levelname)s] %(message)s')
 
+def analyze_kline(k):
+    """
+    大振幅反转信号判断
+    :param k: OKX格式K线 [ts, o, h, l, c, ...]
+    :return: 振幅信息及开仓参数字典，无信号时 signal 为 None
+    """
+    open_, high, low, close = float(k[1]), float(k[2]), float(k[3]), float(k[4])
+    range2 = (high - low) / low * 100
+    is_green = close > open_
+    is_red = close < open_
+    analysis = {
+        'timestamp': int(k[0]), 'open': open_, 'high': high, 'low': low, 'close': close,
+        'range2': range2, 'in_range2': range2 > RANGE2_THRESHOLD,
+        'is_green': is_green, 'is_red': is_red, 'signal': None
+    }
+    if not analysis['in_range2']:
+        return analysis
+    if is_green:
+        order_price = (close + high) / 2 * (1 - SLIPPAGE_PERC / 100)
+        analysis.update(
+            signal="SHORT", direction="做空", pos_side="short", side="sell", order_price=order_price,
+            take_profit=order_price * (1 - TAKE_PROFIT_PERC / 100),
+            stop_loss=order_price * (1 + STOP_LOSS_PERC / 100)
+        )
+    elif is_red:
+        order_price = (close + low) / 2 * (1 + SLIPPAGE_PERC / 100)
+        analysis.update(
+            signal="LONG", direction="做多", pos_side="long", side="buy", order_price=order_price,
+            take_profit=order_price * (1 + TAKE_PROFIT_PERC / 100),
+            stop_loss=order_price * (1 - STOP_LOSS_PERC / 100)
+        )
+    return analysis
+
 def main():
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
     # ========== 初始化日志 ==========
     API_KEY = get_env_var("OKX_API_KEY")
     SECRET_KEY = get_env_var("OKX_SECRET_KEY")
@@ -80,6 +115,7 @@ def main():
     orders = get_orders_pending(trade_api, SYMBOL)
     need_skip = False
     if orders:
+        stale_ids = []
         for order in orders:
             side = order.get('side')
             pos_side = order.get('posSide')
@@ -88,35 +124,30 @@ def main():
                 tp_price = price * (1 + TAKE_PROFIT_PERC / 100)
                 if close > tp_price:
                     logger.info(f"多头委托已到达止盈价，撤销: {order}")
-                    try:
-                        cancel_result = cancel_pending_open_orders(trade_api, SYMBOL, order_ids=order.get('ordId'))
-                        logger.info(f"撤销多头委托响应: {cancel_result}")
-                        if not cancel_result:
-                            need_skip = True
-                    except Exception as e:
-                        logger.error(f"撤销多头委托异常: {e}")
-                        need_skip = True
+                    stale_ids.append(order.get('ordId'))
             elif side == 'sell' and pos_side == 'short':
                 tp_price = price * (1 - TAKE_PROFIT_PERC / 100)
                 if close < tp_price:
                     logger.info(f"空头委托已到达止盈价，撤销: {order}")
-                    try:
-                        cancel_result = cancel_pending_open_orders(trade_api, SYMBOL, order_ids=order.get('ordId'))
-                        logger.info(f"撤销空头委托响应: {cancel_result}")
-                        if not cancel_result:
-                            need_skip = True
-                    except Exception as e:
-                        logger.error(f"撤销空头委托异常: {e}")
-                        need_skip = True
+                    stale_ids.append(order.get('ordId'))
+        if stale_ids:
+            # 一次分批并发撤销全部到价委托
+            try:
+                cancel_result = cancel_pending_open_orders(trade_api, SYMBOL, order_ids=stale_ids)
+                logger.info(f"撤销委托响应: {cancel_result}")
+                if not cancel_result:
+                    need_skip = True
+            except Exception as e:
+                logger.error(f"撤销委托异常: {e}")
+                need_skip = True
         if need_skip:
             logger.info("存在未完成委托且撤销失败，跳过本轮开仓")
             return
 
     # 3. 检查K线形态，准备开仓
-    range2 = (high - low) / low * 100
-    in_range2 = range2 > RANGE2_THRESHOLD
-    is_green = close > open_
-    is_red = close < open_
+    analysis = analyze_kline(k)
+    range2, in_range2 = analysis['range2'], analysis['in_range2']
+    is_green, is_red = analysis['is_green'], analysis['is_red']
     logger.info(f"振幅={range2:.2f}%, in_range2={in_range2}, is_green={is_green}, is_red={is_red}")
 
     # ====== 新增：EMA趋势计算与日志 ======
@@ -145,31 +176,16 @@ def main():
         logger.info(f"[DEBUG][{get_shanghai_time()}] EMA数据不足，无法判断趋势")
 
     if in_range2:
-        order_price = None
-        direction = None
-        pos_side = None
-        side = None
-        if is_green:
-            calculated_entry = (close + high) / 2
-            order_price = calculated_entry * (1 - SLIPPAGE_PERC / 100)
-            direction = "做空"
-            pos_side = "short"
-            side = "sell"
-        elif is_red:
-            calculated_entry = (close + low) / 2
-            order_price = calculated_entry * (1 + SLIPPAGE_PERC / 100)
-            direction = "做多"
-            pos_side = "long"
-            side = "buy"
-        else:
+        if not analysis['signal']:
             logger.info("K线无方向，不开仓")
             return
+        order_price, direction = analysis['order_price'], analysis['direction']
+        pos_side, side = analysis['pos_side'], analysis['side']
         qty = int(QTY_USDT / order_price / CONTRACT_FACE_VALUE)
         if qty < 1:
             logger.info("下单数量过小，跳过本次开仓")
             return
-        tp = order_price * (1 - TAKE_PROFIT_PERC / 100) if direction == '做空' else order_price * (1 + TAKE_PROFIT_PERC / 100)
-        sl = order_price * (1 + STOP_LOSS_PERC / 100) if direction == '做空' else order_price * (1 - STOP_LOSS_PERC / 100)
+        tp, sl = analysis['take_profit'], analysis['stop_loss']
         logger.info(f"准备开仓: 方向={direction}, 价格={order_price:.4f}, 数量={qty}, 止盈={tp:.4f}, 止损={sl:.4f}")
 
         # 4. 下单
@@ -9,7 +9,6 @@ cron: 1 1 1 1 *
 
 
 import os
-import sys
 import time
 import json
 from datetime import datetime, timezone, timedelta
@@ -17,12 +16,13 @@ from typing import Dict, List, Optional, Tuple
 import csv
 from glob import glob
 
-# 添加utils目录到路径
-sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
-from okx_utils import (
-    get_shanghai_time, get_orders_pending, cancel_pending_open_orders,
-    generate_clord_id, build_order_params, send_bark_notification
+from utils.okx_utils import (
+    get_shanghai_time, build_order_params, send_bark_notification, OKX_DOMAIN
 )
+from utils.account_executor import run_accounts, mark
+from utils.order_manager import OrderManager, is_open_limit
+from utils.instruments import INSTRUMENTS
+from utils.retry_policy import start_run_deadline
 
 # 导入okx库
 import okx.Trade as Trade
@@ -75,7 +75,7 @@ def append_kline_to_csv(filepath, kline_data):
 
 def fetch_kline_from_okx(inst_id, bar, limit, flag):
     print(f"[DEBUG] 拉取OKX K线: inst_id={inst_id}, bar={bar}, limit={limit}, flag={flag}")
-    marketDataAPI = MarketData.MarketAPI(flag=flag)
+    marketDataAPI = MarketData.MarketAPI(flag=flag, domain=OKX_DOMAIN)
     result = marketDataAPI.get_mark_price_candlesticks(instId=inst_id, bar=bar, limit=str(limit))
     print(f"[DEBUG] OKX返回: {result}")
     if result and result.get('code') == '0':
@@ -185,7 +185,7 @@ class VINEK8Strategy:
     
     def init_trade_api(self, api_key, secret_key, passphrase, flag="0"):
         """初始化交易API"""
-        return Trade.TradeAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag))
+        return Trade.TradeAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag), OKX_DOMAIN)
     
     def log(self, message: str, account_name: str = ""):
         """日志记录"""
@@ -303,53 +303,40 @@ class VINEK8Strategy:
         bearish_trend = ema21_value < ema60_value and ema60_value < ema144_value
         return bullish_trend, bearish_trend
     
-    def check_and_cancel_orders(self, trade_api, account_name: str, latest_price: float) -> bool:
-        """检查并撤销已超过止盈价格的委托"""
+    def find_stale_orders(self, manager: OrderManager, account_name: str, latest_price: float) -> List[Dict]:
+        """
+        检查已超过止盈价格的委托
+        有超过止盈价格的委托时返回全部限价开仓单（原先会一并撤销），由调用方改单复用或撤销
+        """
         self.log(f"检查账户委托状态", account_name)
-        
-        # 获取未成交订单
-        orders = get_orders_pending(trade_api, self.inst_id, account_prefix=account_name)
+        orders = manager.refresh()
         if not orders:
             self.log(f"账户无未成交委托", account_name)
-            return True
-        
-        cancel_needed = False
-        for order in orders:
-            if order.get('ordType') == 'limit':
-                # 检查做多委托
-                if order.get('side') == 'buy' and order.get('posSide') == 'long':
-                    take_profit_price = float(order.get('attachAlgoOrds', [{}])[0].get('tpTriggerPx', 0))
-                    if take_profit_price > 0 and latest_price >= take_profit_price:
-                        self.log(f"做多委托已超过止盈价格，准备撤销: {order['ordId']}", account_name)
-                        cancel_needed = True
-                
-                # 检查做空委托
-                elif order.get('side') == 'sell' and order.get('posSide') == 'short':
-                    take_profit_price = float(order.get('attachAlgoOrds', [{}])[0].get('tpTriggerPx', 0))
-                    if take_profit_price > 0 and latest_price <= take_profit_price:
-                        self.log(f"做空委托已超过止盈价格，准备撤销: {order['ordId']}", account_name)
-                        cancel_needed = True
-        
-        if cancel_needed:
-            success = cancel_pending_open_orders(trade_api, self.inst_id, account_prefix=account_name)
-            if success:
-                self.log(f"成功撤销超过止盈价格的委托", account_name)
-            else:
-                self.log(f"撤销委托失败", account_name)
-                return False
-        
-        return True
+            return []
+        stale = manager.stale_entries(latest_price)
+        for order in stale:
+            direction = "做多" if order['posSide'] == 'long' else "做空"
+            self.log(f"{direction}委托已超过止盈价格: {order['ordId']}", account_name)
+        if not stale:
+            return []
+        return [order for order in orders if is_open_limit(order)]
     
     def calculate_order_size(self, latest_price: float) -> float:
-        # VINE合约每张面值10 VINE
-        contract_vine = 10
+        spec = INSTRUMENTS.cached(self.inst_id)
+        # VINE合约每张面值10 VINE（已加载合约规格时使用交易所 ctVal）
+        contract_vine = spec.ct_val if spec is not None else 10
         contract_value = contract_vine * latest_price  # 每张合约价值（USDT）
         order_size = (self.margin * self.leverage) / contract_value
+        # 至少10张，按10张的整数倍下单
         order_size = max(10, int(order_size // 10) * 10)
+        if spec is not None:
+            # 再按交易所 lotSz / minSz 取整（向上，不低于上面的数量）
+            order_size = max(spec.round_size(order_size, mode="up"), spec.min_sz)
         return order_size
     
-    def place_order(self, trade_api, account_name: str, signal: str, entry_price: float, size: float) -> Optional[Dict]:
-        """下单"""
+    def place_order(self, trade_api, account_name: str, signal: str, entry_price: float, size: float,
+                    manager: Optional[OrderManager] = None, reuse: List[Dict] = ()) -> Optional[Dict]:
+        """下单（传入 manager 时优先改单复用 reuse 中的委托）"""
         try:
             # 确定交易方向
             if signal == "LONG":
@@ -385,8 +372,12 @@ class VINEK8Strategy:
             self.log(f"准备下单: {signal} {size}张 @ {entry_price}", account_name)
             
             # 执行下单
-            result = trade_api.place_order(**order_params)
-            self.log(f"[DEBUG] OKX下单返回: {result}", account_name)
+            mark("下单")
+            if manager is not None:
+                action, result = manager.submit(order_params, reuse=reuse)
+            else:
+                action, result = 'place', trade_api.place_order(**order_params)
+            self.log(f"[DEBUG] OKX下单返回({action}): {result}", account_name)
             
             if result and result.get('code') == '0':
                 order_data = result.get('data', [{}])[0]
@@ -478,6 +469,9 @@ class VINEK8Strategy:
             self.log("未配置任何账户")
             return
         print(f"[DEBUG] 当前账户数量: {len(self.accounts)}")
+        # 预加载合约规格（本地缓存有效期内不请求接口）
+        if not INSTRUMENTS.warm([self.inst_id]):
+            self.log("未获取到合约规格，使用默认面值与精度")
         # 1. 获取K线数据（本地缓存+自动拉取）
         kline_data = get_kline_data_with_cache(
             inst_id=self.inst_id,
@@ -538,34 +532,46 @@ class VINEK8Strategy:
         order_size = self.calculate_order_size(latest_price)
         self.log(f"根据最新价格 {latest_price} 计算的下单数量: {order_size} 张")
         
-        # 3. 对每个账户执行操作
-        for account in self.accounts:
-            account_name = account['name']
-            self.log(f"开始处理账户: {account_name}")
-            try:
-                # 初始化交易API
-                trade_api = self.init_trade_api(
-                    api_key=account['api_key'],
-                    secret_key=account['secret_key'],
-                    passphrase=account['passphrase'],
-                    flag=account['flag']
-                )
-                # 检查并撤销已超过止盈价格的委托
-                if not self.check_and_cancel_orders(trade_api, account_name, latest_price):
-                    self.log(f"账户 {account_name} 撤销委托失败，跳过处理")
-                    continue
-                # 如果有交易信号，执行下单
-                if long_condition or short_condition:
-                    signal = "LONG" if long_condition else "SHORT"
-                    self.place_order(trade_api, account_name, signal, analysis['entry_price'], order_size)
-                else:
-                    self.log(f"账户 {account_name} 无交易信号", account_name)
-            except Exception as e:
-                self.log(f"处理账户 {account_name} 时发生异常: {str(e)}")
-                continue
+        # 3. 各账户并发执行（账户之间相互隔离，后面账户的下单不再等待前面账户的查询与撤单）
+        run_accounts(
+            self.accounts,
+            lambda account: self._process_account(account, long_condition, short_condition,
+                                                  analysis['entry_price'], latest_price, order_size),
+            name=lambda account: account['name']
+        )
+
+    def _process_account(self, account: Dict, long_condition: bool, short_condition: bool,
+                         entry_price: float, latest_price: float, order_size: float):
+        """单个账户：已超过止盈价格的委托在有信号时改单复用，无信号时撤销"""
+        account_name = account['name']
+        self.log(f"开始处理账户: {account_name}")
+        try:
+            # 初始化交易API
+            trade_api = self.init_trade_api(
+                api_key=account['api_key'],
+                secret_key=account['secret_key'],
+                passphrase=account['passphrase'],
+                flag=account['flag']
+            )
+            # 撤单后新下单时需等待保证金释放
+            manager = OrderManager(trade_api, self.inst_id, account_name, confirm_timeout=2)
+            stale = self.find_stale_orders(manager, account_name, latest_price)
+            # 如果有交易信号，执行下单（优先改单复用已超过止盈价格的委托）
+            if long_condition or short_condition:
+                signal = "LONG" if long_condition else "SHORT"
+                self.place_order(trade_api, account_name, signal, entry_price, order_size, manager, stale)
+            else:
+                self.log(f"账户 {account_name} 无交易信号", account_name)
+                manager.confirm_timeout = 0
+                if stale and not manager.cancel(stale):
+                    self.log(f"撤销委托失败", account_name)
+        except Exception as e:
+            self.log(f"处理账户 {account_name} 时发生异常: {str(e)}")
+
 
 def main():
     """主函数"""
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
     strategy = VINEK8Strategy()
     
     # 检查配置
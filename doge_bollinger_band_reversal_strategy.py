@@ -14,8 +14,11 @@ from typing import List, Dict, Optional
 # 添加utils目录
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 from okx_utils import (
-    get_shanghai_time, build_order_params, send_bark_notification
+    get_shanghai_time, build_order_params, send_bark_notification, OKX_DOMAIN
 )
+from account_executor import run_accounts, mark
+from utils.instruments import INSTRUMENTS
+from utils.retry_policy import start_run_deadline
 
 # 导入OKX API
 import okx.Trade as Trade
@@ -56,7 +59,7 @@ def get_kline_data(inst_id: str, bar: str, limit: int, flag: str) -> list:
     result = None  # 初始化result
     try:
         print(f"[DEBUG] 准备初始化 MarketAPI, flag={flag}")
-        market_api = MarketData.MarketAPI(flag=flag)
+        market_api = MarketData.MarketAPI(flag=flag, domain=OKX_DOMAIN)
         print(f"[DEBUG] MarketAPI 初始化成功, 准备获取K线...")
         # ⚠️ 使用 get_mark_price_candlesticks 替换旧接口
         result = market_api.get_mark_price_candlesticks(instId=inst_id, bar=bar, limit=str(limit))
@@ -115,13 +118,14 @@ class BollingerStrategy:
     def init_trade_api(self, account: Dict) -> Trade.TradeAPI:
         """初始化交易API对象"""
         # 按照官方示例，使用位置参数以保证兼容性
-        # 参数顺序: api_key, secret_key, passphrase, debug, flag
+        # 参数顺序: api_key, secret_key, passphrase, debug, flag, domain
         return Trade.TradeAPI(
             account['api_key'],
             account['secret_key'],
             account['passphrase'],
             False,  # debug
-            account['flag']
+            account['flag'],
+            OKX_DOMAIN
         )
 
     def log(self, message: str, account_name: str = ""):
@@ -151,6 +155,9 @@ class BollingerStrategy:
         :param raw_qty: 原始计算数量
         :return: 调整后的合约张数 (0.01的整数倍)
         """
+        spec = INSTRUMENTS.cached(self.inst_id)
+        if spec is not None:
+            return spec.round_size(raw_qty, mode="up")  # 按交易所 lotSz 向上取整
         min_lot = 0.01  # 最小交易单位
         adjusted = math.ceil(raw_qty / min_lot) * min_lot  # 向上取整到最近0.01
         return round(adjusted, 2)  # 保留两位小数
@@ -161,6 +168,9 @@ class BollingerStrategy:
         :param price: 原始价格
         :return: 格式化后价格
         """
+        spec = INSTRUMENTS.cached(self.inst_id)
+        if spec is not None:
+            return spec.round_price(price)  # 按交易所 tickSz 取整
         return round(price, 5)
 
     def generate_signal(self, kline_data: list) -> Optional[dict]:
@@ -237,7 +247,8 @@ class BollingerStrategy:
         """
         # 计算公式：合约张数 = (保证金 × 杠杆) / (价格 × 合约面值)
         # ⚠️ DOGE-USDT-SWAP合约面值 = 10（每张合约代表10 DOGE）
-        contract_face_value = 10
+        spec = INSTRUMENTS.cached(self.inst_id)
+        contract_face_value = spec.ct_val if spec is not None else 10  # 优先使用交易所 ctVal
         raw_size = (self.params['order_value'] * self.params['leverage']) / (entry_price * contract_face_value)
         
         # 精度调整
@@ -261,53 +272,58 @@ class BollingerStrategy:
         # 更新信号时间戳（防重）
         self.last_signal_ts = int(signal['timestamp']) // 1000
         
-        for account in self.accounts:  # 遍历所有账户
-            acc_name = account['name']
-            try:
-                # 检查仓位限制
-                if self.position_counters[acc_name] >= self.params['pyramiding']:
-                    self.log(f"已达最大仓位数({self.params['pyramiding']})，跳过", acc_name)
-                    continue
-                    
-                # 初始化API
-                trade_api = self.init_trade_api(account)
+        # 各账户并发执行，账户之间相互隔离
+        run_accounts(self.accounts, lambda account: self._execute_for_account(account, signal),
+                     name=lambda account: account['name'])
+
+    def _execute_for_account(self, account: Dict, signal: dict):
+        """单个账户：检查仓位上限后按信号方向下单"""
+        acc_name = account['name']
+        try:
+            # 检查仓位限制
+            if self.position_counters[acc_name] >= self.params['pyramiding']:
+                self.log(f"已达最大仓位数({self.params['pyramiding']})，跳过", acc_name)
+                return
                 
-                # 处理空单信号
-                if signal['short_signal']:
-                    # ⚠️ 关键步骤：价格格式化+仓位计算
-                    entry = self.format_price(signal['entry_short'])
-                    size = self.calculate_position_size(entry, acc_name)
-                    if size > 0:
-                        self.place_order(
-                            trade_api,
-                            acc_name,
-                            "sell",  # 方向
-                            "short", # 仓位
-                            entry,
-                            self.format_price(signal['tp_short']),
-                            self.format_price(signal['sl_short']),
-                            size,
-                            account['flag']  # 传递flag
-                        )
-                        
-                # 处理多单信号
-                if signal['long_signal']:
-                    entry = self.format_price(signal['entry_long'])
-                    size = self.calculate_position_size(entry, acc_name)
-                    if size > 0:
-                        self.place_order(
-                            trade_api,
-                            acc_name,
-                            "buy", 
-                            "long",
-                            entry,
-                            self.format_price(signal['tp_long']),
-                            self.format_price(signal['sl_long']),
-                            size,
-                            account['flag']  # 传递flag
-                        )
-            except Exception as e:
-                self.log(f"账户处理异常: {str(e)}", acc_name)
+            # 初始化API
+            trade_api = self.init_trade_api(account)
+            
+            # 处理空单信号
+            if signal['short_signal']:
+                # ⚠️ 关键步骤：价格格式化+仓位计算
+                entry = self.format_price(signal['entry_short'])
+                size = self.calculate_position_size(entry, acc_name)
+                if size > 0:
+                    self.place_order(
+                        trade_api,
+                        acc_name,
+                        "sell",  # 方向
+                        "short", # 仓位
+                        entry,
+                        self.format_price(signal['tp_short']),
+                        self.format_price(signal['sl_short']),
+                        size,
+                        account['flag']  # 传递flag
+                    )
+                    
+            # 处理多单信号
+            if signal['long_signal']:
+                entry = self.format_price(signal['entry_long'])
+                size = self.calculate_position_size(entry, acc_name)
+                if size > 0:
+                    self.place_order(
+                        trade_api,
+                        acc_name,
+                        "buy", 
+                        "long",
+                        entry,
+                        self.format_price(signal['tp_long']),
+                        self.format_price(signal['sl_long']),
+                        size,
+                        account['flag']  # 传递flag
+                    )
+        except Exception as e:
+            self.log(f"账户处理异常: {str(e)}", acc_name)
 
     def place_order(
         self, 
@@ -340,6 +356,7 @@ class BollingerStrategy:
         
         # 根据flag决定执行方式
         if flag == '0':  # 实盘模式
+            mark("下单")
             result = api.place_order(**order_params)
             if result and result.get('code') == '0':
                 self.position_counters[acc_name] += 1  # 更新仓位计数
@@ -370,10 +387,14 @@ class BollingerStrategy:
 # ========================
 def main():
     """策略主入口"""
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
     strategy = BollingerStrategy()
     if not strategy.accounts:
         strategy.log("未配置OKX账户，请设置环境变量")
         return
+    # 预加载合约规格（本地缓存有效期内不请求接口）
+    if not INSTRUMENTS.warm([strategy.inst_id]):
+        strategy.log("未获取到合约规格，使用默认面值与精度")
 
     # 增加日志，显示正在使用的账户信息
     active_account = strategy.accounts[0]
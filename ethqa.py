@@ -6,15 +6,17 @@ cron: 1 */5 * * * *
 """
 import os
 import pandas as pd
-import requests
 import json
-import random
-import string
 import time
 from datetime import datetime, timezone, timedelta
 import okx.MarketData as MarketData
 import okx.Trade as Trade
 from notification_service import notification_service
+from utils.account_executor import run_accounts, mark
+from utils.okx_utils import OKX_DOMAIN, wait_orders_gone, cancel_orders_batched, deterministic_clord_id, place_order_idempotent
+from utils.order_template import OrderTemplates, wait_for_bar_close
+from utils.retry_policy import get_policy, start_run_deadline
+from utils.instruments import INSTRUMENTS
 
 # ============== 可配置参数区域 ==============
 # 交易标的参数
@@ -39,10 +41,18 @@ ACCOUNT_SUFFIXES = ["", "1"]  # 空字符串代表无后缀的默认账号
 
 # 前缀生成配置
 PREFIX = "ETH"  # 使用标的名称作为前缀(如ETH)
+STRATEGY_NAME = "ethqa"  # 参与生成确定性 clOrdId
 
 # 网络请求重试配置
 MAX_RETRIES = 3  # 最大重试次数
-RETRY_DELAY = 2  # 重试间隔(秒)
+RETRY_DELAY = 2  # 最大重试间隔(秒)，实际按指数退避（utils/retry_policy）
+ORDER_RETRY_DELAY = 0.5  # 下单重试间隔(秒)，clOrdId 固定，重试不会重复下单
+CANCEL_CONFIRM_TIMEOUT = 2  # 撤单确认最长等待时间(秒)
+
+# 下单模板配置：脚本在收盘前 ARM_MAX_WAIT 秒内启动时，预构建模板后等待收盘（0 表示不等待，收盘后启动）
+BAR_SECONDS = 300  # K线周期(秒)
+ARM_MAX_WAIT = float(os.getenv("ARM_MAX_WAIT", "0"))
+ARM_CLOSE_DELAY = 1  # 收盘后等待K线确认的秒数
 
 # ==========================================
 
@@ -54,25 +64,15 @@ def get_beijing_time():
 
 def get_orders_pending(trade_api, account_prefix=""):
     """获取当前账户下所有未成交订单信息"""
-    for attempt in range(MAX_RETRIES + 1):
-        try:
-            # 使用Trade API的内部请求方法，只获取未成交订单
-            result = trade_api.get_order_list(instId=INST_ID, state="live")
-            
-            if result and 'code' in result and result['code'] == '0' and 'data' in result:
-                print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 成功获取{len(result['data'])}个未成交订单")
-                return result['data']
-            else:
-                error_msg = result.get('msg', '') if result else '无响应'
-                print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 获取未成交订单失败: {error_msg}")
-        except Exception as e:
-            print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 获取未成交订单异常 (尝试 {attempt+1}/{MAX_RETRIES+1}): {str(e)}")
-            
-        if attempt < MAX_RETRIES:
-            print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 重试中... ({attempt+1}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY)
-    
-    print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 所有尝试失败")
+    # 只获取未成交订单（指数退避重试，受本次运行截止时间与熔断限制）
+    result = get_policy('okx_query').call(lambda: trade_api.get_order_list(instId=INST_ID, state="live"),
+                                          attempts=MAX_RETRIES + 1, max_delay=RETRY_DELAY,
+                                          label=f"{account_prefix} [ORDERS]")
+    if result and 'code' in result and result['code'] == '0' and 'data' in result:
+        print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 成功获取{len(result['data'])}个未成交订单")
+        return result['data']
+    error_msg = result.get('msg', '') if result else '无响应'
+    print(f"[{get_beijing_time()}] {account_prefix} [ORDERS] 获取未成交订单失败: {error_msg}")
     return []
 
 
@@ -123,47 +123,26 @@ def cancel_pending_open_orders(trade_api, account_prefix=""):
         print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 无需要撤销的开仓订单")
         return False  # 返回是否有订单被撤销
     
-    for attempt in range(MAX_RETRIES + 1):
-        try:
-            # 准备批量撤销请求
-            cancel_data = {
-                "cancels": cancel_orders
-            }
-            
-            print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 正在批量撤销{len(cancel_orders)}个开仓订单 (尝试 {attempt+1}/{MAX_RETRIES+1})")
-            result = trade_api._request('POST', '/api/v5/trade/cancel-batch-orders', body=cancel_data)
-            
-            if result and 'code' in result and result['code'] == '0':
-                # 成功响应
-                failed_orders = []
-                for order_result in result['data']:
-                    if order_result['sCode'] != '0':
-                        failed_orders.append({
-                            "ordId": order_result['ordId'],
-                            "code": order_result['sCode'],
-                            "msg": order_result['sMsg']
-                        })
-                
-                if failed_orders:
-                    print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 部分订单撤销失败: {json.dumps(failed_orders)}")
-                else:
-                    print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 所有{len(cancel_orders)}个订单撤销成功")
-                    # 撤销成功后等待一段时间确保撤销操作完成
-                    print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 等待2秒确保撤销操作完成...")
-                    time.sleep(2)
-                    return True
-            else:
-                error_msg = result.get('msg', '') if result else '无响应'
-                print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 批量撤销失败: {error_msg}")
-        except Exception as e:
-            print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 撤销订单异常 (尝试 {attempt+1}/{MAX_RETRIES+1}): {str(e)}")
-            
-        if attempt < MAX_RETRIES:
-            print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 重试中... ({attempt+1}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY)
+    # 分批并发撤销（每批最多20个），只重试失败的订单
+    print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 正在批量撤销{len(cancel_orders)}个开仓订单")
+    done, failed = cancel_orders_batched(trade_api, cancel_orders, attempts=MAX_RETRIES + 1, max_delay=RETRY_DELAY,
+                                         account_prefix=f"{account_prefix} [CANCEL]")
     
-    print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 所有尝试失败")
-    return False
+    if failed:
+        failed_orders = [{"ordId": ord_id, "code": code, "msg": msg} for ord_id, (code, msg) in failed.items()]
+        print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 部分订单撤销失败: {json.dumps(failed_orders, ensure_ascii=False)}")
+    else:
+        print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 所有{len(cancel_orders)}个订单撤销成功")
+    # 轮询确认已撤销的订单从未成交列表中消失（确认即返回，最多等待 CANCEL_CONFIRM_TIMEOUT 秒）
+    if done:
+        started = time.monotonic()
+        remaining = wait_orders_gone(trade_api, INST_ID, done, timeout=CANCEL_CONFIRM_TIMEOUT)
+        elapsed = time.monotonic() - started
+        if remaining:
+            print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] {elapsed:.2f}秒内未确认撤销完成: {remaining}")
+        else:
+            print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 撤销已确认，耗时{elapsed:.2f}秒")
+    return not failed
 
 
 def analyze_kline(kline):
@@ -228,15 +207,8 @@ def analyze_kline(kline):
     return signal, entry_price, amp_info
 
 
-def generate_clord_id(prefix):
-    """生成符合OKX要求的clOrdId：字母数字组合，1-32位"""
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
-    return f"{PREFIX}{timestamp}{random_str}"[:32]
-
-
-def process_account_trading(account_suffix, signal, entry_price, amp_info):
-    """为单个账户执行交易操作"""
+def process_account_trading(account_suffix, signal, entry_price, amp_info, template=None):
+    """为单个账户执行交易操作（template 为该账户对应方向的预构建下单模板）"""
     # 准备账户前缀标识
     suffix = account_suffix if account_suffix else ""  # 空后缀对应默认账户
     account_prefix = f"[ACCOUNT-{suffix}]" if suffix else "[ACCOUNT]"
@@ -253,7 +225,7 @@ def process_account_trading(account_suffix, signal, entry_price, amp_info):
     
     # 初始化API
     try:
-        trade_api = Trade.TradeAPI(api_key, secret_key, passphrase, False, flag)
+        trade_api = Trade.TradeAPI(api_key, secret_key, passphrase, False, flag, OKX_DOMAIN)
         print(f"[{get_beijing_time()}] {account_prefix} API初始化成功")
     except Exception as e:
         print(f"[{get_beijing_time()}] {account_prefix} [ERROR] API初始化失败: {str(e)}")
@@ -263,70 +235,31 @@ def process_account_trading(account_suffix, signal, entry_price, amp_info):
     print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 检测到信号，先撤销现有开仓订单")
     canceled = cancel_pending_open_orders(trade_api, account_prefix)
     
-    # 2. 计算合约数量
-    size = round((MARGIN * LEVERAGE * 10) / entry_price, SizePoint)  # 乘以10是标准倍数
-
-    # 根据信号方向计算止盈止损价格
-    if signal == "LONG":
-        take_profit_price = round(entry_price * (1 + TAKE_PROFIT_PERCENT), 4)
-        stop_loss_price = round(entry_price * (1 - STOP_LOSS_PERCENT), 4)
-    else:  # SHORT
-        take_profit_price = round(entry_price * (1 - TAKE_PROFIT_PERCENT), 4)
-        stop_loss_price = round(entry_price * (1 + STOP_LOSS_PERCENT), 4)
-
-    # 生成符合要求的clOrdId
-    cl_ord_id = generate_clord_id(account_prefix)
-
-    # 构建止盈止损对象列表
-    attach_algo_ord = {
-        "attachAlgoClOrdId": generate_clord_id(account_prefix),
-        "tpTriggerPx": str(take_profit_price),
-        "tpOrdPx": "-1",  # 市价止盈
-        "tpOrdKind": "condition",
-        "slTriggerPx": str(stop_loss_price),
-        "slOrdPx": "-1",  # 市价止损
-        "tpTriggerPxType": "last",
-        "slTriggerPxType": "last"
-    }
-
-    # 重构交易参数
-    order_params = {
-        "instId": INST_ID,
-        "tdMode": "cross",
-        "side": "buy" if signal == "LONG" else "sell",
-        "ordType": "limit",
-        "px": str(entry_price),
-        "sz": str(size),
-        "clOrdId": cl_ord_id,
-        "posSide": "long" if signal == "LONG" else "short",
-        "attachAlgoOrds": [attach_algo_ord]
-    }
+    # 2. 填入收盘前预构建的下单模板（数量按名义价值、止盈止损按比例计算）
+    if template is None:
+        template = new_templates().for_signal(signal)
+    side = "buy" if signal == "LONG" else "sell"
+    bar_ts = amp_info['timestamp']
+    order_params = template.fill(
+        entry_price,
+        cl_ord_id=deterministic_clord_id(STRATEGY_NAME, suffix, INST_ID, bar_ts, side, PREFIX),
+        algo_cl_ord_id=deterministic_clord_id(STRATEGY_NAME, suffix, INST_ID, bar_ts, side, PREFIX, salt="tpsl"))
+    size = template.order_size
+    take_profit_price, stop_loss_price = template.take_profit, template.stop_loss
 
     print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 准备下单参数: {json.dumps(order_params, indent=2)}")
 
-    # 发送订单
-    for attempt in range(MAX_RETRIES + 1):
-        try:
-            order_result = trade_api.place_order(**order_params)
-            print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 订单提交结果: {json.dumps(order_result)}")
-            
-            # 检查是否成功下单
-            if order_result and 'code' in order_result and order_result['code'] == '0':
-                success = True
-                error_msg = ""
-            else:
-                success = False
-                error_msg = order_result.get('msg', '') if order_result else '下单失败，无响应'
-            break
-        except Exception as e:
-            print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 下单异常 (尝试 {attempt+1}/{MAX_RETRIES+1}): {str(e)}")
-            success = False
-            error_msg = str(e)
-            if attempt < MAX_RETRIES:
-                print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 重试中... ({attempt+1}/{MAX_RETRIES})")
-                time.sleep(RETRY_DELAY)
-            else:
-                print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 所有尝试失败")
+    # 发送订单（clOrdId 由K线时间戳确定，超时重试不会重复开仓）
+    mark("下单")
+    order_result = place_order_idempotent(trade_api, order_params, MAX_RETRIES, ORDER_RETRY_DELAY, account_prefix)
+    print(f"[{get_beijing_time()}] {account_prefix} [ORDER] 订单提交结果: {json.dumps(order_result)}")
+    # 检查是否成功下单
+    if order_result and 'code' in order_result and order_result['code'] == '0':
+        success = True
+        error_msg = ""
+    else:
+        success = False
+        error_msg = order_result.get('msg', '') if order_result else '下单失败，无响应'
     
     # 发送交易通知
     notification_service.send_trading_notification(
@@ -348,6 +281,12 @@ def process_account_trading(account_suffix, signal, entry_price, amp_info):
     print(f"[{get_beijing_time()}] {account_prefix} [RESULT] {json.dumps(order_result)}")
 
 
+def new_templates():
+    """按当前参数构建单个账户的多空下单模板（数量 = 保证金 x 杠杆 x 10 / 委托价）"""
+    return OrderTemplates(INST_ID, TAKE_PROFIT_PERCENT, STOP_LOSS_PERCENT, notional=MARGIN * LEVERAGE * 10,
+                          size_decimals=SizePoint, price_decimals=4, prefix=PREFIX)
+
+
 def get_kline_data():
     """获取并分析K线数据"""
     # 使用第一个账户的环境变量初始化市场API
@@ -363,7 +302,7 @@ def get_kline_data():
     
     # 初始化市场API
     try:
-        market_api = MarketData.MarketAPI(api_key, secret_key, passphrase, False, flag)
+        market_api = MarketData.MarketAPI(api_key, secret_key, passphrase, False, flag, OKX_DOMAIN)
         market_api.OK_ACCESS_TIMESTAMP = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         print(f"[{get_beijing_time()}] [MARKET] K线API初始化成功")
     except Exception as e:
@@ -371,18 +310,10 @@ def get_kline_data():
         return None, None, None
     
     # 获取最近K线数据
-    for attempt in range(MAX_RETRIES + 1):
-        try:
-            result = market_api.get_candlesticks(instId=INST_ID, bar=BAR, limit=str(LIMIT))
-            break
-        except Exception as e:
-            print(f"[{get_beijing_time()}] [MARKET] 获取K线数据异常 (尝试 {attempt+1}/{MAX_RETRIES+1}): {str(e)}")
-            if attempt < MAX_RETRIES:
-                print(f"[{get_beijing_time()}] [MARKET] 重试中... ({attempt+1}/{MAX_RETRIES})")
-                time.sleep(RETRY_DELAY)
-            else:
-                print(f"[{get_beijing_time()}] [MARKET] 所有尝试失败")
-                return None, None, None
+    result = get_policy('okx_market').call(
+        lambda: market_api.get_candlesticks(instId=INST_ID, bar=BAR, limit=str(LIMIT)),
+        attempts=MAX_RETRIES + 1, max_delay=RETRY_DELAY, is_success=lambda r: bool(r and r.get('data')),
+        label="[MARKET]")
 
     if not result or 'data' not in result or len(result['data']) < 2:
         print(f"[{get_beijing_time()}] [ERROR] 获取K线数据失败或数据不足")
@@ -428,6 +359,15 @@ def get_kline_data():
 
 if __name__ == "__main__":
     print(f"[{get_beijing_time()}] [INFO] 开始ETH自动交易策略")
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
+
+    # 0. 收盘前预加载合约规格并为各账户预构建多空下单模板，收盘后只需填入价格
+    INSTRUMENTS.warm([INST_ID])
+    templates = {suffix: new_templates() for suffix in ACCOUNT_SUFFIXES}
+    waited = wait_for_bar_close(BAR_SECONDS, ARM_MAX_WAIT, ARM_CLOSE_DELAY)
+    if waited:
+        print(f"[{get_beijing_time()}] [INFO] 模板已就绪，等待收盘 {waited:.1f}s")
+        start_run_deadline()
     
     # 1. 获取K线数据并分析信号
     signal, entry_price, amp_info = get_kline_data()
@@ -447,7 +387,10 @@ if __name__ == "__main__":
     
     # 2. 遍历所有账户执行交易
     print(f"[{get_beijing_time()}] [INFO] 开始处理所有账户交易")
-    for suffix in ACCOUNT_SUFFIXES:
-        process_account_trading(suffix, signal, entry_price, amp_info)
+    # 各账户流程并发执行，后面账户的下单不再等待前面账户的撤单
+    run_accounts(ACCOUNT_SUFFIXES,
+                 lambda suffix: process_account_trading(suffix, signal, entry_price, amp_info,
+                                                        templates[suffix].for_signal(signal)),
+                 name=lambda suffix: f"ACCOUNT-{suffix}" if suffix else "ACCOUNT")
     
     print(f"[{get_beijing_time()}] [INFO] 所有账户交易处理完成")
@@ -34,6 +34,9 @@ RETRY_DELAY = 2  # 重试间隔(秒)
 SHOW_DETAILS = True  # 是否显示详细信息
 MIN_BALANCE_THRESHOLD = 1.0  # 最小余额阈值（USDT），低于此值会高亮显示
 
+# REST 接口地址（本地模拟交易所测试时设置环境变量 OKX_DOMAIN）
+OKX_DOMAIN = os.environ.get("OKX_DOMAIN", "https://www.okx.com")
+
 # ==========================================
 
 def get_beijing_time():
@@ -72,9 +75,9 @@ def init_api(account_suffix=""):
         return None, None, None, account_prefix, account_name
     
     try:
-        account_api = Account.AccountAPI(api_key, secret_key, passphrase, False, flag)
-        trade_api = Trade.TradeAPI(api_key, secret_key, passphrase, False, flag)
-        market_api = MarketData.MarketAPI(api_key, secret_key, passphrase, False, flag)
+        account_api = Account.AccountAPI(api_key, secret_key, passphrase, False, flag, OKX_DOMAIN)
+        trade_api = Trade.TradeAPI(api_key, secret_key, passphrase, False, flag, OKX_DOMAIN)
+        market_api = MarketData.MarketAPI(api_key, secret_key, passphrase, False, flag, OKX_DOMAIN)
         print(f"[{get_beijing_time()}] {account_prefix} API初始化成功 - {account_name}")
         return account_api, trade_api, market_api, account_prefix, account_name
     except Exception as err:  # pylint: disable=broad-except
@@ -10,6 +10,8 @@ import time
 from datetime import datetime, timezone, timedelta
 import okx.MarketData as MarketData
 import okx.Trade as Trade
+from utils.retry_policy import get_policy, okx_degraded, start_run_deadline
+from utils.okx_utils import OKX_DOMAIN
 
 # ============== 可配置参数区域 ==============
 # 环境变量账户后缀，支持多账号 (如OKX_API_KEY1, OKX_SECRET_KEY1, OKX_PASSPHRASE1)
@@ -25,7 +27,7 @@ WAIT_SECONDS = 60  # 订单创建后等待时间（秒）
 
 # 网络请求重试配置
 MAX_RETRIES = 3  # 最大重试次数
-RETRY_DELAY = 2  # 重试间隔(秒)
+RETRY_DELAY = 2  # 最大重试间隔(秒)
 
 # ==========================================
 
@@ -49,56 +51,47 @@ def create_test_order(trade_api, account_prefix):
     
     print(f"[{get_beijing_time()}] {account_prefix} [CREATE] 创建测试订单: {json.dumps(order_params)}")
     
-    for attempt in range(MAX_RETRIES + 1):
-        try:
-            order_result = trade_api.place_order(**order_params)
-            print(f"[{get_beijing_time()}] {account_prefix} [CREATE] 订单创建结果: {json.dumps(order_result)}")
-            
-            if order_result and 'code' in order_result and order_result['code'] == '0':
-                ord_id = order_result['data'][0]['ordId']
-                print(f"[{get_beijing_time()}] {account_prefix} [SUCCESS] 测试订单创建成功, ordId={ord_id}")
-                return True, ord_id, None
-            else:
-                error_msg = order_result.get('msg', '未知错误') if order_result else '无响应'
-                print(f"[{get_beijing_time()}] {account_prefix} [ERROR] 创建订单失败: {error_msg}")
-                return False, None, f"订单创建失败: {error_msg}"
-        except Exception as e:
-            error_msg = f"创建订单异常 (尝试 {attempt+1}/{MAX_RETRIES+1}): {str(e)}"
-            print(f"[{get_beijing_time()}] {account_prefix} [ERROR] {error_msg}")
-            if attempt < MAX_RETRIES:
-                print(f"[{get_beijing_time()}] {account_prefix} [CREATE] 重试中... ({attempt+1}/{MAX_RETRIES})")
-                time.sleep(RETRY_DELAY)
-            else:
-                return False, None, error_msg
-    
-    return False, None, "未知错误"
+    # 业务错误直接返回；异常或服务异常返回码时按 retry_policy 退避重试
+    try:
+        order_result = get_policy('okx_trade').call(lambda: trade_api.place_order(**order_params),
+                                                    attempts=MAX_RETRIES + 1, max_delay=RETRY_DELAY,
+                                                    is_success=lambda r: not okx_degraded(r),
+                                                    label=f"{account_prefix} [CREATE]", reraise=True)
+    except Exception as e:
+        error_msg = f"创建订单异常: {str(e)}"
+        print(f"[{get_beijing_time()}] {account_prefix} [ERROR] {error_msg}")
+        return False, None, error_msg
+    print(f"[{get_beijing_time()}] {account_prefix} [CREATE] 订单创建结果: {json.dumps(order_result)}")
+    
+    if order_result and 'code' in order_result and order_result['code'] == '0':
+        ord_id = order_result['data'][0]['ordId']
+        print(f"[{get_beijing_time()}] {account_prefix} [SUCCESS] 测试订单创建成功, ordId={ord_id}")
+        return True, ord_id, None
+    error_msg = order_result.get('msg', '未知错误') if order_result else '无响应'
+    print(f"[{get_beijing_time()}] {account_prefix} [ERROR] 创建订单失败: {error_msg}")
+    return False, None, f"订单创建失败: {error_msg}"
 
 def cancel_test_order(trade_api, account_prefix, ord_id):
     """为单个账户撤销测试订单"""
     print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 撤销测试订单: ordId={ord_id}")
     
-    for cancel_attempt in range(MAX_RETRIES + 1):
-        try:
-            cancel_result = trade_api.cancel_order(instId=TEST_INST_ID, ordId=ord_id)
-            print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 撤单结果: {json.dumps(cancel_result)}")
-            
-            if cancel_result and 'code' in cancel_result and cancel_result['code'] == '0':
-                print(f"[{get_beijing_time()}] {account_prefix} [SUCCESS] 测试订单撤销成功")
-                return True, "订单撤销成功"
-            else:
-                error_msg = cancel_result.get('msg', '未知错误') if cancel_result else '无响应'
-                print(f"[{get_beijing_time()}] {account_prefix} [ERROR] 撤销订单失败: {error_msg}")
-                return False, f"订单撤销失败: {error_msg}"
-        except Exception as e:
-            error_msg = f"撤销订单异常 (尝试 {cancel_attempt+1}/{MAX_RETRIES+1}): {str(e)}"
-            print(f"[{get_beijing_time()}] {account_prefix} [ERROR] {error_msg}")
-            if cancel_attempt < MAX_RETRIES:
-                print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 重试中... ({cancel_attempt+1}/{MAX_RETRIES})")
-                time.sleep(RETRY_DELAY)
-            else:
-                return False, error_msg
-    
-    return False, "未知错误"
+    try:
+        cancel_result = get_policy('okx_trade').call(lambda: trade_api.cancel_order(instId=TEST_INST_ID, ordId=ord_id),
+                                                     attempts=MAX_RETRIES + 1, max_delay=RETRY_DELAY,
+                                                     is_success=lambda r: not okx_degraded(r),
+                                                     label=f"{account_prefix} [CANCEL]", reraise=True)
+    except Exception as e:
+        error_msg = f"撤销订单异常: {str(e)}"
+        print(f"[{get_beijing_time()}] {account_prefix} [ERROR] {error_msg}")
+        return False, error_msg
+    print(f"[{get_beijing_time()}] {account_prefix} [CANCEL] 撤单结果: {json.dumps(cancel_result)}")
+    
+    if cancel_result and 'code' in cancel_result and cancel_result['code'] == '0':
+        print(f"[{get_beijing_time()}] {account_prefix} [SUCCESS] 测试订单撤销成功")
+        return True, "订单撤销成功"
+    error_msg = cancel_result.get('msg', '未知错误') if cancel_result else '无响应'
+    print(f"[{get_beijing_time()}] {account_prefix} [ERROR] 撤销订单失败: {error_msg}")
+    return False, f"订单撤销失败: {error_msg}"
 
 def send_test_summary(results):
     """发送测试结果摘要"""
@@ -121,6 +114,7 @@ def send_test_summary(results):
 
 if __name__ == "__main__":
     print(f"[{get_beijing_time()}] [INFO] 开始OKX多账户API测试")
+    start_run_deadline()  # 本次运行的重试总时限从此刻开始
     print(f"[{get_beijing_time()}] [CONFIG] 测试标: {TEST_INST_ID}")
     print(f"[{get_beijing_time()}] [CONFIG] 测试价格: {TEST_PRICE}")
     print(f"[{get_beijing_time()}] [CONFIG] 测试数量: {TEST_SIZE}")
@@ -159,7 +153,7 @@ if __name__ == "__main__":
             if api_key is None or secret_key is None or passphrase is None:
                 raise ValueError("API密钥、密钥或密码不能为空")
             
-            trade_api = Trade.TradeAPI(api_key, secret_key, passphrase, False, flag)
+            trade_api = Trade.TradeAPI(api_key, secret_key, passphrase, False, flag, OKX_DOMAIN)
             print(f"[{get_beijing_time()}] {prefix} API初始化成功")
         except Exception as e:
             error_msg = f"API初始化失败: {str(e)}"
@@ -190,6 +184,7 @@ if __name__ == "__main__":
             print(f"[{get_beijing_time()}] [WAITING] 已等待 {i+1} 秒...")
     
     print(f"[{get_beijing_time()}] [WAITING] 等待完成，开始撤销订单")
+    start_run_deadline()  # 撤单阶段重新计算重试总时限
     
     # 第二阶段：为所有账户撤销测试订单
     print(f"\n[{get_beijing_time()}] [PHASE 2] 开始为所有账户撤销测试订单")
@@ -0,0 +1,85 @@
+"""
+多账户并行执行
+各策略脚本对每个账户依次执行“查询未成交委托 → 撤单（含重试等待）→ 下单”，
+前一个账户的网络等待会直接推迟后一个账户的下单，5m 反转行情下就是数秒滑点。
+这里以线程池让各账户流程并发执行：
+- 账户之间相互隔离，单个账户异常只记录日志，不影响其他账户
+- 记录每个账户的开始偏移、总耗时，以及流程中 mark() 标记的时间点（如下单时刻），执行完输出对比
+"""
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from utils.okx_utils import get_shanghai_time
+
+MAX_WORKERS = int(os.environ.get("ACCOUNT_WORKERS", "0")) or None  # 默认每个账户一个线程
+
+# 当前线程正在执行的账户记录（供 mark 使用）
+_local = threading.local()
+
+
+def mark(label: str):
+    """在账户流程中标记时间点（相对整批开始的秒数），同一标记只记录第一次；不在 run_accounts 中调用时忽略"""
+    record = getattr(_local, "record", None)
+    if record is not None and label not in record['marks']:
+        record['marks'][label] = time.perf_counter() - record['batch_start']
+
+
+def run_accounts(accounts: Sequence[Any], worker: Callable[[Any], Any],
+                 name: Optional[Callable[[Any], str]] = None,
+                 max_workers: Optional[int] = MAX_WORKERS, tag: str = "ACCOUNTS") -> List[Dict]:
+    """
+    并发执行各账户流程
+    :param accounts: 账户列表（账户字典或账户后缀等，原样传给 worker）
+    :param worker: 单个账户的处理函数 worker(account)
+    :param name: 账户显示名称函数，默认 str(account)
+    :param max_workers: 最大线程数，1 表示按顺序执行
+    :return: 按 accounts 顺序的执行记录
+             [{'account', 'result', 'error', 'start_offset', 'elapsed', 'marks'}]
+    """
+    if not accounts:
+        return []
+    names = [name(a) if name else str(a) for a in accounts]
+    batch_start = time.perf_counter()
+
+    def _run(i: int) -> Dict:
+        record = {'account': names[i], 'result': None, 'error': None, 'marks': {},
+                  'batch_start': batch_start, 'start_offset': time.perf_counter() - batch_start}
+        _local.record = record
+        started = time.perf_counter()
+        try:
+            record['result'] = worker(accounts[i])
+        except Exception as e:
+            record['error'] = str(e)
+            print(f"[{get_shanghai_time()}] [{tag}] 账户 {names[i]} 处理异常: {e}")
+            print(traceback.format_exc())
+        finally:
+            _local.record = None
+        record['elapsed'] = time.perf_counter() - started
+        del record['batch_start']
+        return record
+
+    if max_workers == 1 or len(accounts) == 1:
+        records = [_run(i) for i in range(len(accounts))]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers or len(accounts), thread_name_prefix="account") as executor:
+            records = list(executor.map(_run, range(len(accounts))))
+    report_timing(records, tag)
+    return records
+
+
+def report_timing(records: List[Dict], tag: str = "ACCOUNTS"):
+    """输出各账户耗时与标记时间点，以及各账户同一标记之间的最大间隔"""
+    for record in records:
+        marks = ", ".join(f"{label} +{offset:.3f}s" for label, offset in record['marks'].items())
+        status = f"异常: {record['error']}" if record['error'] else "完成"
+        print(f"[{get_shanghai_time()}] [{tag}] 账户 {record['account']}: {status}, "
+              f"开始 +{record['start_offset']:.3f}s, 耗时 {record['elapsed']:.3f}s" + (f", {marks}" if marks else ""))
+    labels = {label for record in records for label in record['marks']}
+    for label in sorted(labels):
+        offsets = [record['marks'][label] for record in records if label in record['marks']]
+        if len(offsets) > 1:
+            print(f"[{get_shanghai_time()}] [{tag}] 各账户「{label}」时间差: {max(offsets) - min(offsets):.3f}s")
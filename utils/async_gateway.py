@@ -0,0 +1,273 @@
+"""
+异步下单网关
+各脚本每次运行都新建 okx.Trade.TradeAPI（同步请求，每个请求各自等待），多账户、多请求时连接建立与串行等待叠加。
+这里基于 httpx.AsyncClient（python-okx 的依赖，无需额外安装）：
+- 每个账户一个长连接池（keep-alive，安装 h2 时使用 HTTP/2 多路复用），可先 warm() 预建连接
+- 按 OKX v5 规则签名（OK-ACCESS-SIGN = Base64(HMAC-SHA256(时间戳 + 方法 + 路径 + 请求体))）
+- 下单 / 撤单 / 查询均为协程，互不依赖的请求用 asyncio.gather 并发发出
+- base_url 可指向本地模拟服务器，便于离线测试（python utils/async_gateway.py 对 utils/mock_exchange 自检）
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import base64
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+# 支持直接以脚本方式运行
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.okx_utils import OKX_DOMAIN, CANCEL_BATCH_LIMIT, get_env_var, get_shanghai_time, is_duplicate_clord
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# ========== 网关参数 ==========
+API_URL = OKX_DOMAIN
+TIMEOUT = 5.0  # 单个请求超时（秒）
+MAX_CONNECTIONS = 10  # 每个账户的最大连接数
+KEEPALIVE_EXPIRY = 60.0  # 空闲连接保留时间（秒）
+
+# 接口路径（与 okx.consts 一致）
+PLACE_ORDER = "/api/v5/trade/order"
+BATCH_ORDERS = "/api/v5/trade/batch-orders"
+CANCEL_ORDER = "/api/v5/trade/cancel-order"
+CANCEL_BATCH_ORDERS = "/api/v5/trade/cancel-batch-orders"
+AMEND_ORDER = "/api/v5/trade/amend-order"
+ORDER_INFO = "/api/v5/trade/order"
+ORDERS_PENDING = "/api/v5/trade/orders-pending"
+SERVER_TIME = "/api/v5/public/time"
+
+
+def okx_timestamp() -> str:
+    """OKX 签名时间戳（UTC ISO8601，毫秒）"""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def clean_params(params: Optional[Union[Dict, Sequence[Dict]]]) -> Union[Dict, List[Dict]]:
+    """去掉值为 None / 空字符串的参数；批量接口（batch-orders / cancel-batch-orders）的请求体为列表，逐项处理"""
+    if isinstance(params, (list, tuple)):
+        return [clean_params(item) for item in params]
+    return {k: v for k, v in (params or {}).items() if v is not None and v != ""}
+
+
+def sign(timestamp: str, method: str, path: str, body: str, secret_key: str) -> str:
+    message = f"{timestamp}{method.upper()}{path}{body}"
+    digest = hmac.new(secret_key.encode("utf-8"), message.encode("utf-8"), digestmod="sha256").digest()
+    return base64.b64encode(digest).decode()
+
+
+# ========== 1. 网关 ==========
+class AsyncOrderGateway:
+    """
+    单个账户的异步交易网关
+    用法:
+        async with AsyncOrderGateway.from_env("1") as gw:
+            await gw.warm()
+            result = await gw.place_order(**build_order_params(...))
+    """
+
+    def __init__(self, api_key: str, secret_key: str, passphrase: str, flag: str = "0",
+                 base_url: str = API_URL, name: str = "", timeout: float = TIMEOUT,
+                 max_connections: int = MAX_CONNECTIONS, http2: bool = HTTP2):
+        self.api_key = str(api_key)
+        self.secret_key = str(secret_key)
+        self.passphrase = str(passphrase)
+        self.flag = str(flag)
+        self.name = name or "默认账户"
+        self.client = httpx.AsyncClient(
+            base_url=base_url, timeout=timeout, http2=http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=KEEPALIVE_EXPIRY))
+        self.latencies: List[Tuple[str, float]] = []  # (路径, 毫秒)
+
+    @classmethod
+    def from_env(cls, suffix: str = "", **kwargs) -> "AsyncOrderGateway":
+        """按账户后缀读取 OKX_API_KEY{suffix} 等环境变量"""
+        return cls(get_env_var("OKX_API_KEY", suffix), get_env_var("OKX_SECRET_KEY", suffix),
+                   get_env_var("OKX_PASSPHRASE", suffix), get_env_var("OKX_FLAG", suffix, "0"),
+                   name=get_env_var("OKX_ACCOUNT_NAME", suffix, f"账户{suffix}" if suffix else "默认账户"),
+                   **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    # ---------- 请求 ----------
+    def _headers(self, method: str, path: str, body: str) -> Dict[str, str]:
+        timestamp = okx_timestamp()
+        return {
+            "Content-Type": "application/json",
+            "OK-ACCESS-KEY": self.api_key,
+            "OK-ACCESS-SIGN": sign(timestamp, method, path, body, self.secret_key),
+            "OK-ACCESS-TIMESTAMP": timestamp,
+            "OK-ACCESS-PASSPHRASE": self.passphrase,
+            "x-simulated-trading": self.flag,
+        }
+
+    async def request(self, method: str, path: str, params: Optional[Union[Dict, Sequence[Dict]]] = None) -> Dict:
+        """签名并发送请求，返回OKX响应JSON（HTTP错误时抛出 httpx.HTTPStatusError）；批量接口的 params 为列表"""
+        params = clean_params(params)
+        if method == "GET":
+            if params:
+                path = path + "?" + "&".join(f"{k}={v}" for k, v in params.items())
+            body = ""
+        else:
+            body = json.dumps(params)
+        started = time.perf_counter()
+        response = await self.client.request(method, path, content=body or None,
+                                             headers=self._headers(method, path, body))
+        self.latencies.append((path.split("?")[0], (time.perf_counter() - started) * 1000))
+        response.raise_for_status()
+        return response.json()
+
+    async def warm(self):
+        """预先建立连接（TLS握手在信号出现前完成），失败时忽略"""
+        try:
+            await self.client.get(SERVER_TIME)
+        except httpx.HTTPError:
+            pass
+
+    # ---------- 交易接口 ----------
+    async def place_order(self, **params) -> Dict:
+        return await self.request("POST", PLACE_ORDER, params)
+
+    async def place_hedged(self, copies: int = 2, **params) -> Dict:
+        """
+        同一委托（固定 clOrdId，见 deterministic_clord_id）在多个连接上同时提交，取最先成功的结果
+        其余请求会因重复 clOrdId（51016）被交易所拒绝，不会重复开仓
+        """
+        results = await gather_requests(*(self.place_order(**params) for _ in range(copies)))
+        for result in results:
+            if isinstance(result, dict) and result.get('code') == '0':
+                return result
+        for result in results:
+            if is_duplicate_clord(result if isinstance(result, dict) else None):
+                return await self.get_order(params['instId'], cl_ord_id=params['clOrdId'])
+        last = results[-1]
+        if isinstance(last, Exception):
+            raise last
+        return last
+
+    async def place_batch(self, orders: Sequence[Dict]) -> Dict:
+        return await self.request("POST", BATCH_ORDERS, list(orders))
+
+    async def cancel_order(self, inst_id: str, ord_id: Optional[str] = None, cl_ord_id: Optional[str] = None) -> Dict:
+        return await self.request("POST", CANCEL_ORDER, {"instId": inst_id, "ordId": ord_id, "clOrdId": cl_ord_id})
+
+    async def cancel_batch(self, orders: Sequence[Dict]) -> Dict:
+        """
+        orders: [{'instId', 'ordId' 或 'clOrdId'}]
+        超过 CANCEL_BATCH_LIMIT 时分块并发发出，合并为一个返回（各块 data 按顺序拼接，任一块失败时 code 为 '2'）
+        """
+        orders = list(orders)
+        if len(orders) <= CANCEL_BATCH_LIMIT:
+            return await self.request("POST", CANCEL_BATCH_ORDERS, orders)
+        chunks = [orders[i:i + CANCEL_BATCH_LIMIT] for i in range(0, len(orders), CANCEL_BATCH_LIMIT)]
+        results = await gather_requests(*(self.request("POST", CANCEL_BATCH_ORDERS, chunk) for chunk in chunks))
+        data = [item for r in results if isinstance(r, dict) for item in r.get('data') or []]
+        ok = all(isinstance(r, dict) and r.get('code') == '0' for r in results)
+        return {'code': '0' if ok else '2', 'msg': '', 'data': data}
+
+    async def amend_order(self, inst_id: str, ord_id: Optional[str] = None, cl_ord_id: Optional[str] = None,
+                          new_px: Optional[str] = None, new_sz: Optional[str] = None, **extra) -> Dict:
+        params = {"instId": inst_id, "ordId": ord_id, "clOrdId": cl_ord_id, "newPx": new_px, "newSz": new_sz}
+        params.update(extra)
+        return await self.request("POST", AMEND_ORDER, params)
+
+    async def get_order(self, inst_id: str, ord_id: Optional[str] = None, cl_ord_id: Optional[str] = None) -> Dict:
+        return await self.request("GET", ORDER_INFO, {"instId": inst_id, "ordId": ord_id, "clOrdId": cl_ord_id})
+
+    async def orders_pending(self, inst_id: Optional[str] = None, ord_type: Optional[str] = None) -> Dict:
+        return await self.request("GET", ORDERS_PENDING, {"instId": inst_id, "ordType": ord_type})
+
+
+# ========== 2. 多账户并发 ==========
+async def gather_requests(*coros, return_exceptions: bool = True) -> List:
+    """并发执行互不依赖的请求，结果与传入顺序一致（默认异常作为结果返回，不影响其他请求）"""
+    return list(await asyncio.gather(*coros, return_exceptions=return_exceptions))
+
+
+async def place_orders(jobs: Sequence[Tuple[AsyncOrderGateway, Dict]]) -> List:
+    """各账户同时下单：jobs 为 [(网关, build_order_params 的结果)]"""
+    return await gather_requests(*(gateway.place_order(**params) for gateway, params in jobs))
+
+
+def gateways_from_env(suffixes: Sequence[str], **kwargs) -> List[AsyncOrderGateway]:
+    """按账户后缀列表创建网关，跳过信息不完整的账户"""
+    gateways = []
+    for suffix in suffixes:
+        if all(get_env_var(key, suffix) for key in ("OKX_API_KEY", "OKX_SECRET_KEY", "OKX_PASSPHRASE")):
+            gateways.append(AsyncOrderGateway.from_env(suffix, **kwargs))
+    return gateways
+
+
+# ========== 3. 本地自检 ==========
+async def self_check(base_url: str, inst_id: str, price: float) -> List[str]:
+    """对本地模拟服务器依次调用网关的各个接口，返回不符合预期的项（全部通过时为空列表）"""
+    from utils.okx_utils import build_order_params
+
+    errors = []
+
+    def expect(label: str, ok: bool, result):
+        print(f"[{get_shanghai_time()}] [GATEWAY] {label}: {'OK' if ok else 'FAIL'} {'' if ok else result}")
+        if not ok:
+            errors.append(label)
+
+    def params(px: float) -> Dict:
+        return build_order_params(inst_id, "buy", round(px, 2), 1, "long", round(px * 1.01, 2), round(px * 0.99, 2), "GW")
+
+    async with AsyncOrderGateway("mock-key", "mock-secret", "mock-pass", "1", base_url=base_url) as gw:
+        await gw.warm()
+        first = params(price * 0.5)
+        result = await gw.place_order(**first)
+        expect("place_order", result.get('code') == '0', result)
+        ord_id = (result.get('data') or [{}])[0].get('ordId')
+        result = await gw.place_hedged(**first)
+        expect("place_hedged 重复 clOrdId 视为成功", result.get('code') == '0', result)
+        batch = [params(price * (0.4 + i * 0.001)) for i in range(20)]
+        result = await gw.place_batch(batch)
+        expect("place_batch", result.get('code') == '0' and len(result.get('data', [])) == 20, result)
+        result = await gw.amend_order(inst_id, ord_id=ord_id, new_px=str(round(price * 0.45, 2)))
+        expect("amend_order", result.get('code') == '0', result)
+        result = await gw.get_order(inst_id, ord_id=ord_id)
+        expect("get_order", result.get('code') == '0' and result['data'][0]['px'] == str(round(price * 0.45, 2)), result)
+        result = await gw.orders_pending(inst_id)
+        live = [o['ordId'] for o in result.get('data', [])]
+        expect("orders_pending", result.get('code') == '0' and len(live) == 21, result)
+        result = await gw.cancel_batch([{"instId": inst_id, "ordId": oid} for oid in live])
+        expect("cancel_batch 分块", result.get('code') == '0' and len(result.get('data', [])) == 21, result)
+        result = await gw.cancel_order(inst_id, ord_id=ord_id)
+        expect("cancel_order 已撤销", result.get('code') == '1', result)
+        latencies = [ms for _, ms in gw.latencies]
+        print(f"[{get_shanghai_time()}] [GATEWAY] {len(latencies)} 个请求, "
+              f"平均 {sum(latencies) / len(latencies):.2f}ms, 最大 {max(latencies):.2f}ms")
+    return errors
+
+
+def main():
+    """启动本地模拟交易所（utils/mock_exchange），对网关各接口自检"""
+    from utils.mock_exchange import MockExchange, MockServer, synthetic_candles
+
+    inst_id = "ETH-USDT-SWAP"
+    exchange = MockExchange({inst_id: synthetic_candles()})
+    with MockServer(exchange) as server:
+        errors = asyncio.run(self_check(server.url, inst_id, exchange.last_price(inst_id)))
+    print(f"[{get_shanghai_time()}] [GATEWAY] 自检{'失败: ' + ', '.join(errors) if errors else '通过'}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
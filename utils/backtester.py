@@ -0,0 +1,361 @@
+"""
+任务名称
+name: 策略增量回测报告
+定时规则
+cron: 30 0 * * *
+"""
+import os
+import sys
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles, is_confirmed
+from utils.feature_store import FeatureStore
+from utils.strategy_adapter import MultiStrategyEvaluator, StrategyAdapter, build_default_adapters
+from utils.subbar_resolver import NO_EXIT, SubBarResolver
+from utils.okx_utils import get_shanghai_time
+
+# ========== 回测参数 ==========
+CHECKPOINT_DIR = os.environ.get("BACKTEST_CHECKPOINT_DIR", "backtest_checkpoints")
+CHECKPOINT_VERSION = 1
+INITIAL_EQUITY = 1000.0  # 初始权益(USDT)
+MARGIN = 5               # 每单保证金(USDT)
+LEVERAGE = 10            # 杠杆倍数
+FEE_RATE = 0.0005        # 单边手续费率
+
+
+# ========== 1. 撮合与账本 ==========
+class BacktestBroker:
+    """
+    K线级撮合账本：限价开仓单 + 附带止盈止损（与 build_order_params 的 attachAlgoOrds 对应），
+    维护挂单、持仓、已平仓交易和权益曲线；多个标的可共用同一个账本
+    """
+
+    def __init__(self, initial_equity: float = INITIAL_EQUITY, margin: float = MARGIN,
+                 leverage: float = LEVERAGE, fee_rate: float = FEE_RATE,
+                 skip_if_pending: bool = True, cancel_when_tp_passed: bool = True,
+                 order_expire_bars: Optional[int] = None,
+                 ambiguity_resolver: Optional[Callable] = None):
+        self.margin = margin
+        self.leverage = leverage
+        self.fee_rate = fee_rate
+        self.skip_if_pending = skip_if_pending              # 同策略同标的存在未成交委托时跳过新信号
+        self.cancel_when_tp_passed = cancel_when_tp_passed  # 收盘价越过止盈价时撤销未成交委托
+        self.order_expire_bars = order_expire_bars
+        # 同一根K线同时触及止盈和止损时的判定函数: (inst_id, position, kline) -> 'tp'/'sl'/NO_EXIT（不平仓）/None
+        self.ambiguity_resolver = ambiguity_resolver
+        self.cash = initial_equity
+        self.pending_orders: List[Dict] = []
+        self.positions: List[Dict] = []
+        self.trades: List[Dict] = []
+        self.equity_curve: List[List] = []
+        self.last_prices: Dict[str, float] = {}
+        self.order_seq = 0
+        self.ambiguous_exits = 0  # 同一根K线同时触及止盈止损的次数
+        self.resolved_exits = 0   # 其中由 ambiguity_resolver 判定先后的次数
+
+    # ---------- 下单 ----------
+    def submit(self, signal: Dict) -> Optional[Dict]:
+        """提交信号对应的限价开仓单，下一根K线开始参与撮合"""
+        if self.skip_if_pending and any(
+                o['strategy'] == signal['strategy'] and o['inst_id'] == signal['inst_id']
+                for o in self.pending_orders):
+            return None
+        order = self._new_order(signal)
+        if order:
+            self.pending_orders.append(order)
+        return order
+
+    def _new_order(self, signal: Dict) -> Optional[Dict]:
+        """按信号构建限价开仓单（入场价非法时返回 None）"""
+        px = signal['entry_price']
+        if px <= 0:
+            return None
+        self.order_seq += 1
+        order = {
+            'id': self.order_seq,
+            'strategy': signal['strategy'],
+            'inst_id': signal['inst_id'],
+            'pos_side': signal['pos_side'],
+            'px': px,
+            'sz': self.margin * self.leverage / px,  # 以币计价的数量
+            'tp': signal['take_profit'],
+            'sl': signal['stop_loss'],
+            'created_ts': signal['timestamp'],
+            'bars': 0
+        }
+        return order
+
+    # ---------- 撮合 ----------
+    def _exit_reason(self, inst_id: str, position: Dict, kline) -> Optional[str]:
+        high, low = float(kline[2]), float(kline[3])
+        if position['pos_side'] == "long":
+            hit_tp, hit_sl = high >= position['tp'], low <= position['sl']
+        else:
+            hit_tp, hit_sl = low <= position['tp'], high >= position['sl']
+        if hit_tp and hit_sl:
+            self.ambiguous_exits += 1
+            position['ambiguous'] = True
+            reason = self.ambiguity_resolver(inst_id, position, kline) if self.ambiguity_resolver else None
+            if reason:
+                self.resolved_exits += 1
+            if reason == NO_EXIT:
+                return None
+            # 无法判定先后时按止损处理（保守）
+            return reason or "sl"
+        if hit_tp:
+            return "tp"
+        if hit_sl:
+            return "sl"
+        return None
+
+    def _close(self, position: Dict, exit_price: float, ts: int, reason: str):
+        direction = 1 if position['pos_side'] == "long" else -1
+        gross = (exit_price - position['entry_price']) * position['sz'] * direction
+        fee = (position['entry_price'] + exit_price) * position['sz'] * self.fee_rate
+        pnl = gross - fee
+        self.cash += pnl
+        trade = dict(position)
+        trade.update(exit_price=exit_price, exit_ts=ts, reason=reason, pnl=pnl, fee=fee)
+        self.trades.append(trade)
+
+    def _match(self, inst_id: str, kline, positions: List[Dict],
+               pending_orders: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """撮合一根K线：返回 (剩余持仓, 剩余挂单)，其他标的的持仓与挂单原样保留"""
+        ts = int(kline[0])
+        high, low, close = float(kline[2]), float(kline[3]), float(kline[4])
+
+        # 1. 已有持仓的止盈止损
+        remaining = []
+        for position in positions:
+            if position['inst_id'] != inst_id:
+                remaining.append(position)
+                continue
+            reason = self._exit_reason(inst_id, position, kline)
+            if reason:
+                self._close(position, position[reason], ts, reason)
+            else:
+                remaining.append(position)
+
+        # 2. 挂单成交 / 撤单 / 过期
+        still_pending = []
+        for order in pending_orders:
+            if order['inst_id'] != inst_id:
+                still_pending.append(order)
+                continue
+            order['bars'] += 1
+            is_long = order['pos_side'] == "long"
+            if (is_long and low <= order['px']) or (not is_long and high >= order['px']):
+                position = {
+                    'id': order['id'], 'strategy': order['strategy'], 'inst_id': inst_id,
+                    'pos_side': order['pos_side'], 'entry_price': order['px'], 'sz': order['sz'],
+                    'tp': order['tp'], 'sl': order['sl'], 'signal_ts': order['created_ts'], 'entry_ts': ts
+                }
+                # 成交当根K线内也可能触发止盈止损
+                reason = self._exit_reason(inst_id, position, kline)
+                if reason:
+                    self._close(position, position[reason], ts, reason)
+                else:
+                    remaining.append(position)
+                continue
+            if self.cancel_when_tp_passed and ((is_long and close >= order['tp']) or
+                                               (not is_long and close <= order['tp'])):
+                continue
+            if self.order_expire_bars and order['bars'] >= self.order_expire_bars:
+                continue
+            still_pending.append(order)
+        return remaining, still_pending
+
+    def on_bar(self, inst_id: str, kline) -> List[Dict]:
+        """用一根已完结K线推进该标的的挂单与持仓，返回本根K线平仓的交易"""
+        closed_before = len(self.trades)
+        self.positions, self.pending_orders = self._match(inst_id, kline, self.positions, self.pending_orders)
+
+        # 3. 权益
+        self.last_prices[inst_id] = float(kline[4])
+        self.equity_curve.append([int(kline[0]), self.equity()])
+        return self.trades[closed_before:]
+
+    def equity(self) -> float:
+        """按各标的最新收盘价计算的权益"""
+        unrealized = 0.0
+        for position in self.positions:
+            price = self.last_prices.get(position['inst_id'], position['entry_price'])
+            direction = 1 if position['pos_side'] == "long" else -1
+            unrealized += (price - position['entry_price']) * position['sz'] * direction
+        return self.cash + unrealized
+
+    # ---------- 状态 ----------
+    def get_state(self) -> Dict:
+        return {
+            'cash': self.cash,
+            'pending_orders': self.pending_orders,
+            'positions': self.positions,
+            'trades': self.trades,
+            'equity_curve': self.equity_curve,
+            'last_prices': self.last_prices,
+            'order_seq': self.order_seq,
+            'ambiguous_exits': self.ambiguous_exits,
+            'resolved_exits': self.resolved_exits
+        }
+
+    def set_state(self, state: Dict):
+        self.cash = state['cash']
+        self.pending_orders = state['pending_orders']
+        self.positions = state['positions']
+        self.trades = state['trades']
+        self.equity_curve = state['equity_curve']
+        self.last_prices = state['last_prices']
+        self.order_seq = state['order_seq']
+        self.ambiguous_exits = state.get('ambiguous_exits', 0)
+        self.resolved_exits = state.get('resolved_exits', 0)
+
+
+# ========== 2. 单标的回测（支持断点续跑） ==========
+class Backtester:
+    """
+    单标的回测：评估器产生信号，账本撮合。
+    全部状态（K线窗口、策略状态、挂单、持仓、权益曲线）可保存为检查点，
+    重跑时只处理检查点之后的新K线
+    """
+
+    def __init__(self, inst_id: str, bar: str, adapters: List[StrategyAdapter],
+                 broker: Optional[BacktestBroker] = None):
+        self.inst_id = inst_id
+        self.bar = bar
+        self.evaluator = MultiStrategyEvaluator(adapters)
+        self.broker = broker or BacktestBroker()
+        self.last_ts = 0
+        self.bars_processed = 0
+
+    def run(self, klines: List) -> int:
+        """按时间正序处理K线，已处理过的K线自动跳过；返回本次新处理的K线数"""
+        count = 0
+        for kline in klines:
+            ts = int(kline[0])
+            if ts <= self.last_ts or not is_confirmed(kline):
+                continue
+            # 先撮合已有委托，再用本根收盘K线生成新信号（新委托从下一根K线开始生效）
+            self.broker.on_bar(self.inst_id, kline)
+            for signal in self.evaluator.feed(kline):
+                self.broker.submit(signal)
+            self.last_ts = ts
+            count += 1
+        self.bars_processed += count
+        return count
+
+    def get_state(self) -> Dict:
+        return {
+            'version': CHECKPOINT_VERSION,
+            'inst_id': self.inst_id,
+            'bar': self.bar,
+            'strategies': [a.name for a in self.evaluator.adapters],
+            'last_ts': self.last_ts,
+            'bars_processed': self.bars_processed,
+            'evaluator': self.evaluator.get_state(),
+            'broker': self.broker.get_state()
+        }
+
+    def set_state(self, state: Dict):
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"检查点版本不兼容: {state.get('version')}")
+        if state['strategies'] != [a.name for a in self.evaluator.adapters]:
+            raise ValueError(f"检查点策略列表不一致: {state['strategies']}")
+        self.last_ts = state['last_ts']
+        self.bars_processed = state['bars_processed']
+        self.evaluator.set_state(state['evaluator'])
+        self.broker.set_state(state['broker'])
+
+    def save_checkpoint(self, path: str):
+        """原子写入检查点（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.get_state(), f)
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            self.set_state(json.load(f))
+        return True
+
+    def report(self) -> Dict:
+        """回测统计摘要"""
+        return summarize(self.broker)
+
+
+def summarize(broker: BacktestBroker) -> Dict:
+    """根据账本计算交易统计与最大回撤"""
+    trades = broker.trades
+    wins = [t for t in trades if t['pnl'] > 0]
+    peak, max_drawdown = None, 0.0
+    for _, equity in broker.equity_curve:
+        peak = equity if peak is None else max(peak, equity)
+        if peak > 0:
+            max_drawdown = max(max_drawdown, (peak - equity) / peak)
+    by_strategy = {}
+    for t in trades:
+        stat = by_strategy.setdefault(t['strategy'], {'trades': 0, 'wins': 0, 'pnl': 0.0})
+        stat['trades'] += 1
+        stat['wins'] += 1 if t['pnl'] > 0 else 0
+        stat['pnl'] += t['pnl']
+    return {
+        'trades': len(trades),
+        'win_rate': len(wins) / len(trades) if trades else 0.0,
+        'total_pnl': sum(t['pnl'] for t in trades),
+        'equity': broker.equity(),
+        'max_drawdown': max_drawdown,
+        'open_positions': len(broker.positions),
+        'pending_orders': len(broker.pending_orders),
+        'ambiguous_exits': broker.ambiguous_exits,
+        'resolved_exits': broker.resolved_exits,
+        'by_strategy': by_strategy
+    }
+
+
+# ========== 3. 增量回测入口 ==========
+def run_incremental(inst_id: str, bar: str, adapters: List[StrategyAdapter],
+                    checkpoint_path: Optional[str] = None, data_dir: str = DATA_DIR,
+                    broker: Optional[BacktestBroker] = None) -> Backtester:
+    """
+    从检查点继续回测：只从归档中读取检查点之后的K线，处理完成后更新检查点；
+    同时读取特征存储中的K线形态特征供无状态策略预筛
+    """
+    checkpoint_path = checkpoint_path or os.path.join(CHECKPOINT_DIR, f"{inst_id}_{bar}.json")
+    backtester = Backtester(inst_id, bar, adapters, broker)
+    resumed = backtester.load_checkpoint(checkpoint_path)
+    start_ts = backtester.last_ts + 1 if resumed else None
+    klines = load_candles(inst_id, bar, data_dir, start_ts=start_ts)
+    backtester.evaluator.set_features(FeatureStore(data_dir).load(inst_id, bar, start_ts=start_ts))
+    count = backtester.run(klines)
+    backtester.save_checkpoint(checkpoint_path)
+    print(f"[{get_shanghai_time()}] [BACKTEST] {inst_id}-{bar} {'续跑' if resumed else '全量'}处理 {count} 根K线, "
+          f"累计 {backtester.bars_processed} 根")
+    return backtester
+
+
+def main():
+    """对所有实盘策略按标的执行增量回测并输出报告"""
+    adapters = build_default_adapters()
+    groups = {}
+    for adapter in adapters:
+        groups.setdefault((adapter.inst_id, adapter.bar), []).append(adapter)
+    for (inst_id, bar), group in groups.items():
+        # 止盈止损同K线触发时按需加载1m K线判定先后
+        broker = BacktestBroker(ambiguity_resolver=SubBarResolver(bar))
+        backtester = run_incremental(inst_id, bar, group, broker=broker)
+        report = backtester.report()
+        print(f"[{get_shanghai_time()}] [REPORT] {inst_id}-{bar}: 交易 {report['trades']} 笔, "
+              f"胜率 {report['win_rate'] * 100:.2f}%, 总盈亏 {report['total_pnl']:.4f} USDT, "
+              f"权益 {report['equity']:.4f}, 最大回撤 {report['max_drawdown'] * 100:.2f}%, "
+              f"歧义K线 {report['ambiguous_exits']} 根(已细分判定 {report['resolved_exits']} 根)")
+        for name, stat in report['by_strategy'].items():
+            print(f"  - {name}: 交易 {stat['trades']} 笔, 盈利 {stat['wins']} 笔, 盈亏 {stat['pnl']:.4f} USDT")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+任务名称
+name: 止盈止损三重障碍标注
+定时规则
+cron: 0 4 * * 0
+三重障碍（止盈 / 止损 / 超时）标注：
+对每根K线假设以收盘价（或指定入场价）开多/开空，判断之后 horizon 根K线内先触及止盈、先触及止损还是超时。
+全程按列向量化：先用滑动窗口最大/最小值排除窗口内未触及任何障碍的K线，
+再对剩余K线分块求首次触及位置，不逐根K线循环。用于振幅阈值研究，无需跑完整回测。
+"""
+import os
+import sys
+from typing import Dict, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles, to_arrays
+from utils.okx_utils import get_shanghai_time
+
+# ========== 标注参数 ==========
+CHUNK_SIZE = 200000  # 每块K线数，控制 (块大小 x horizon) 布尔矩阵的内存
+DEFAULT_HORIZON = 48  # 默认超时K线数（5m x 48 = 4小时）
+
+# 各策略的止盈/止损比例（小数）
+PRESETS = {
+    'eth_reversal_v2': {'inst_id': "ETH-USDT-SWAP", 'take_profit': 0.014, 'stop_loss': 0.009},  # ETH_大振幅反转v2.py
+    'vine_k8': {'inst_id': "VINE-USDT-SWAP", 'take_profit': 0.02, 'stop_loss': 0.015},        # VINE-K8趋势策略.py
+}
+
+LABEL_TP = 1
+LABEL_SL = -1
+LABEL_TIMEOUT = 0
+
+
+# ========== 1. 向量化标注 ==========
+def barrier_labels(arrays: Dict[str, np.ndarray], take_profit: float, stop_loss: float,
+                   horizon: int = DEFAULT_HORIZON, direction: int = 1,
+                   entry: Optional[np.ndarray] = None, chunk_size: int = CHUNK_SIZE) -> Dict[str, np.ndarray]:
+    """
+    计算每根K线开仓后的障碍结果
+    :param take_profit / stop_loss: 止盈/止损比例（小数，如 0.014）
+    :param direction: 1 做多 / -1 做空
+    :param entry: 入场价数组，默认收盘价（于该K线收盘入场，从下一根K线开始判断）
+    :return: {
+        'label': 1 止盈 / -1 止损 / 0 超时,
+        'bars': 离场所用K线数（超时为窗口内可用K线数）,
+        'ret': 离场收益率（止盈为 +take_profit，止损为 -stop_loss，超时为窗口末收盘价收益率）,
+        'ambiguous': 同一根K线同时触及止盈止损（与 BacktestBroker 一致按止损计）,
+        'complete': 之后是否有完整 horizon 根K线
+    }
+    """
+    high, low, close = arrays['high'], arrays['low'], arrays['close']
+    n = len(close)
+    entry = close if entry is None else np.asarray(entry, dtype=np.float64)
+    if direction == 1:
+        tp_level, sl_level = entry * (1 + take_profit), entry * (1 - stop_loss)
+        tp_src, sl_src = high, low
+    else:
+        tp_level, sl_level = entry * (1 - take_profit), entry * (1 + stop_loss)
+        tp_src, sl_src = low, high
+
+    # 第 i 行为第 i+1 ~ i+horizon 根K线，末尾不足部分以 NaN 填充（NaN 比较恒为 False）
+    pad = np.full(horizon, np.nan)
+    tp_windows = sliding_window_view(np.r_[tp_src[1:], pad], horizon)
+    sl_windows = sliding_window_view(np.r_[sl_src[1:], pad], horizon)
+    available = np.minimum(horizon, n - 1 - np.arange(n))
+
+    first_tp = np.full(n, horizon, dtype=np.int64)
+    first_sl = np.full(n, horizon, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        for start in range(0, n, chunk_size):
+            stop = min(n, start + chunk_size)
+            tp_w, sl_w = tp_windows[start:stop], sl_windows[start:stop]
+            tp_lv, sl_lv = tp_level[start:stop, None], sl_level[start:stop, None]
+            # 窗口极值预筛：窗口内从未触及的K线无需定位
+            if direction == 1:
+                any_tp = np.fmax.reduce(tp_w, axis=1) >= tp_lv[:, 0]
+                any_sl = np.fmin.reduce(sl_w, axis=1) <= sl_lv[:, 0]
+            else:
+                any_tp = np.fmin.reduce(tp_w, axis=1) <= tp_lv[:, 0]
+                any_sl = np.fmax.reduce(sl_w, axis=1) >= sl_lv[:, 0]
+            for hit, windows, level, first, is_tp in ((any_tp, tp_w, tp_lv, first_tp, True),
+                                                      (any_sl, sl_w, sl_lv, first_sl, False)):
+                rows = np.flatnonzero(hit)
+                if not len(rows):
+                    continue
+                if (direction == 1) == is_tp:
+                    touched = windows[rows] >= level[rows]
+                else:
+                    touched = windows[rows] <= level[rows]
+                first[start + rows] = touched.argmax(axis=1)
+
+    ambiguous = (first_tp == first_sl) & (first_tp < horizon)
+    label = np.where(first_sl <= first_tp, LABEL_SL, LABEL_TP).astype(np.int8)
+    label[(first_tp == horizon) & (first_sl == horizon)] = LABEL_TIMEOUT
+    bars = np.where(label == LABEL_TIMEOUT, available, np.minimum(first_tp, first_sl) + 1)
+
+    last_close = close[np.arange(n) + available]
+    timeout_ret = direction * (last_close - entry) / entry
+    ret = np.where(label == LABEL_TP, take_profit, np.where(label == LABEL_SL, -stop_loss, timeout_ret))
+    return {
+        'label': label,
+        'bars': bars,
+        'ret': ret,
+        'ambiguous': ambiguous,
+        'complete': available == horizon,
+    }
+
+
+def label_stats(labels: Dict[str, np.ndarray], mask: Optional[np.ndarray] = None) -> Dict:
+    """统计（可按信号掩码筛选的）止盈/止损/超时比例与平均收益"""
+    keep = labels['complete'] if mask is None else (labels['complete'] & mask)
+    label, ret = labels['label'][keep], labels['ret'][keep]
+    count = int(keep.sum())
+    return {
+        'count': count,
+        'tp_rate': float((label == LABEL_TP).mean()) if count else 0.0,
+        'sl_rate': float((label == LABEL_SL).mean()) if count else 0.0,
+        'timeout_rate': float((label == LABEL_TIMEOUT).mean()) if count else 0.0,
+        'avg_ret': float(ret.mean()) if count else 0.0,
+        'ambiguous': int(labels['ambiguous'][keep].sum()),
+    }
+
+
+# ========== 2. 振幅阈值研究 ==========
+def amplitude_study(arrays: Dict[str, np.ndarray], take_profit: float, stop_loss: float,
+                    thresholds, horizon: int = DEFAULT_HORIZON,
+                    features: Optional[Dict[str, np.ndarray]] = None) -> Dict[float, Dict]:
+    """
+    大振幅反转思路：振幅超过阈值的阳线做空、阴线做多，
+    多空标注各计算一次，不同阈值只是不同的掩码
+    :param features: FeatureStore 读取的同区间特征列，提供时直接使用其中的 range_perc
+    """
+    long_labels = barrier_labels(arrays, take_profit, stop_loss, horizon, direction=1)
+    short_labels = barrier_labels(arrays, take_profit, stop_loss, horizon, direction=-1)
+    if features is not None:
+        range_perc = features['range_perc']
+    else:
+        range_perc = (arrays['high'] - arrays['low']) / arrays['low'] * 100
+    is_green = arrays['close'] > arrays['open']
+    is_red = arrays['close'] < arrays['open']
+    results = {}
+    for threshold in thresholds:
+        big = range_perc > threshold
+        results[threshold] = {
+            'long': label_stats(long_labels, big & is_red),
+            'short': label_stats(short_labels, big & is_green),
+        }
+    return results
+
+
+def main():
+    for name, preset in PRESETS.items():
+        arrays = to_arrays(load_candles(preset['inst_id'], "5m", DATA_DIR))
+        if not len(arrays['close']):
+            print(f"[{get_shanghai_time()}] [LABEL] {name}: 无归档K线，跳过")
+            continue
+        for direction, side in ((1, "做多"), (-1, "做空")):
+            labels = barrier_labels(arrays, preset['take_profit'], preset['stop_loss'], direction=direction)
+            stats = label_stats(labels)
+            print(f"[{get_shanghai_time()}] [LABEL] {name} {side}: 样本 {stats['count']}, "
+                  f"止盈 {stats['tp_rate'] * 100:.2f}%, 止损 {stats['sl_rate'] * 100:.2f}%, "
+                  f"超时 {stats['timeout_rate'] * 100:.2f}%, 平均收益 {stats['avg_ret'] * 100:.4f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+K线归档读取模块
+统一读取本地CSV归档（采集脚本输出的 swap_kline_data 目录以及 VINE-5M-DATA 这类轮换文件），
+输出按时间正序排列的OKX格式K线行，供回测与研究脚本一次性加载后复用。
+"""
+import os
+import csv
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 归档根目录，默认与采集脚本 utils/采集 K线数据.py 的 DATA_DIR 保持一致
+DATA_DIR = os.environ.get("OKX_KLINE_ARCHIVE", "swap_kline_data")
+
+# K线字段（OKX返回顺序）
+FIELDS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+
+# ========== 1. 文件定位 ==========
+def list_archive_files(inst_id: str, bar: str, data_dir: str = DATA_DIR) -> List[Tuple[int, int, str]]:
+    """
+    列出某标的某周期的归档文件
+    文件名格式: {symbol}_{bar}_{start_ts}_{end_ts}.csv 或 {instId}_{bar}_{start_ts}_{end_ts}.csv
+    :return: [(start_ts, end_ts, path)]，按起始时间排序
+    """
+    files = []
+    for path in glob(os.path.join(data_dir, inst_id, f"*_{bar}_*.csv")):
+        parts = os.path.basename(path)[:-4].split("_")
+        try:
+            start_ts, end_ts = int(parts[-2]), int(parts[-1])
+        except (IndexError, ValueError):
+            continue
+        if parts[-3] != bar:
+            continue
+        files.append((start_ts, end_ts, path))
+    return sorted(files)
+
+
+# ========== 2. CSV读取 ==========
+def load_kline_csv(filepath: str) -> List[List[str]]:
+    """读取单个K线CSV，自动跳过表头，返回原始行（字符串）"""
+    if not filepath or not os.path.exists(filepath):
+        return []
+    with open(filepath, "r", encoding="utf-8") as f:
+        rows = [row for row in csv.reader(f) if row]
+    if rows and not rows[0][0].isdigit():
+        rows = rows[1:]
+    return rows
+
+
+def is_confirmed(row) -> bool:
+    """K线是否已完结：最后一个字段为K线状态，'0'表示未完结"""
+    return str(row[-1]) != "0"
+
+
+def merge_klines(rows: List[List[str]], start_ts: Optional[int] = None,
+                 end_ts: Optional[int] = None) -> List[List[str]]:
+    """按时间戳去重、过滤未完结K线，并按时间正序返回"""
+    by_ts = {}
+    for row in rows:
+        if len(row) < 5 or not is_confirmed(row):
+            continue
+        ts = int(row[0])
+        if start_ts is not None and ts < start_ts:
+            continue
+        if end_ts is not None and ts > end_ts:
+            continue
+        by_ts[ts] = row
+    return [by_ts[ts] for ts in sorted(by_ts)]
+
+
+def load_candle_files(paths: List[str], start_ts: Optional[int] = None,
+                      end_ts: Optional[int] = None) -> List[List[str]]:
+    """读取并合并多个CSV文件（如 VINE-5M-DATA/VINE-5M-*.csv）"""
+    rows = []
+    for path in paths:
+        rows.extend(load_kline_csv(path))
+    return merge_klines(rows, start_ts, end_ts)
+
+
+def load_candles(inst_id: str, bar: str, data_dir: str = DATA_DIR,
+                 start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> List[List[str]]:
+    """
+    读取归档K线（时间正序、已去重、仅已完结K线）
+    只读取与 [start_ts, end_ts] 有交集的文件
+    """
+    paths = []
+    for f_start, f_end, path in list_archive_files(inst_id, bar, data_dir):
+        if start_ts is not None and f_end < start_ts:
+            continue
+        if end_ts is not None and f_start > end_ts:
+            continue
+        paths.append(path)
+    return load_candle_files(paths, start_ts, end_ts)
+
+
+# ========== 3. 转换为数组 ==========
+def to_arrays(rows: List[List[str]]) -> Dict[str, np.ndarray]:
+    """
+    将K线行转换为列数组
+    :return: {'timestamp': int64, 'open'/'high'/'low'/'close'/'volume': float64}
+             标记价格K线没有成交量字段，volume 以 NaN 填充
+    """
+    n = len(rows)
+    arrays = {"timestamp": np.empty(n, dtype=np.int64)}
+    for name in FIELDS[1:]:
+        arrays[name] = np.empty(n, dtype=np.float64)
+    for i, row in enumerate(rows):
+        arrays["timestamp"][i] = int(row[0])
+        arrays["open"][i] = float(row[1])
+        arrays["high"][i] = float(row[2])
+        arrays["low"][i] = float(row[3])
+        arrays["close"][i] = float(row[4])
+        # 9字段为普通K线（含成交量），6字段为标记价格K线
+        arrays["volume"][i] = float(row[5]) if len(row) >= 9 else np.nan
+    return arrays
@@ -0,0 +1,171 @@
+"""
+任务名称
+name: K线特征列增量物化
+定时规则
+cron: 20 0 * * *
+K线特征存储
+各策略在每根K线上重复计算同一批形态特征（实体振幅、总振幅、上下影线、前几根K线实体振幅之和）。
+这里按特征集（带版本号）对已完结K线计算一次，以 npz 存放在归档目录旁：
+    {data_dir}/{instId}/features/{bar}_{特征集}_v{版本}.npz
+读取时若归档中有更新的K线则只补算新增部分（惰性回填）；特征定义变更时提升版本号即全量重算。
+"""
+import os
+import sys
+from typing import Dict, Optional
+
+import numpy as np
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles, to_arrays
+from utils.subbar_resolver import BAR_MS
+from utils.okx_utils import get_shanghai_time
+
+
+# ========== 1. 特征定义 ==========
+def _prev_sum(x: np.ndarray, start: int, count: int) -> np.ndarray:
+    """
+    第 i 行为 x[i-start] + x[i-start-1] + ... 共 count 项（不足时为 NaN）
+    按与脚本循环相同的顺序逐项累加，增量补算与全量计算结果逐位一致
+    """
+    total = np.zeros(len(x))
+    for k in range(start, start + count):
+        shifted = np.full(len(x), np.nan)
+        shifted[k:] = x[:len(x) - k]
+        total = total + shifted
+    return total
+
+
+def compute_bar_shape(arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    K线形态特征（与各脚本中的计算方式一致）
+    - body_perc / range_perc: ethqa.analyze_kline 的实体振幅% / 总振幅%（ETH v1/v2 的 range_perc 同）
+    - body: 实体振幅比例，VINE K8 的 body0、K6 的 body1
+    - upper_wick / lower_wick: BollingerStrategy.generate_signal 的上/下影线（价格差）
+    - body_sum_prev4: ETH_K6.analyze_signal 的 K2~K5 实体振幅之和（当前K线为K1）
+    - body_sum_prev5: VINEK8Strategy.analyze_kline 的 K1~K5 实体振幅之和（当前K线为K0）
+    """
+    o, h, l, c = arrays['open'], arrays['high'], arrays['low'], arrays['close']
+    body = np.abs(c - o) / o
+    return {
+        'body_perc': np.abs(c - o) / o * 100,
+        'range_perc': (h - l) / l * 100,
+        'body': body,
+        'upper_wick': h - np.maximum(o, c),
+        'lower_wick': np.minimum(o, c) - l,
+        'body_sum_prev4': _prev_sum(body, 1, 4),
+        'body_sum_prev5': _prev_sum(body, 1, 5),
+    }
+
+
+# 特征集注册表：version 变更即视为新特征集；warmup 为计算最新一行所需的历史K线数
+FEATURE_SETS: Dict[str, Dict] = {
+    'bar_shape': {'version': 1, 'warmup': 5, 'compute': compute_bar_shape},
+}
+
+
+# ========== 2. 存储 ==========
+class FeatureStore:
+    """按 (标的, 周期, 特征集) 读写特征列，读取时自动补算归档中的新增K线"""
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+
+    def path(self, inst_id: str, bar: str, name: str) -> str:
+        version = FEATURE_SETS[name]['version']
+        return os.path.join(self.data_dir, inst_id, "features", f"{bar}_{name}_v{version}.npz")
+
+    def _read(self, path: str) -> Optional[Dict[str, np.ndarray]]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    def _write(self, path: str, columns: Dict[str, np.ndarray]):
+        """原子写入（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, path)
+
+    def backfill(self, inst_id: str, bar: str, name: str = "bar_shape") -> int:
+        """补算归档中尚未物化的K线，返回新增行数"""
+        spec = FEATURE_SETS[name]
+        path = self.path(inst_id, bar, name)
+        stored = self._read(path)
+        stored_ts = stored['timestamp'] if stored is not None else np.array([], dtype=np.int64)
+        last_ts = int(stored_ts[-1]) if len(stored_ts) else None
+        # 向前多读 warmup 根K线（按行而不是按时间，归档有缺口时也与全量计算一致）
+        start_ts = int(stored_ts[-spec['warmup']]) if len(stored_ts) >= spec['warmup'] else None
+        arrays = to_arrays(load_candles(inst_id, bar, self.data_dir, start_ts=start_ts))
+        keep = arrays['timestamp'] > last_ts if last_ts is not None else np.ones(len(arrays['timestamp']), bool)
+        if not keep.any():
+            return 0
+        columns = {'timestamp': arrays['timestamp']}
+        columns.update(spec['compute'](arrays))
+        columns = {key: value[keep] for key, value in columns.items()}
+        if stored is not None:
+            columns = {key: np.concatenate([stored[key], columns[key]]) for key in columns}
+        self._write(path, columns)
+        return int(keep.sum())
+
+    def load(self, inst_id: str, bar: str, name: str = "bar_shape", start_ts: Optional[int] = None,
+             end_ts: Optional[int] = None, backfill: bool = True) -> Dict[str, np.ndarray]:
+        """读取特征列（时间正序），可按时间范围截取"""
+        if backfill:
+            self.backfill(inst_id, bar, name)
+        columns = self._read(self.path(inst_id, bar, name))
+        if columns is None:
+            return {}
+        ts = columns['timestamp']
+        lo = 0 if start_ts is None else np.searchsorted(ts, start_ts, side="left")
+        hi = len(ts) if end_ts is None else np.searchsorted(ts, end_ts, side="right")
+        return {key: value[lo:hi] for key, value in columns.items()}
+
+    def load_aligned(self, inst_id: str, bar: str, arrays: Dict[str, np.ndarray],
+                     name: str = "bar_shape") -> Dict[str, np.ndarray]:
+        """
+        读取与 arrays（to_arrays 的结果）逐行对应的特征列：先补算，再按 arrays 的时间范围截取；
+        特征存储只追加，归档文件轮换或存储落后时两者行可能对不上，此时直接由 arrays 计算
+        """
+        ts = arrays['timestamp']
+        if not len(ts):
+            return {'timestamp': ts}
+        columns = self.load(inst_id, bar, name, start_ts=int(ts[0]), end_ts=int(ts[-1]))
+        if columns and np.array_equal(columns['timestamp'], ts):
+            return columns
+        print(f"[{get_shanghai_time()}] [FEATURE] {inst_id}-{bar} {name}: 特征存储与归档K线不一致，按归档重新计算")
+        columns = {'timestamp': ts}
+        columns.update(FEATURE_SETS[name]['compute'](arrays))
+        return columns
+
+    def latest(self, inst_id: str, bar: str, name: str = "bar_shape") -> Optional[Dict[str, float]]:
+        """最新一根已物化K线的特征"""
+        columns = self.load(inst_id, bar, name)
+        if not columns or not len(columns['timestamp']):
+            return None
+        return {key: value[-1].item() for key, value in columns.items()}
+
+
+def main():
+    """对采集脚本归档的全部标的/周期补算特征"""
+    store = FeatureStore()
+    if not os.path.isdir(store.data_dir):
+        print(f"[{get_shanghai_time()}] [FEATURE] 归档目录不存在: {store.data_dir}")
+        return
+    for inst_id in sorted(os.listdir(store.data_dir)):
+        inst_dir = os.path.join(store.data_dir, inst_id)
+        if not os.path.isdir(inst_dir):
+            continue
+        bars = sorted({f.split("_")[-3] for f in os.listdir(inst_dir) if f.endswith(".csv") and f.count("_") >= 3})
+        for bar in bars:
+            if bar not in BAR_MS:
+                continue
+            for name in FEATURE_SETS:
+                added = store.backfill(inst_id, bar, name)
+                print(f"[{get_shanghai_time()}] [FEATURE] {inst_id}-{bar} {name}: 新增 {added} 行")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+合约规格缓存
+各脚本分别写死合约面值与精度（ETH 脚本 CONTRACT_FACE_VALUE = 0.01 再乘 10、VINE 面值 10、
+DOGE 最小单位 0.01 / 价格 5 位小数），与交易所不一致时下单被拒，浪费一次往返并错过入场。
+这里从公共接口 /api/v5/public/instruments 一次获取全部永续合约的 ctVal / lotSz / tickSz / minSz：
+- 缓存到本地 JSON（默认与K线归档同目录），TTL 内不再请求；请求失败时使用过期缓存
+  （OKX_DOMAIN 指向模拟交易所等非实盘地址时使用单独的缓存文件，不覆盖实盘规格）
+- 数量 / 价格按 lotSz / tickSz 取整，标量与 numpy 数组均可（数组为向量化计算）
+- build_order_params 只读取已加载的规格（不触发网络请求），脚本可在取K线前调用 warm() 预加载
+"""
+import os
+import re
+import json
+import math
+import time
+import threading
+from decimal import Decimal
+from typing import Dict, Optional, Sequence, Union
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+
+from utils.retry_policy import get_policy, okx_success
+
+# ========== 缓存参数 ==========
+DEFAULT_DOMAIN = "https://www.okx.com"
+INSTRUMENTS_PATH = "/api/v5/public/instruments"
+INST_TYPE = "SWAP"
+CACHE_DIR = os.environ.get("OKX_KLINE_ARCHIVE", "swap_kline_data")  # 与 candle_archive.DATA_DIR 一致
+CACHE_TTL = float(os.environ.get("OKX_INSTRUMENT_TTL", str(24 * 3600)))  # 缓存有效期（秒）
+REQUEST_TIMEOUT = 10
+
+Number = Union[float, np.ndarray]
+
+
+def _decimals(step: str) -> int:
+    """步长字符串的小数位数，如 '0.001' -> 3，'1' -> 0"""
+    return max(-Decimal(step).normalize().as_tuple().exponent, 0)
+
+
+def quantize(values: Number, step: float, decimals: int, mode: str = "nearest") -> Number:
+    """
+    取整到 step 的整数倍
+    :param mode: 'nearest' 四舍五入 / 'down' 向下 / 'up' 向上
+    """
+    if isinstance(values, np.ndarray):
+        n = values / step
+        if mode == "down":
+            n = np.floor(n + 1e-9)
+        elif mode == "up":
+            n = np.ceil(n - 1e-9)
+        else:
+            n = np.round(n)
+        return np.round(n * step, decimals)
+    n = values / step
+    if mode == "down":
+        n = math.floor(n + 1e-9)
+    elif mode == "up":
+        n = math.ceil(n - 1e-9)
+    else:
+        n = round(n)
+    return round(n * step, decimals)
+
+
+def okx_domain() -> str:
+    """当前接口地址：okx_utils 加载 .env_dev 之后才确定，因此在请求时读取而不是导入时"""
+    from utils.okx_utils import OKX_DOMAIN
+    return OKX_DOMAIN
+
+
+def default_cache_path(inst_type: str, domain: str) -> str:
+    """实盘地址使用 instruments_{类型}.json，其他地址按主机名与端口区分"""
+    if domain.rstrip("/") == DEFAULT_DOMAIN:
+        return os.path.join(CACHE_DIR, f"instruments_{inst_type}.json")
+    host = re.sub(r"[^0-9A-Za-z]+", "_", urlsplit(domain).netloc or domain).strip("_")
+    return os.path.join(CACHE_DIR, f"instruments_{inst_type}_{host}.json")
+
+
+# ========== 1. 合约规格 ==========
+class InstrumentSpec:
+    """单个合约的规格与取整方法"""
+
+    __slots__ = ('inst_id', 'ct_val', 'lot_sz', 'min_sz', 'tick_sz', 'size_decimals', 'price_decimals')
+
+    def __init__(self, inst_id: str, ct_val: str, lot_sz: str, min_sz: str, tick_sz: str):
+        self.inst_id = inst_id
+        self.ct_val = float(ct_val)
+        self.lot_sz = float(lot_sz)
+        self.min_sz = float(min_sz)
+        self.tick_sz = float(tick_sz)
+        self.size_decimals = _decimals(lot_sz)
+        self.price_decimals = _decimals(tick_sz)
+
+    @classmethod
+    def from_okx(cls, item: Dict) -> "InstrumentSpec":
+        return cls(item['instId'], item['ctVal'], item['lotSz'], item['minSz'], item['tickSz'])
+
+    def round_price(self, price: Number, mode: str = "nearest") -> Number:
+        return quantize(price, self.tick_sz, self.price_decimals, mode)
+
+    def round_size(self, size: Number, mode: str = "nearest") -> Number:
+        """按 lotSz 取整，小于 minSz 的记为 0"""
+        size = quantize(size, self.lot_sz, self.size_decimals, mode)
+        if isinstance(size, np.ndarray):
+            return np.where(size >= self.min_sz, size, 0.0)
+        return size if size >= self.min_sz else 0.0
+
+    def contracts(self, notional: Number, price: Number, mode: str = "down") -> Number:
+        """名义价值（USDT）对应的合约张数：notional / (price x ctVal)，按 lotSz 取整"""
+        return self.round_size(notional / (price * self.ct_val), mode)
+
+    def format_price(self, price: float) -> str:
+        return f"{self.round_price(price):.{self.price_decimals}f}"
+
+    def format_size(self, size: float) -> str:
+        return f"{quantize(size, self.lot_sz, self.size_decimals):.{self.size_decimals}f}"
+
+
+# ========== 2. 规格缓存 ==========
+class InstrumentRegistry:
+    """全部永续合约的规格（内存 + 本地文件缓存，线程安全）"""
+
+    def __init__(self, cache_path: Optional[str] = None, ttl: float = CACHE_TTL, inst_type: str = INST_TYPE):
+        self._cache_path = cache_path  # None 时按当前接口地址决定（见 default_cache_path）
+        self.ttl = ttl
+        self.inst_type = inst_type
+        self.specs: Dict[str, InstrumentSpec] = {}
+        self.loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def cache_path(self) -> str:
+        return self._cache_path or default_cache_path(self.inst_type, okx_domain())
+
+    def _read_cache(self) -> Optional[Dict]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, items: Sequence[Dict]):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = self.cache_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({'fetched_at': time.time(), 'data': list(items)}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _fetch(self) -> Optional[list]:
+        result = get_policy('okx_query').call(
+            lambda: requests.get(okx_domain().rstrip("/") + INSTRUMENTS_PATH, params={'instType': self.inst_type},
+                                 timeout=REQUEST_TIMEOUT).json(),
+            label="[INSTRUMENTS]")
+        return result['data'] if okx_success(result) else None
+
+    def _set(self, items: Sequence[Dict], fetched_at: float):
+        specs = {}
+        for item in items:
+            try:
+                specs[item['instId']] = InstrumentSpec.from_okx(item)
+            except (KeyError, ValueError, ArithmeticError):
+                continue
+        self.specs, self.loaded_at = specs, fetched_at
+
+    def load(self, force: bool = False) -> bool:
+        """
+        加载规格：内存 / 文件缓存未过期时直接使用，否则请求接口并写入缓存；请求失败时退回过期缓存
+        :return: 是否有可用规格
+        """
+        with self._lock:
+            now = time.time()
+            if not force and self.specs and now - self.loaded_at < self.ttl:
+                return True
+            cached = self._read_cache()
+            if not force and cached and now - cached.get('fetched_at', 0) < self.ttl:
+                self._set(cached['data'], cached['fetched_at'])
+                return bool(self.specs)
+            items = self._fetch()
+            if items:
+                self._set(items, now)
+                try:
+                    self._write_cache(items)
+                except OSError as e:
+                    print(f"[instruments] 写入缓存失败: {e}")
+            else:
+                if cached and not self.specs:
+                    print(f"[instruments] 获取合约规格失败，使用过期缓存 {self.cache_path}")
+                    self._set(cached['data'], cached['fetched_at'])
+                if self.specs:
+                    # 本进程内继续使用过期规格，不再每次调用都重新请求
+                    self.loaded_at = now
+            return bool(self.specs)
+
+    def get(self, inst_id: str) -> Optional[InstrumentSpec]:
+        """获取规格（必要时加载），无法获取时返回 None"""
+        spec = self.specs.get(inst_id)
+        if spec is None or time.time() - self.loaded_at >= self.ttl:
+            self.load()
+            spec = self.specs.get(inst_id)
+        return spec
+
+    def cached(self, inst_id: str) -> Optional[InstrumentSpec]:
+        """只读取已加载的规格，不做任何 IO（下单关键路径使用）"""
+        return self.specs.get(inst_id)
+
+    def warm(self, inst_ids: Sequence[str] = ()) -> bool:
+        """预加载，返回 inst_ids 是否都有规格"""
+        self.load()
+        return all(inst_id in self.specs for inst_id in inst_ids)
+
+
+# 进程内共享的默认实例
+INSTRUMENTS = InstrumentRegistry()
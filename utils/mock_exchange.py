@@ -0,0 +1,546 @@
+"""
+本地 OKX 模拟交易所
+无法在实盘上做下单链路的压测与延迟测试，这里用 http.server 在本地模拟脚本用到的 REST 接口：
+- 行情: candles / mark-price-candles / ticker / public/instruments / public/time
+- 交易: order（下单、查询）/ batch-orders / cancel-order / cancel-batch-orders / amend-order / orders-pending
+- 账户: account/balance / account/positions
+内存撮合：按归档K线回放，每收盘一根K线，限价单按该K线最高 / 最低价成交，成交后附带的止盈止损
+（attachAlgoOrds）从下一根K线开始按触发价平仓（同一根K线同时触及时按止损处理）。
+按接口模拟限频（HTTP 429 + 50011），重复 clOrdId 返回 51016。
+脚本设置环境变量 OKX_DOMAIN=http://127.0.0.1:8765 即指向本服务（见 okx_utils.OKX_DOMAIN）。
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+# 支持直接以脚本方式运行
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles
+from utils.okx_utils import get_shanghai_time
+
+# ========== 模拟参数 ==========
+DEFAULT_PORT = int(os.environ.get("MOCK_PORT", "8765"))
+BAR = "5m"
+BAR_MS = 300000
+START_BALANCE = 10000.0  # 初始 USDT 权益
+DEFAULT_SPEC = {'ctVal': '0.1', 'lotSz': '0.01', 'minSz': '0.01', 'tickSz': '0.01'}
+SPECS = {
+    'ETH-USDT-SWAP': {'ctVal': '0.1', 'lotSz': '0.01', 'minSz': '0.01', 'tickSz': '0.01'},
+    'BTC-USDT-SWAP': {'ctVal': '0.01', 'lotSz': '0.01', 'minSz': '0.01', 'tickSz': '0.1'},
+    'DOGE-USDT-SWAP': {'ctVal': '1000', 'lotSz': '0.01', 'minSz': '0.01', 'tickSz': '0.00001'},
+    'VINE-USDT-SWAP': {'ctVal': '10', 'lotSz': '1', 'minSz': '1', 'tickSz': '0.0001'},
+}
+
+# 限频：(请求方法, 路径) -> (次数, 秒)，按 API Key（无签名时按客户端地址）分别计数
+RATE_LIMITS = {
+    ('POST', '/api/v5/trade/order'): (60, 2),
+    ('POST', '/api/v5/trade/batch-orders'): (300, 2),
+    ('POST', '/api/v5/trade/cancel-order'): (60, 2),
+    ('POST', '/api/v5/trade/cancel-batch-orders'): (300, 2),
+    ('POST', '/api/v5/trade/amend-order'): (60, 2),
+    ('GET', '/api/v5/trade/order'): (60, 2),
+    ('GET', '/api/v5/trade/orders-pending'): (60, 2),
+    ('GET', '/api/v5/market/candles'): (40, 2),
+    ('GET', '/api/v5/market/mark-price-candles'): (20, 2),
+    ('GET', '/api/v5/market/ticker'): (20, 2),
+    ('GET', '/api/v5/account/balance'): (10, 2),
+    ('GET', '/api/v5/account/positions'): (10, 2),
+}
+
+# 错误码（与 OKX 一致）
+RATE_LIMITED = "50011"
+PARAM_ERROR = "51000"
+DUPLICATE_CLORD = "51016"
+LOT_SIZE_ERROR = "51121"
+CANCEL_FAILED = "51400"
+AMEND_FAILED = "51503"
+ORDER_NOT_EXIST = "51603"
+
+
+def _fmt(x: float) -> str:
+    return f"{x:.10g}"
+
+
+# ========== 1. 限频 ==========
+class RateLimiter:
+    """滑动窗口限频"""
+
+    def __init__(self, limits: Dict[Tuple[str, str], Tuple[int, float]] = RATE_LIMITS):
+        self.limits = limits
+        self.calls: Dict[Tuple, deque] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, client: str, method: str, path: str) -> bool:
+        limit = self.limits.get((method, path))
+        if limit is None:
+            return True
+        count, seconds = limit
+        now = time.monotonic()
+        with self._lock:
+            calls = self.calls.setdefault((client, method, path), deque())
+            while calls and now - calls[0] >= seconds:
+                calls.popleft()
+            if len(calls) >= count:
+                return False
+            calls.append(now)
+            return True
+
+
+# ========== 2. 撮合引擎 ==========
+class MockExchange:
+    """
+    K线回放撮合引擎（线程安全）
+    cursor 指向正在形成的K线：行情接口只返回其开盘价（OHLC 均为开盘价），advance() 时该K线收盘并撮合
+    """
+
+    def __init__(self, candles: Dict[str, List[List[str]]], start: int = 300,
+                 specs: Optional[Dict[str, Dict]] = None, balance: float = START_BALANCE):
+        """
+        :param candles: {instId: 时间正序的K线行（candle_archive.load_candles 格式）}
+        :param start: 初始 cursor（之前的K线作为历史行情返回）
+        """
+        self.candles = {inst: rows for inst, rows in candles.items() if rows}
+        self.arrays = {inst: np.array([[float(v) for v in row[:5]] for row in rows])
+                       for inst, rows in self.candles.items()}
+        self.cursor = {inst: min(start, len(rows) - 1) for inst, rows in self.candles.items()}
+        self.specs = {inst: dict((specs or SPECS).get(inst, DEFAULT_SPEC)) for inst in self.candles}
+        self.orders: Dict[str, Dict] = {}
+        self.cl_index: Dict[str, str] = {}
+        self.algos: List[Dict] = []  # 生效中的止盈止损：{instId, posSide, sz, tp, sl, active_from}
+        self.positions: Dict[Tuple[str, str], Dict] = {}
+        self.cash = balance
+        self.fills: List[Dict] = []
+        self.next_id = 1
+        self.lock = threading.RLock()
+
+    # ---------- 行情 ----------
+    def current_ts(self, inst_id: str) -> int:
+        return int(self.candles[inst_id][self.cursor[inst_id]][0])
+
+    def last_price(self, inst_id: str) -> float:
+        return float(self.arrays[inst_id][self.cursor[inst_id], 1])
+
+    def candle_rows(self, inst_id: str, limit: int = 100, after: Optional[int] = None,
+                    mark: bool = False) -> List[List[str]]:
+        """最新在前；第一根为正在形成的K线（confirm=0）"""
+        rows = self.candles[inst_id]
+        end = self.cursor[inst_id]
+        if after is not None:
+            ts = self.arrays[inst_id][:, 0]
+            end = min(end, int(np.searchsorted(ts, after, side="left")) - 1)
+        out = []
+        for i in range(end, max(end - limit, -1), -1):
+            row = rows[i]
+            if i == self.cursor[inst_id]:
+                o = row[1]
+                row = [row[0], o, o, o, o, "0", "0", "0", "0"]
+            else:
+                row = list(row[:8]) + ["1"]
+            out.append([row[0], row[1], row[2], row[3], row[4], row[8]] if mark else row)
+        return out
+
+    # ---------- 下单 ----------
+    def _new_id(self) -> str:
+        self.next_id += 1
+        return str(600000000000000000 + self.next_id)
+
+    def _check_order(self, params: Dict) -> Optional[Tuple[str, str]]:
+        inst_id = params.get('instId')
+        if inst_id not in self.candles:
+            return PARAM_ERROR, "Parameter instId error"
+        if params.get('side') not in ('buy', 'sell') or params.get('ordType') not in ('limit', 'market', 'post_only'):
+            return PARAM_ERROR, "Parameter side or ordType error"
+        spec = self.specs[inst_id]
+        try:
+            sz = float(params.get('sz'))
+            px = float(params['px']) if params.get('ordType') != 'market' else 0.0
+        except (TypeError, ValueError, KeyError):
+            return PARAM_ERROR, "Parameter sz or px error"
+        lot, min_sz = float(spec['lotSz']), float(spec['minSz'])
+        if sz < min_sz or abs(sz / lot - round(sz / lot)) > 1e-6:
+            return LOT_SIZE_ERROR, "Order quantity must be a multiple of the lot size"
+        tick = float(spec['tickSz'])
+        if params.get('ordType') != 'market' and (px <= 0 or abs(px / tick - round(px / tick)) > 1e-6):
+            return PARAM_ERROR, "Parameter px error"
+        cl_ord_id = params.get('clOrdId')
+        if cl_ord_id and cl_ord_id in self.cl_index:
+            return DUPLICATE_CLORD, "Duplicated clOrdId"
+        return None
+
+    def place(self, params: Dict) -> Dict:
+        """单个下单，返回 data 项（sCode / sMsg）"""
+        with self.lock:
+            error = self._check_order(params)
+            cl_ord_id = params.get('clOrdId', '')
+            if error:
+                return {'ordId': '', 'clOrdId': cl_ord_id, 'tag': '', 'sCode': error[0], 'sMsg': error[1]}
+            inst_id = params['instId']
+            ord_id = self._new_id()
+            now = str(int(time.time() * 1000))
+            order = {
+                'instId': inst_id, 'ordId': ord_id, 'clOrdId': cl_ord_id, 'tag': params.get('tag', ''),
+                'side': params['side'], 'posSide': params.get('posSide', 'net'), 'ordType': params['ordType'],
+                'tdMode': params.get('tdMode', 'cross'), 'px': params.get('px', ''), 'sz': str(params['sz']),
+                'accFillSz': '0', 'fillPx': '', 'avgPx': '', 'state': 'live', 'cTime': now, 'uTime': now,
+                'attachAlgoOrds': [dict(algo, attachAlgoId=self._new_id()) for algo in params.get('attachAlgoOrds') or []],
+            }
+            self.orders[ord_id] = order
+            if cl_ord_id:
+                self.cl_index[cl_ord_id] = ord_id
+            if order['ordType'] == 'market':
+                self._fill(order, self.last_price(inst_id), self.cursor[inst_id])
+            return {'ordId': ord_id, 'clOrdId': cl_ord_id, 'tag': order['tag'], 'sCode': '0', 'sMsg': 'Order placed'}
+
+    def find(self, ord_id: Optional[str] = None, cl_ord_id: Optional[str] = None) -> Optional[Dict]:
+        if not ord_id and cl_ord_id:
+            ord_id = self.cl_index.get(cl_ord_id)
+        return self.orders.get(ord_id) if ord_id else None
+
+    def cancel(self, params: Dict) -> Dict:
+        with self.lock:
+            order = self.find(params.get('ordId'), params.get('clOrdId'))
+            if order is None or order['state'] != 'live':
+                return {'ordId': params.get('ordId', ''), 'clOrdId': params.get('clOrdId', ''),
+                        'sCode': CANCEL_FAILED, 'sMsg': "Cancellation failed as the order has been filled, canceled or does not exist"}
+            order['state'] = 'canceled'
+            order['uTime'] = str(int(time.time() * 1000))
+            return {'ordId': order['ordId'], 'clOrdId': order['clOrdId'], 'sCode': '0', 'sMsg': ''}
+
+    def amend(self, params: Dict) -> Dict:
+        with self.lock:
+            order = self.find(params.get('ordId'), params.get('clOrdId'))
+            if order is None or order['state'] != 'live':
+                return {'ordId': params.get('ordId', ''), 'clOrdId': params.get('clOrdId', ''), 'reqId': params.get('reqId', ''),
+                        'sCode': AMEND_FAILED, 'sMsg': "Order modification failed as the order does not exist"}
+            changed = dict(order, px=params.get('newPx') or order['px'], sz=params.get('newSz') or order['sz'],
+                           clOrdId='')
+            error = self._check_order(changed)
+            if error:
+                if str(params.get('cxlOnFail')).lower() == 'true':
+                    order['state'] = 'canceled'
+                return {'ordId': order['ordId'], 'clOrdId': order['clOrdId'], 'reqId': params.get('reqId', ''),
+                        'sCode': error[0], 'sMsg': error[1]}
+            order['px'], order['sz'] = changed['px'], changed['sz']
+            for new in params.get('attachAlgoOrds') or []:
+                for algo in order['attachAlgoOrds']:
+                    if new.get('attachAlgoId') in (None, algo.get('attachAlgoId')) and \
+                            new.get('attachAlgoClOrdId') in (None, algo.get('attachAlgoClOrdId')):
+                        for key, value in new.items():
+                            if key.startswith('new'):
+                                algo[key[3].lower() + key[4:]] = value
+            order['uTime'] = str(int(time.time() * 1000))
+            return {'ordId': order['ordId'], 'clOrdId': order['clOrdId'], 'reqId': params.get('reqId', ''),
+                    'sCode': '0', 'sMsg': ''}
+
+    # ---------- 撮合 ----------
+    def _fill(self, order: Dict, price: float, bar_index: int):
+        inst_id, pos_side, sz = order['instId'], order['posSide'], float(order['sz'])
+        order.update(state='filled', accFillSz=order['sz'], fillPx=_fmt(price), avgPx=_fmt(price),
+                     uTime=str(int(time.time() * 1000)))
+        opening = (order['side'] == 'buy') == (pos_side != 'short')
+        if opening:
+            pos = self.positions.setdefault((inst_id, pos_side), {'pos': 0.0, 'avgPx': 0.0})
+            pos['avgPx'] = (pos['avgPx'] * pos['pos'] + price * sz) / (pos['pos'] + sz)
+            pos['pos'] += sz
+            for algo in order['attachAlgoOrds']:
+                self.algos.append({'instId': inst_id, 'posSide': pos_side, 'sz': sz, 'active_from': bar_index + 1,
+                                   'tp': float(algo['tpTriggerPx']) if algo.get('tpTriggerPx') else None,
+                                   'sl': float(algo['slTriggerPx']) if algo.get('slTriggerPx') else None})
+        else:
+            self._close(inst_id, pos_side, sz, price)
+        self.fills.append({'ordId': order['ordId'], 'instId': inst_id, 'side': order['side'], 'posSide': pos_side,
+                           'sz': sz, 'px': price, 'ts': self.current_ts(inst_id)})
+
+    def _close(self, inst_id: str, pos_side: str, sz: float, price: float):
+        pos = self.positions.get((inst_id, pos_side))
+        if not pos or pos['pos'] <= 0:
+            return
+        sz = min(sz, pos['pos'])
+        direction = 1 if pos_side == 'long' else -1
+        self.cash += (price - pos['avgPx']) * sz * direction * float(self.specs[inst_id]['ctVal'])
+        pos['pos'] -= sz
+        if pos['pos'] <= 1e-12:
+            del self.positions[(inst_id, pos_side)]
+
+    def _close_bar(self, inst_id: str, i: int):
+        ts, o, h, l, c = self.arrays[inst_id][i]
+        for order in list(self.orders.values()):
+            if order['instId'] != inst_id or order['state'] != 'live':
+                continue
+            px = float(order['px'])
+            if order['side'] == 'buy' and l <= px:
+                self._fill(order, min(px, o), i)
+            elif order['side'] == 'sell' and h >= px:
+                self._fill(order, max(px, o), i)
+        remaining = []
+        for algo in self.algos:
+            if algo['instId'] != inst_id or algo['active_from'] > i:
+                remaining.append(algo)
+                continue
+            long = algo['posSide'] == 'long'
+            sl_hit = algo['sl'] is not None and (l <= algo['sl'] if long else h >= algo['sl'])
+            tp_hit = algo['tp'] is not None and (h >= algo['tp'] if long else l <= algo['tp'])
+            if sl_hit:
+                self._close(inst_id, algo['posSide'], algo['sz'], algo['sl'])
+            elif tp_hit:
+                self._close(inst_id, algo['posSide'], algo['sz'], algo['tp'])
+            else:
+                remaining.append(algo)
+        self.algos = remaining
+
+    def advance(self, bars: int = 1) -> Dict[str, int]:
+        """所有标的收盘 bars 根K线并撮合，返回各标的新的当前K线时间戳"""
+        with self.lock:
+            for inst_id in self.candles:
+                for _ in range(bars):
+                    i = self.cursor[inst_id]
+                    if i + 1 >= len(self.candles[inst_id]):
+                        break
+                    self._close_bar(inst_id, i)
+                    self.cursor[inst_id] = i + 1
+            return {inst_id: self.current_ts(inst_id) for inst_id in self.candles}
+
+    # ---------- 账户 ----------
+    def unrealized(self) -> float:
+        total = 0.0
+        for (inst_id, pos_side), pos in self.positions.items():
+            direction = 1 if pos_side == 'long' else -1
+            total += (self.last_price(inst_id) - pos['avgPx']) * pos['pos'] * direction * float(self.specs[inst_id]['ctVal'])
+        return total
+
+    def balance(self) -> Dict:
+        with self.lock:
+            eq = self.cash + self.unrealized()
+            return {'totalEq': _fmt(eq), 'uTime': str(int(time.time() * 1000)), 'details': [
+                {'ccy': 'USDT', 'eq': _fmt(eq), 'cashBal': _fmt(self.cash), 'availBal': _fmt(self.cash),
+                 'availEq': _fmt(eq), 'upl': _fmt(eq - self.cash)}]}
+
+    def position_list(self, inst_id: Optional[str] = None) -> List[Dict]:
+        with self.lock:
+            out = []
+            for (inst, pos_side), pos in self.positions.items():
+                if inst_id and inst != inst_id:
+                    continue
+                mark = self.last_price(inst)
+                direction = 1 if pos_side == 'long' else -1
+                upl = (mark - pos['avgPx']) * pos['pos'] * direction * float(self.specs[inst]['ctVal'])
+                out.append({'instId': inst, 'instType': 'SWAP', 'mgnMode': 'cross', 'posSide': pos_side,
+                            'pos': _fmt(pos['pos']), 'avgPx': _fmt(pos['avgPx']), 'markPx': _fmt(mark),
+                            'last': _fmt(mark), 'upl': _fmt(upl), 'lever': '10'})
+            return out
+
+
+# ========== 3. HTTP 接口 ==========
+def _ok(data) -> Dict:
+    return {'code': '0', 'msg': '', 'data': data}
+
+
+def _batch(items: List[Dict]) -> Dict:
+    """批量 / 单个接口的汇总返回码：全部成功 0，全部失败 1，部分成功 2"""
+    failed = sum(1 for item in items if item.get('sCode') != '0')
+    code = '0' if not failed else ('1' if failed == len(items) else '2')
+    return {'code': code, 'msg': '' if code == '0' else 'Operation failed.' if code == '1' else 'Bulk operation partially succeeded.',
+            'data': items}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive，与实盘连接复用行为一致
+    disable_nagle_algorithm = True
+    exchange: MockExchange = None
+    limiter: RateLimiter = None
+    latency: float = 0.0  # 每个请求附加的模拟延迟（秒）
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        body = None
+        if method == "POST":
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                return self._send({'code': '50002', 'msg': 'Json data format error', 'data': []}, 400)
+        client = self.headers.get("OK-ACCESS-KEY") or self.client_address[0]
+        if not self.limiter.allow(client, method, url.path):
+            return self._send({'code': RATE_LIMITED, 'msg': 'Too Many Requests', 'data': []}, 429)
+        if self.latency:
+            time.sleep(self.latency)
+        route = ROUTES.get((method, url.path))
+        if route is None:
+            return self._send({'code': '50000', 'msg': f'Mock endpoint not implemented: {url.path}', 'data': []}, 404)
+        try:
+            self._send(route(self.exchange, query, body))
+        except (KeyError, TypeError, ValueError) as e:
+            self._send({'code': PARAM_ERROR, 'msg': f'Parameter error: {e}', 'data': []}, 400)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def _candles(ex: MockExchange, q: Dict, mark: bool = False) -> Dict:
+    if q['instId'] not in ex.candles:
+        return {'code': PARAM_ERROR, 'msg': 'Parameter instId error', 'data': []}
+    limit = min(int(q.get('limit', 100)), 300)
+    after = int(q['after']) if q.get('after') else None
+    with ex.lock:
+        return _ok(ex.candle_rows(q['instId'], limit, after, mark))
+
+
+def _ticker(ex: MockExchange, q: Dict) -> Dict:
+    with ex.lock:
+        last = _fmt(ex.last_price(q['instId']))
+        return _ok([{'instType': 'SWAP', 'instId': q['instId'], 'last': last, 'askPx': last, 'bidPx': last,
+                     'ts': str(ex.current_ts(q['instId']))}])
+
+
+def _orders_pending(ex: MockExchange, q: Dict) -> Dict:
+    with ex.lock:
+        orders = [dict(o) for o in ex.orders.values() if o['state'] == 'live'
+                  and (not q.get('instId') or o['instId'] == q['instId'])
+                  and (not q.get('ordType') or o['ordType'] in q['ordType'].split(','))]
+    return _ok(sorted(orders, key=lambda o: o['cTime'], reverse=True))
+
+
+def _get_order(ex: MockExchange, q: Dict) -> Dict:
+    with ex.lock:
+        order = ex.find(q.get('ordId'), q.get('clOrdId'))
+        if order is None or order['instId'] != q.get('instId'):
+            return {'code': ORDER_NOT_EXIST, 'msg': 'Order does not exist', 'data': []}
+        return _ok([dict(order)])
+
+
+def _list(body) -> List[Dict]:
+    return body if isinstance(body, list) else [body]
+
+
+ROUTES = {
+    ('GET', '/api/v5/public/time'): lambda ex, q, b: _ok([{'ts': str(int(time.time() * 1000))}]),
+    ('GET', '/api/v5/public/instruments'): lambda ex, q, b: _ok(
+        [dict(spec, instId=inst, instType='SWAP', state='live') for inst, spec in ex.specs.items()
+         if not q.get('instId') or inst == q['instId']]),
+    ('GET', '/api/v5/market/candles'): lambda ex, q, b: _candles(ex, q),
+    ('GET', '/api/v5/market/history-candles'): lambda ex, q, b: _candles(ex, q),
+    ('GET', '/api/v5/market/mark-price-candles'): lambda ex, q, b: _candles(ex, q, mark=True),
+    ('GET', '/api/v5/market/ticker'): lambda ex, q, b: _ticker(ex, q),
+    ('GET', '/api/v5/trade/orders-pending'): lambda ex, q, b: _orders_pending(ex, q),
+    ('GET', '/api/v5/trade/order'): lambda ex, q, b: _get_order(ex, q),
+    ('POST', '/api/v5/trade/order'): lambda ex, q, b: _batch([ex.place(b)]),
+    ('POST', '/api/v5/trade/batch-orders'): lambda ex, q, b: _batch([ex.place(p) for p in _list(b)]),
+    ('POST', '/api/v5/trade/cancel-order'): lambda ex, q, b: _batch([ex.cancel(b)]),
+    ('POST', '/api/v5/trade/cancel-batch-orders'): lambda ex, q, b: _batch([ex.cancel(p) for p in _list(b)]),
+    ('POST', '/api/v5/trade/amend-order'): lambda ex, q, b: _batch([ex.amend(b)]),
+    ('GET', '/api/v5/account/balance'): lambda ex, q, b: _ok([ex.balance()]),
+    ('GET', '/api/v5/account/positions'): lambda ex, q, b: _ok(ex.position_list(q.get('instId'))),
+    # 模拟控制：收盘 bars 根K线 / 查看状态
+    ('POST', '/mock/advance'): lambda ex, q, b: _ok([ex.advance(int((b or {}).get('bars', 1)))]),
+    ('GET', '/mock/state'): lambda ex, q, b: _ok([{'cursor': {i: ex.current_ts(i) for i in ex.candles},
+                                                    'cash': ex.cash, 'fills': len(ex.fills),
+                                                    'live_orders': sum(o['state'] == 'live' for o in ex.orders.values())}]),
+}
+
+
+# ========== 4. 启动 ==========
+class MockServer:
+    """
+    在后台线程运行模拟交易所
+    用法:
+        with MockServer(MockExchange(candles)) as server:
+            os.environ["OKX_DOMAIN"] = server.url
+    """
+
+    def __init__(self, exchange: MockExchange, host: str = "127.0.0.1", port: int = 0,
+                 limits: Dict[Tuple[str, str], Tuple[int, float]] = RATE_LIMITS, latency: float = 0.0,
+                 bar_interval: float = 0.0):
+        """
+        :param port: 0 表示自动分配端口
+        :param bar_interval: > 0 时每隔 bar_interval 秒自动收盘一根K线
+        """
+        handler = type("Handler", (MockHandler,), {'exchange': exchange, 'limiter': RateLimiter(limits),
+                                                   'latency': latency})
+        self.exchange = exchange
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.bar_interval = bar_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "MockServer":
+        self._threads.append(threading.Thread(target=self.httpd.serve_forever, daemon=True))
+        if self.bar_interval > 0:
+            self._threads.append(threading.Thread(target=self._clock, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _clock(self):
+        while not self._stop.wait(self.bar_interval):
+            self.exchange.advance()
+
+    def stop(self):
+        self._stop.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def synthetic_candles(n: int = 2000, start_price: float = 2500.0, start_ts: int = 1700000000000,
+                      vol: float = 0.003, seed: int = 0) -> List[List[str]]:
+    """无归档数据时使用的随机游走K线"""
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0, vol, n)))
+    open_ = np.r_[start_price, close[:-1]]
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2, n)))
+    return [[str(start_ts + i * BAR_MS), f"{open_[i]:.2f}", f"{high[i]:.2f}", f"{low[i]:.2f}", f"{close[i]:.2f}",
+             "1000", "100", "250000", "1"] for i in range(n)]
+
+
+def main():
+    """按归档K线启动模拟交易所（MOCK_INSTRUMENTS 逗号分隔，MOCK_BAR_INTERVAL 秒/根，0 为手动 /mock/advance）"""
+    inst_ids = os.environ.get("MOCK_INSTRUMENTS", "ETH-USDT-SWAP").split(",")
+    candles = {}
+    for inst_id in inst_ids:
+        rows = load_candles(inst_id, BAR, DATA_DIR)
+        candles[inst_id] = rows if len(rows) > 300 else synthetic_candles()
+    exchange = MockExchange(candles)
+    server = MockServer(exchange, port=DEFAULT_PORT, bar_interval=float(os.environ.get("MOCK_BAR_INTERVAL", "0")))
+    server.start()
+    print(f"[{get_shanghai_time()}] [MOCK] 模拟交易所已启动: {server.url}（设置 OKX_DOMAIN={server.url} 使脚本指向本服务）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
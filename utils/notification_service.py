@@ -7,10 +7,10 @@ cron: 1 1 1 1 *
 
 import os
 import json
-import time
 import requests
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, Any
+from utils.retry_policy import get_policy
 
 class NotificationService:
     """通知服务类"""
@@ -29,7 +29,7 @@ class NotificationService:
         
         # 网络请求配置
         self.max_retries = 3
-        self.retry_delay = 2
+        self.retry_delay = 2  # 最大重试间隔(秒)
         self.timeout = 10
         
         # 通知统计
@@ -85,30 +85,25 @@ class NotificationService:
         
         headers = {'Content-Type': 'application/json'}
         
-        # 发送通知
-        for attempt in range(self.max_retries + 1):
-            try:
-                response = requests.post(
-                    self.bark_key, 
-                    json=payload, 
-                    headers=headers, 
-                    timeout=self.timeout
-                )
-                
-                if response.status_code == 200:
-                    self.notification_count += 1
-                    self.success_count += 1
-                    print(f"[{self.get_beijing_time()}] [NOTIFICATION] [BARK] 通知发送成功: {title}")
-                    return True
-                else:
-                    print(f"[{self.get_beijing_time()}] [NOTIFICATION] [BARK] 发送失败: {response.text}")
-                    
-            except Exception as e:
-                print(f"[{self.get_beijing_time()}] [NOTIFICATION] [BARK] 异常 (尝试 {attempt+1}/{self.max_retries+1}): {str(e)}")
-                
-            if attempt < self.max_retries:
-                print(f"[{self.get_beijing_time()}] [NOTIFICATION] [BARK] 重试中... ({attempt+1}/{self.max_retries})")
-                time.sleep(self.retry_delay)
+        # 发送通知（指数退避重试；Bark 连续失败时熔断，不再阻塞交易流程）
+        def post():
+            response = requests.post(
+                self.bark_key, 
+                json=payload, 
+                headers=headers, 
+                timeout=self.timeout
+            )
+            if response.status_code != 200:
+                print(f"[{self.get_beijing_time()}] [NOTIFICATION] [BARK] 发送失败: {response.text}")
+            return response
+        
+        response = get_policy('bark').call(post, attempts=self.max_retries + 1, max_delay=self.retry_delay,
+                                           label="[BARK]")
+        if response is not None and response.status_code == 200:
+            self.notification_count += 1
+            self.success_count += 1
+            print(f"[{self.get_beijing_time()}] [NOTIFICATION] [BARK] 通知发送成功: {title}")
+            return True
         
         self.notification_count += 1
         self.failed_count += 1
@@ -6,13 +6,17 @@ cron: 1 1 1 1 *
 """
 import os
 import json
+import hashlib
 import random
 import string
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 import okx.MarketData as MarketData
 import okx.Trade as Trade
 import requests
+from utils.retry_policy import get_policy, okx_success, okx_degraded, run_deadline
+from utils.instruments import INSTRUMENTS
 
 # ========== 环境与配置 ==========
 # 通过环境变量 ENV_MODE 判断环境。默认'development'。
@@ -41,6 +45,9 @@ if IS_DEVELOPMENT:
     else:
         print(f"[okx_utils] 未找到.env_dev文件: {env_path}")
 
+# REST 接口地址，指向本地模拟交易所（utils/mock_exchange.py）时设置为 http://127.0.0.1:8765
+OKX_DOMAIN = os.environ.get('OKX_DOMAIN', 'https://www.okx.com')
+
 # ========== 1. 获取上海时区时间 ==========
 def get_shanghai_time(fmt="%Y-%m-%d %H:%M:%S"):
     tz = timezone(timedelta(hours=8))
@@ -63,21 +70,19 @@ def get_env_var(var_name, suffix="", default=None):
 
 # ========== 3. 获取未成交订单 ==========
 def get_orders_pending(trade_api, inst_id, max_retries=3, retry_delay=2, account_prefix=""):
-    for attempt in range(max_retries + 1):
-        try:
-            result = trade_api.get_order_list(instId=inst_id, state="live")
-            if result and 'code' in result and result['code'] == '0' and 'data' in result:
-                return result['data']
-        except Exception as e:
-            pass
-        if attempt < max_retries:
-            time.sleep(retry_delay)
+    """max_retries / retry_delay 为重试次数与最大重试间隔（退避、截止时间与熔断见 retry_policy）"""
+    result = get_policy('okx_query').call(lambda: trade_api.get_order_list(instId=inst_id, state="live"),
+                                          attempts=max_retries + 1, max_delay=retry_delay, label=account_prefix)
+    if okx_success(result) and 'data' in result:
+        return result['data']
     return []
 
 # ========== 4. 批量撤销开仓订单 ==========
-def cancel_pending_open_orders(trade_api, inst_id, order_ids=None, max_retries=3, retry_delay=2, account_prefix=""):
+def cancel_pending_open_orders(trade_api, inst_id, order_ids=None, max_retries=3, retry_delay=2, account_prefix="",
+                               confirm_timeout=0):
     """
     支持传入 order_ids（单个或列表），否则自动查找当前挂单。
+    confirm_timeout > 0 时，撤单请求成功后等待订单从未成交列表中消失（最多 confirm_timeout 秒）再返回。
     """
     if order_ids is not None:
         if isinstance(order_ids, str):
@@ -92,17 +97,151 @@ def cancel_pending_open_orders(trade_api, inst_id, order_ids=None, max_retries=3
     if not cancel_orders:
         print("[cancel_pending_open_orders] 没有可撤销的订单")
         return False
-    for attempt in range(max_retries + 1):
+    done, failed = cancel_orders_batched(trade_api, cancel_orders, attempts=max_retries + 1,
+                                         max_delay=retry_delay, account_prefix=account_prefix)
+    print(f"[cancel_pending_open_orders] 撤单完成 {len(done)}/{len(cancel_orders)}" + (f"，失败: {failed}" if failed else ""))
+    # 部分失败时同样确认已撤销的订单
+    if confirm_timeout > 0 and done:
+        remaining = wait_orders_gone(trade_api, inst_id, done, timeout=confirm_timeout)
+        if remaining:
+            print(f"[cancel_pending_open_orders] {confirm_timeout}秒内未确认撤单完成: {remaining}")
+    return not failed
+
+# ========== 4.1 等待订单状态确认 ==========
+# 订单终态：不会再成交或撤销
+TERMINAL_STATES = ("canceled", "filled", "mmp_canceled")
+
+
+def _poll_until(check, timeout, initial_interval, max_interval, backoff):
+    """
+    自适应间隔轮询：check() 返回真值时立即返回该值，否则等待后重试，间隔按 backoff 倍数增长至 max_interval；
+    超过 timeout 秒返回最后一次 check() 的结果
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    while True:
+        result = check()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return result
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+
+def wait_for_order_state(trade_api, inst_id, ord_id=None, cl_ord_id=None, states=TERMINAL_STATES,
+                         timeout=3.0, initial_interval=0.05, max_interval=0.5, backoff=1.6):
+    """
+    查询单个订单直到其状态进入 states（默认任一终态），最多等待 timeout 秒
+    :return: 最后查询到的订单状态（如 'canceled'），查询失败时为 None
+    """
+    last = {'state': None}
+
+    def check():
         try:
-            result = trade_api.cancel_multiple_orders(cancel_orders)
-            print(f"[cancel_pending_open_orders] 撤单接口返回: {result}")
-            if result and 'code' in result and result['code'] == '0':
-                return True
+            result = trade_api.get_order(instId=inst_id, ordId=ord_id or "", clOrdId=cl_ord_id or "")
+            if result and result.get('code') == '0' and result.get('data'):
+                last['state'] = result['data'][0].get('state')
         except Exception as e:
-            print(f"[cancel_pending_open_orders] 撤单异常: {e}")
-        if attempt < max_retries:
-            time.sleep(retry_delay)
-    return False
+            print(f"[wait_for_order_state] 查询订单异常: {e}")
+        return last['state'] in states
+
+    _poll_until(check, timeout, initial_interval, max_interval, backoff)
+    return last['state']
+
+
+def wait_orders_gone(trade_api, inst_id, ord_ids, timeout=3.0, initial_interval=0.05, max_interval=0.5, backoff=1.6):
+    """
+    撤单确认：轮询未成交订单列表（每轮一次请求，与订单数无关），直到 ord_ids 全部不在列表中
+    :return: 超时后仍未确认的 ordId 列表（全部确认时为空列表）
+    """
+    pending = {'ids': list(ord_ids)}
+
+    def check():
+        try:
+            result = trade_api.get_order_list(instId=inst_id)
+            if result and result.get('code') == '0':
+                live = {o.get('ordId') for o in result.get('data', [])}
+                pending['ids'] = [oid for oid in pending['ids'] if oid in live]
+                return not pending['ids']
+        except Exception as e:
+            print(f"[wait_orders_gone] 查询未成交订单异常: {e}")
+        return False
+
+    _poll_until(check, timeout, initial_interval, max_interval, backoff)
+    return pending['ids']
+
+# ========== 4.2 分批并发撤单 ==========
+# cancel-batch-orders 单次最多 20 个订单；限频 300 个订单 / 2 秒
+CANCEL_BATCH_LIMIT = 20
+CANCEL_RATE_LIMIT = (300, 2.0)
+# 单个订单无需重试的返回码：0 成功 / 51400 已成交、已撤销或不存在 / 51401 已撤销 / 51402 已完成 / 51410 撤销中
+CANCEL_DONE_CODES = ("0", "51400", "51401", "51402", "51410")
+
+
+def cancel_orders_batched(trade_api, cancel_orders, attempts=3, max_delay=None, account_prefix=""):
+    """
+    撤销任意数量的订单：按 CANCEL_BATCH_LIMIT 分块，同一限频窗口内的分块并发发出（订单数不超过限频时一个往返完成），
+    之后只重试返回失败 sCode 的订单（整块请求异常时重试整块）
+    :param cancel_orders: [{"instId": ..., "ordId": ...}, ...]
+    :param attempts / max_delay: 总轮数与最大重试间隔（退避、截止时间与熔断见 retry_policy）
+    :return: (已撤销或已不在挂单中的 ordId 列表, 仍失败的 {ordId: (sCode, sMsg)})
+    """
+    policy = get_policy('okx_trade')
+    limit, window = CANCEL_RATE_LIMIT
+    pending = list(cancel_orders)
+    done, failed = [], {}
+    window_start, window_sent = time.monotonic(), 0
+
+    def send(chunk):
+        return policy.call(lambda: trade_api.cancel_multiple_orders(chunk), attempts=1, label=account_prefix,
+                           is_success=lambda r: isinstance(r, dict) and r.get('code') in ('0', '1', '2'))
+
+    for attempt in range(attempts):
+        if not pending:
+            break
+        chunks = [pending[i:i + CANCEL_BATCH_LIMIT] for i in range(0, len(pending), CANCEL_BATCH_LIMIT)]
+        results = []
+        with ThreadPoolExecutor(max_workers=min(len(chunks), limit // CANCEL_BATCH_LIMIT),
+                                thread_name_prefix="cancel") as executor:
+            i = 0
+            while i < len(chunks):
+                # 本窗口剩余额度内的分块并发发出，额度用完时等待下一个窗口
+                if time.monotonic() - window_start >= window:
+                    window_start, window_sent = time.monotonic(), 0
+                wave = []
+                while i < len(chunks) and window_sent + len(chunks[i]) <= limit:
+                    wave.append(chunks[i])
+                    window_sent += len(chunks[i])
+                    i += 1
+                if not wave:
+                    time.sleep(max(window - (time.monotonic() - window_start), 0))
+                    continue
+                results.extend(executor.map(send, wave))
+        pending = []
+        for chunk, result in zip(chunks, results):
+            items = {d.get('ordId'): d for d in result.get('data') or []} if isinstance(result, dict) else {}
+            for order in chunk:
+                item = items.get(order['ordId'])
+                if item is not None and item.get('sCode') in CANCEL_DONE_CODES:
+                    done.append(order['ordId'])
+                    failed.pop(order['ordId'], None)
+                    continue
+                if item is not None:
+                    failed[order['ordId']] = (item.get('sCode'), item.get('sMsg', ''))
+                else:
+                    failed[order['ordId']] = ("", result.get('msg', '') if isinstance(result, dict) else '无响应')
+                pending.append(order)
+        if not pending or attempt + 1 >= attempts:
+            break
+        wait = policy.delay(attempt, max_delay)
+        if wait >= run_deadline().remaining():
+            print(f"[cancel_orders_batched] {account_prefix} 已到本次运行截止时间，停止重试")
+            break
+        print(f"[cancel_orders_batched] {account_prefix} {len(pending)}个订单撤销失败，{wait:.2f}秒后重试")
+        time.sleep(wait)
+    return done, failed
 
 # ========== 5. 生成clOrdId ==========
 def generate_clord_id(prefix="ORD"):
@@ -110,11 +249,65 @@ def generate_clord_id(prefix="ORD"):
     rand = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
     return f"{prefix}{timestamp}{rand}"[:32]
 
+
+def deterministic_clord_id(strategy, account, inst_id, bar_ts, side, prefix="ORD", salt=""):
+    """
+    由（策略, 账户, 标的, K线时间戳, 方向）确定的 clOrdId：同一根K线同一信号的重试 / 并发提交使用同一 clOrdId，
+    交易所以重复 clOrdId（51016）拒绝第二张委托，不会重复开仓
+    :param salt: 区分同一订单的附带止盈止损 ID 等
+    :return: 前缀（字母数字，最多8位）+ 哈希，共 32 位以内
+    """
+    prefix = ''.join(ch for ch in str(prefix) if ch.isalnum())[:8]
+    key = f"{strategy}|{account}|{inst_id}|{int(bar_ts)}|{side}|{salt}"
+    return f"{prefix}{hashlib.sha1(key.encode('utf-8')).hexdigest()}"[:32]
+
+
+# 重复 clOrdId 错误码：该 clOrdId 的委托已存在（通常是超时重试时上一次请求其实已成功）
+DUPLICATE_CLORD_CODE = "51016"
+
+
+def is_duplicate_clord(result):
+    return bool(result and any(d.get('sCode') == DUPLICATE_CLORD_CODE for d in result.get('data') or []))
+
+
+def place_order_idempotent(trade_api, order_params, max_retries=3, retry_delay=0.5, account_prefix=""):
+    """
+    以固定 clOrdId 下单，超时 / 异常时使用同一参数重试（不会产生第二张委托）
+    返回重复 clOrdId 时查询已存在的委托，按下单成功返回（data[0] 带 duplicate=True）
+    :return: 下单接口返回（或查询已存在委托后构造的成功结果），全部失败时为 None 或最后一次返回
+    """
+    cl_ord_id = order_params['clOrdId']
+
+    def attempt():
+        result = trade_api.place_order(**order_params)
+        if not is_duplicate_clord(result):
+            return result
+        print(f"{account_prefix}[place_order_idempotent] clOrdId {cl_ord_id} 已存在，查询已有委托")
+        existing = trade_api.get_order(instId=order_params['instId'], clOrdId=cl_ord_id)
+        if okx_success(existing) and existing.get('data'):
+            order = existing['data'][0]
+            return {'code': '0', 'msg': '', 'data': [{'ordId': order.get('ordId'), 'clOrdId': cl_ord_id,
+                                                      'sCode': '0', 'sMsg': '', 'duplicate': True}]}
+        return None
+
+    # 业务错误直接返回；无响应、异常或服务异常返回码（如限频）时以同一 clOrdId 重试
+    return get_policy('okx_trade').call(attempt, attempts=max_retries + 1, max_delay=retry_delay,
+                                        is_success=lambda r: not okx_degraded(r), label=account_prefix)
+
 # ========== 6. 构建下单参数 ==========
-def build_order_params(inst_id, side, entry_price, size, pos_side, take_profit, stop_loss, prefix="ORD"):
-    cl_ord_id = generate_clord_id(prefix)
+def build_order_params(inst_id, side, entry_price, size, pos_side, take_profit, stop_loss, prefix="ORD",
+                       cl_ord_id=None, attach_algo_cl_ord_id=None):
+    """
+    cl_ord_id / attach_algo_cl_ord_id 未给出时随机生成（需要幂等重试时传入 deterministic_clord_id 的结果）
+    已加载合约规格（INSTRUMENTS.warm）时，价格按 tickSz、数量按 lotSz 取整
+    """
+    cl_ord_id = cl_ord_id or generate_clord_id(prefix)
+    spec = INSTRUMENTS.cached(inst_id)
+    if spec is not None:
+        entry_price, take_profit, stop_loss = (spec.format_price(float(p)) for p in (entry_price, take_profit, stop_loss))
+        size = spec.format_size(float(size))
     attach_algo_ord = {
-        "attachAlgoClOrdId": generate_clord_id(prefix),
+        "attachAlgoClOrdId": attach_algo_cl_ord_id or generate_clord_id(prefix),
         "tpTriggerPx": str(take_profit),
         "tpOrdPx": "-1",
         "tpOrdKind": "condition",
@@ -168,7 +361,7 @@ def send_bark_notification(title, content, group=None):
 def init_trade_api(api_key, secret_key, passphrase, flag=None, suffix=""):
     if flag is None:
         flag = get_env_var("OKX_FLAG", suffix, "0")
-    return Trade.TradeAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag))
+    return Trade.TradeAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag), OKX_DOMAIN)
 
 # ========== 新增：标准化获取 TradeAPI/AccountAPI ==========
 def get_trade_api():
@@ -176,7 +369,7 @@ def get_trade_api():
     secret_key = get_env_var("OKX_SECRET_KEY")
     passphrase = get_env_var("OKX_PASSPHRASE")
     flag = get_env_var("OKX_FLAG", default="0")
-    return Trade.TradeAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag))
+    return Trade.TradeAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag), OKX_DOMAIN)
 
 def get_account_api():
     api_key = get_env_var("OKX_API_KEY")
@@ -184,7 +377,7 @@ def get_account_api():
     passphrase = get_env_var("OKX_PASSPHRASE")
     flag = get_env_var("OKX_FLAG", default="0")
     import okx.Account as Account
-    return Account.AccountAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag))
+    return Account.AccountAPI(str(api_key), str(secret_key), str(passphrase), False, str(flag), OKX_DOMAIN)
 
 # ========== 9. 获取K线数据 ==========
 def get_kline_data(api_key, secret_key, passphrase, inst_id, bar, limit=None, flag=None, suffix="", max_retries=3, retry_delay=2):
@@ -192,19 +385,16 @@ def get_kline_data(api_key, secret_key, passphrase, inst_id, bar, limit=None, fl
         limit = int(get_env_var("OKX_KLINE_LIMIT", suffix, 2))
     try:
         flag_str = str(flag) if flag is not None else "0"
-        market_api = MarketData.MarketAPI(str(api_key), str(secret_key), str(passphrase), False, flag_str)
+        market_api = MarketData.MarketAPI(str(api_key), str(secret_key), str(passphrase), False, flag_str, OKX_DOMAIN)
         print(f"[okx_utils] [MARKET] K线API初始化成功")
     except Exception as e:
         print(f"[okx_utils] [ERROR] K线API初始化失败: {str(e)}")
         return None
-    for attempt in range(max_retries + 1):
-        try:
-            result = market_api.get_candlesticks(instId=inst_id, bar=bar, limit=str(limit))
-            print(f"[DEBUG] K线原始返回: {result}")
-            if result and 'data' in result and len(result['data']) >= 2:
-                return result['data']
-        except Exception as e:
-            print(f"[okx_utils] [ERROR] 获取K线失败: {e}")
-        if attempt < max_retries:
-            time.sleep(retry_delay)
+    result = get_policy('okx_market').call(
+        lambda: market_api.get_candlesticks(instId=inst_id, bar=bar, limit=str(limit)),
+        attempts=max_retries + 1, max_delay=retry_delay,
+        is_success=lambda r: bool(r and 'data' in r and len(r['data']) >= 2), label=inst_id)
+    print(f"[DEBUG] K线原始返回: {result}")
+    if result and 'data' in result and len(result['data']) >= 2:
+        return result['data']
     return None
@@ -0,0 +1,159 @@
+"""
+开仓委托管理（改单优先）
+原流程为“查询未成交委托 → 撤销止盈价已被越过的限价开仓单 → 新下限价单”，需要 2~3 次往返，
+且撤单到新单之间没有任何工作中的委托。这里按 clOrdId 跟踪委托：
+- 有可复用的同方向未成交开仓单时，通过 amend-order 一次修改价格 / 数量 / 附带止盈止损
+  （cxlOnFail=true：改单失败时由交易所撤销原单；确认原单状态为 canceled 后才回退为新下单，
+  原单已成交或仍在挂单时不下单，不会出现两张委托或重复开仓）
+- 没有可复用的委托时才新下单
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.okx_utils import (get_orders_pending, cancel_pending_open_orders, get_shanghai_time, place_order_idempotent,
+                             wait_for_order_state)
+
+
+def is_open_limit(order: Dict) -> bool:
+    """限价开仓单（买入开多 / 卖出开空）"""
+    return order.get('ordType') == 'limit' and (
+        (order.get('side') == 'buy' and order.get('posSide') == 'long') or
+        (order.get('side') == 'sell' and order.get('posSide') == 'short'))
+
+
+def attached_tp(order: Dict) -> Optional[float]:
+    for algo in order.get('attachAlgoOrds') or []:
+        if algo.get('tpTriggerPx'):
+            return float(algo['tpTriggerPx'])
+    return None
+
+
+class OrderManager:
+    """单个账户单个标的的开仓委托管理"""
+
+    def __init__(self, trade_api, inst_id: str, account_name: str = "", confirm_timeout: float = 0):
+        """
+        :param confirm_timeout: 撤单后等待订单从未成交列表消失的秒数（随后要新下单、需等待保证金释放时使用）
+        """
+        self.trade_api = trade_api
+        self.inst_id = inst_id
+        self.account_name = account_name
+        self.confirm_timeout = confirm_timeout
+        self.orders: Dict[str, Dict] = {}  # clOrdId（无则 ordId） -> 未成交委托
+
+    def log(self, message: str):
+        prefix = f"[{self.account_name}] " if self.account_name else ""
+        print(f"[{get_shanghai_time()}] [ORDER_MANAGER] {prefix}{message}")
+
+    @staticmethod
+    def _key(order: Dict) -> str:
+        return order.get('clOrdId') or order.get('ordId')
+
+    # ---------- 查询 ----------
+    def refresh(self) -> List[Dict]:
+        """重新获取未成交委托"""
+        orders = get_orders_pending(self.trade_api, self.inst_id, account_prefix=self.account_name)
+        self.orders = {self._key(o): o for o in orders}
+        return orders
+
+    def stale_entries(self, latest_price: float) -> List[Dict]:
+        """收盘价已越过附带止盈价的限价开仓单（原脚本中需要撤销的委托）"""
+        stale = []
+        for order in self.orders.values():
+            tp = attached_tp(order)
+            if not is_open_limit(order) or not tp:
+                continue
+            if (order['posSide'] == 'long' and latest_price >= tp) or (order['posSide'] == 'short' and latest_price <= tp):
+                stale.append(order)
+        return stale
+
+    # ---------- 改单 / 下单 ----------
+    def amend_params(self, order: Dict, params: Dict) -> Tuple[Optional[Dict], bool]:
+        """
+        由目标下单参数（build_order_params 的结果）生成改单参数
+        已部分成交的委托不修改数量
+        :return: (改单参数，无需修改时为 None; 是否可以改单)
+        """
+        amend = {'instId': self.inst_id, 'ordId': order['ordId'], 'cxlOnFail': 'true'}
+        if float(order.get('px') or 0) != float(params['px']):
+            amend['newPx'] = str(params['px'])
+        if float(order.get('accFillSz') or 0) == 0 and float(order.get('sz') or 0) != float(params['sz']):
+            amend['newSz'] = str(params['sz'])
+        current = (order.get('attachAlgoOrds') or [{}])[0]
+        target = (params.get('attachAlgoOrds') or [{}])[0]
+        algo = {}
+        for field in ('tpTriggerPx', 'slTriggerPx'):
+            if target.get(field) and float(current.get(field) or 0) != float(target[field]):
+                algo['new' + field[0].upper() + field[1:]] = str(target[field])
+        if algo:
+            if current.get('attachAlgoId'):
+                algo['attachAlgoId'] = current['attachAlgoId']
+            elif current.get('attachAlgoClOrdId'):
+                algo['attachAlgoClOrdId'] = current['attachAlgoClOrdId']
+            else:
+                # 原委托没有附带止盈止损，无法通过改单添加
+                return None, False
+            if 'newTpTriggerPx' in algo:
+                algo['newTpOrdPx'] = target.get('tpOrdPx', "-1")
+            if 'newSlTriggerPx' in algo:
+                algo['newSlOrdPx'] = target.get('slOrdPx', "-1")
+            amend['attachAlgoOrds'] = [algo]
+        return (amend if len(amend) > 3 else None), True
+
+    def submit(self, params: Dict, reuse: Sequence[Dict] = ()) -> Tuple[str, Optional[Dict]]:
+        """
+        按目标下单参数提交委托
+        :param params: build_order_params 的结果
+        :param reuse: 可复用（将被替换）的未成交开仓单，通常为 stale_entries() 的结果；
+                      其中同方向的一张改单复用，其余撤销
+        :return: (动作 'amend' / 'keep' / 'place', 接口返回)
+        """
+        candidate = next((o for o in reuse if o.get('side') == params['side'] and o.get('posSide') == params['posSide']),
+                         None)
+        others = [o['ordId'] for o in reuse if o is not candidate]
+        if others:
+            self.cancel([o for o in reuse if o is not candidate])
+        amend, amendable = self.amend_params(candidate, params) if candidate is not None else (None, False)
+        if candidate is not None and not amendable:
+            self.cancel([candidate])
+        elif candidate is not None:
+            if amend is None:
+                self.log(f"委托 {self._key(candidate)} 与目标一致，无需修改")
+                return 'keep', {'code': '0', 'data': [{'ordId': candidate['ordId'], 'clOrdId': candidate.get('clOrdId', ''),
+                                                       'sCode': '0', 'sMsg': ''}]}
+            try:
+                result = self.trade_api.amend_order(**amend)
+            except Exception as e:
+                # 请求结果未知（可能已改单成功），不回退下单，避免出现两张委托
+                self.log(f"改单异常 {self._key(candidate)}: {e}")
+                return 'amend', {'code': '-1', 'msg': str(e)}
+            self.log(f"改单 {self._key(candidate)}: {amend} -> {result}")
+            if result and result.get('code') == '0':
+                self.orders[self._key(candidate)] = dict(candidate, px=params['px'], sz=amend.get('newSz', candidate.get('sz')))
+                return 'amend', result
+            if not result or result.get('code') != '1':
+                # 请求级错误（限频 / 系统繁忙等），交易所未处理该委托，原单仍在
+                self.log(f"改单请求失败，原单 {self._key(candidate)} 未改动，本轮不下单")
+                return 'amend', result
+            # 单个订单改单失败：cxlOnFail 会撤销原单，但原单也可能已在 refresh() 之后成交
+            state = wait_for_order_state(self.trade_api, self.inst_id, ord_id=candidate['ordId'],
+                                         timeout=max(self.confirm_timeout, 1.0))
+            if state != 'canceled':
+                self.log(f"改单失败且原单 {self._key(candidate)} 状态为 {state}，本轮不下单")
+                return 'amend', result
+            self.orders.pop(self._key(candidate), None)
+            self.log("改单失败，原单已撤销，回退为新下单")
+        result = place_order_idempotent(self.trade_api, params, account_prefix=self.account_name)
+        if result and result.get('code') == '0':
+            self.orders[params['clOrdId']] = dict(params, ordId=result['data'][0].get('ordId'))
+        return 'place', result
+
+    def cancel(self, orders: Sequence[Dict]) -> bool:
+        """撤销给定委托"""
+        if not orders:
+            return True
+        ok = cancel_pending_open_orders(self.trade_api, self.inst_id, order_ids=[o['ordId'] for o in orders],
+                                        account_prefix=self.account_name, confirm_timeout=self.confirm_timeout)
+        if ok:
+            for order in orders:
+                self.orders.pop(self._key(order), None)
+        return ok
@@ -0,0 +1,107 @@
+"""
+预构建下单模板
+原流程在K线收盘、取数、分析之后才计算下单数量、止盈止损并构建下单参数（含生成 clOrdId），
+这些工作都在收盘到下单之间的关键路径上。这里在收盘前（取K线之前）为每个账户预先构建多 / 空两个模板：
+- 下单参数字典、clOrdId、attachAlgoClOrdId 与止盈止损系数提前生成
+- 收盘后只需 fill()：写入委托价、止盈止损触发价（按名义价值下单时再做一次除法），为微秒级操作
+- 可配合 wait_for_bar_close() 提前启动脚本，在上一根K线内完成准备后等待收盘
+"""
+import time
+from typing import Dict, Optional
+
+from utils.okx_utils import build_order_params
+from utils.instruments import INSTRUMENTS
+
+
+class OrderTemplate:
+    """单个方向的预构建限价开仓单（参数格式与 build_order_params 一致）"""
+
+    def __init__(self, inst_id: str, pos_side: str, take_profit_percent: float, stop_loss_percent: float,
+                 size: Optional[float] = None, notional: Optional[float] = None, size_decimals: int = 2,
+                 price_decimals: Optional[int] = None, prefix: str = "ORD"):
+        """
+        :param size: 固定下单数量（张）
+        :param notional: 按名义价值下单时的 数量 x 委托价（size 未提供时使用，fill 时 数量 = notional / 委托价）
+        :param price_decimals: 止盈止损价保留的小数位，None 表示不取整
+        """
+        if size is None and notional is None:
+            raise ValueError("size 与 notional 至少提供一个")
+        long = pos_side == "long"
+        self.pos_side = pos_side
+        self.size = size
+        self.notional = notional
+        self.size_decimals = size_decimals
+        self.price_decimals = price_decimals
+        self.tp_factor = 1 + take_profit_percent if long else 1 - take_profit_percent
+        self.sl_factor = 1 - stop_loss_percent if long else 1 + stop_loss_percent
+        self.params = build_order_params(inst_id, "buy" if long else "sell", 0, size if size is not None else 0,
+                                         pos_side, 0, 0, prefix)
+        self._algo = self.params['attachAlgoOrds'][0]
+        self.spec = INSTRUMENTS.cached(inst_id)  # 已加载合约规格时按 tickSz / lotSz 取整
+        self.entry_price: Optional[float] = None
+        self.take_profit: Optional[float] = None
+        self.stop_loss: Optional[float] = None
+
+    def fill(self, entry_price: float, take_profit: Optional[float] = None, stop_loss: Optional[float] = None,
+             cl_ord_id: Optional[str] = None, algo_cl_ord_id: Optional[str] = None) -> Dict:
+        """
+        写入委托价与止盈止损价，返回下单参数（即模板本身的字典，同一模板只应提交一次）
+        止盈止损价未给出时按模板的比例计算；cl_ord_id / algo_cl_ord_id 给出时替换预生成的随机 ID（幂等重试用）
+        """
+        if take_profit is None:
+            take_profit = entry_price * self.tp_factor
+            if self.price_decimals is not None:
+                take_profit = round(take_profit, self.price_decimals)
+        if stop_loss is None:
+            stop_loss = entry_price * self.sl_factor
+            if self.price_decimals is not None:
+                stop_loss = round(stop_loss, self.price_decimals)
+        params = self.params
+        spec = self.spec
+        if self.size is None:
+            params['sz'] = str(round(self.notional / entry_price, self.size_decimals))
+            if spec is not None:
+                params['sz'] = spec.format_size(float(params['sz']))
+        if spec is not None:
+            params['px'] = spec.format_price(entry_price)
+            self._algo['tpTriggerPx'] = spec.format_price(take_profit)
+            self._algo['slTriggerPx'] = spec.format_price(stop_loss)
+        else:
+            params['px'] = str(entry_price)
+            self._algo['tpTriggerPx'] = str(take_profit)
+            self._algo['slTriggerPx'] = str(stop_loss)
+        if cl_ord_id:
+            params['clOrdId'] = cl_ord_id
+        if algo_cl_ord_id:
+            self._algo['attachAlgoClOrdId'] = algo_cl_ord_id
+        self.entry_price, self.take_profit, self.stop_loss = entry_price, take_profit, stop_loss
+        return params
+
+    @property
+    def order_size(self) -> float:
+        return float(self.params['sz'])
+
+
+class OrderTemplates:
+    """单个账户的多 / 空模板"""
+
+    def __init__(self, inst_id: str, take_profit_percent: float, stop_loss_percent: float, **kwargs):
+        self.long = OrderTemplate(inst_id, "long", take_profit_percent, stop_loss_percent, **kwargs)
+        self.short = OrderTemplate(inst_id, "short", take_profit_percent, stop_loss_percent, **kwargs)
+
+    def for_signal(self, signal: str) -> OrderTemplate:
+        """signal 支持 'LONG' / 'SHORT' / 'long' / 'short' / 'buy' / 'sell'"""
+        return self.long if signal.lower() in ("long", "buy") else self.short
+
+
+def wait_for_bar_close(bar_seconds: int, max_wait: float, delay: float = 0.0) -> float:
+    """
+    当前时间距下一根K线收盘不超过 max_wait 秒时等待至收盘后 delay 秒（用于提前启动、收盘前完成准备）
+    :return: 实际等待的秒数
+    """
+    now = time.time()
+    remaining = bar_seconds - now % bar_seconds
+    if max_wait <= 0 or remaining > max_wait:
+        return 0.0
+    time.sleep(remaining + delay)
+    return remaining + delay
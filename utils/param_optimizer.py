@@ -0,0 +1,184 @@
+"""
+任务名称
+name: 策略参数逐轮减半寻优
+定时规则
+cron: 0 3 * * 0
+逐轮减半（Successive Halving）参数寻优：
+- 第一轮用最近一小段历史为全部参数组合打分，只保留得分最高的 1/eta
+- 之后每轮将历史长度扩大 eta 倍，对幸存组合重新打分，直至最后一组在全量历史上评估
+- 打分复用 Backtester 撮合与 summarize 统计；各组合在进程池中并行评估，
+  归档K线与特征存储中的K线形态特征由主进程读取一次放入共享内存，子进程只挂载只读视图
+"""
+import os
+import sys
+import math
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR
+from utils.shared_candles import SharedCandles, attach, attach_klines
+from utils.feature_store import FeatureStore
+from utils.strategy_adapter import ADAPTER_FACTORIES
+from utils.backtester import Backtester, BacktestBroker, summarize
+from utils.okx_utils import get_shanghai_time
+
+# ========== 寻优参数 ==========
+ETA = 3                 # 每轮保留 1/ETA，历史长度扩大 ETA 倍
+MIN_BARS = 2000         # 第一轮最少使用的K线数
+METRIC = "total_pnl"    # 打分指标（summarize 输出的字段）
+MAX_WORKERS = int(os.environ.get("OPTIMIZER_WORKERS", "0")) or None
+
+# 默认寻优网格：ethqa 的振幅阈值
+DEFAULT_GRID = {
+    'RANGE1_MIN': [0.6, 0.8, 1.0, 1.2],
+    'RANGE1_MAX': [1.4, 1.6, 1.8, 2.0],
+    'RANGE2_THRESHOLD': [1.9, 2.2, 2.5],
+}
+
+_WORKER_KLINES: Sequence = []
+_WORKER_FEATURES: Dict = {}
+
+
+# ========== 1. 子进程评估 ==========
+def _init_worker(descriptor: Dict, feature_descriptor: Optional[Dict] = None):
+    """子进程初始化：挂载共享内存中的K线与特征列，之后的评估任务按长度切片复用"""
+    global _WORKER_KLINES, _WORKER_FEATURES
+    _WORKER_KLINES = attach_klines(descriptor)
+    _WORKER_FEATURES = attach(feature_descriptor) if feature_descriptor else {}
+
+
+def _release_worker():
+    """当前进程内评估结束：丢弃指向共享内存的视图（共享内存随后由创建方释放）"""
+    global _WORKER_KLINES, _WORKER_FEATURES
+    _WORKER_KLINES, _WORKER_FEATURES = [], {}
+
+
+def share_features(inst_id: str, bar: str, data_dir: str = DATA_DIR, start_ts: Optional[int] = None,
+                   end_ts: Optional[int] = None) -> SharedCandles:
+    """读取特征存储（惰性补算）并放入共享内存，供各组合回测预筛K线"""
+    return SharedCandles.create(FeatureStore(data_dir).load(inst_id, bar, start_ts=start_ts, end_ts=end_ts))
+
+
+def evaluate(task: Tuple) -> Dict:
+    """
+    在最近 n_bars 根K线上回测一组参数
+    :param task: (策略名称, 参数, n_bars, metric)，n_bars 为 None 时使用全量K线
+    :return: summarize 统计 + 'score'
+    """
+    name, params, n_bars, metric = task
+    adapter = ADAPTER_FACTORIES[name](params=params)
+    backtester = Backtester(adapter.inst_id, adapter.bar, [adapter], BacktestBroker())
+    backtester.evaluator.set_features(_WORKER_FEATURES)
+    backtester.run(_WORKER_KLINES[-n_bars:] if n_bars else _WORKER_KLINES)
+    report = summarize(backtester.broker)
+    report.pop('by_strategy')
+    report['score'] = report[metric]
+    return report
+
+
+def expand_grid(grid: Dict[str, Sequence]) -> List[Dict]:
+    """参数网格展开为参数组合列表"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+# ========== 2. 逐轮减半 ==========
+class SuccessiveHalving:
+    """
+    逐轮减半寻优器，evaluate 任务提交到同一个进程池；
+    max_workers=1 时在当前进程内顺序执行（便于调试）
+    """
+
+    def __init__(self, name: str, grid: Dict[str, Sequence], inst_id: Optional[str] = None,
+                 bar: Optional[str] = None, data_dir: str = DATA_DIR,
+                 start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+                 eta: int = ETA, min_bars: int = MIN_BARS, metric: str = METRIC,
+                 max_workers: Optional[int] = MAX_WORKERS):
+        default = ADAPTER_FACTORIES[name]()
+        self.name = name
+        self.candidates = expand_grid(grid)
+        self.inst_id = inst_id or default.inst_id
+        self.bar = bar or default.bar
+        self.archive_args = (self.inst_id, self.bar, data_dir, start_ts, end_ts)
+        self.eta = eta
+        self.min_bars = min_bars
+        self.metric = metric
+        self.max_workers = max_workers
+        self.history: List[Dict] = []  # 每轮: {'round', 'bars', 'results': [(params, report)]}
+        self.bars_evaluated = 0        # 累计回测K线数（衡量计算量）
+
+    def _map(self, executor, tasks: List[Tuple]) -> List[Dict]:
+        if executor is None:
+            return [evaluate(task) for task in tasks]
+        return list(executor.map(evaluate, tasks))
+
+    def run(self) -> Tuple[Dict, Dict]:
+        """执行寻优，返回 (最优参数, 全量历史上的统计)"""
+        executor = None
+        shared = SharedCandles.from_archive(*self.archive_args)
+        features = share_features(*self.archive_args)
+        total_bars = len(shared.arrays()['timestamp'])
+        if self.max_workers == 1:
+            _init_worker(shared.descriptor, features.descriptor)
+        else:
+            executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                           initargs=(shared.descriptor, features.descriptor))
+        try:
+            survivors = list(self.candidates)
+            rounds = math.ceil(math.log(len(survivors), self.eta)) if len(survivors) > 1 else 0
+            for r in range(rounds + 1):
+                n_bars = total_bars if r == rounds else \
+                    min(total_bars, max(self.min_bars, int(total_bars / self.eta ** (rounds - r))))
+                reports = self._map(executor, [(self.name, p, n_bars, self.metric) for p in survivors])
+                self.bars_evaluated += n_bars * len(survivors)
+                # 得分相同按原始顺序，保证结果可复现
+                ranked = sorted(zip(survivors, reports), key=lambda x: -x[1]['score'])
+                self.history.append({'round': r, 'bars': n_bars, 'results': ranked})
+                print(f"[{get_shanghai_time()}] [OPTIMIZER] 第{r + 1}轮: {len(survivors)} 组参数 x {n_bars} 根K线, "
+                      f"最优 {self.metric}={ranked[0][1]['score']:.4f} {ranked[0][0]}")
+                survivors = [p for p, _ in ranked[:max(1, math.ceil(len(ranked) / self.eta))]]
+            best_params, best_report = self.history[-1]['results'][0]
+            return best_params, best_report
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            _release_worker()
+            shared.close()
+            features.close()
+
+    def speedup(self, total_bars: Optional[int] = None) -> float:
+        """相对穷举网格（每组参数跑全量历史）的计算量节省倍数"""
+        total_bars = total_bars or self.history[-1]['bars']
+        return len(self.candidates) * total_bars / self.bars_evaluated if self.bars_evaluated else 0.0
+
+
+def grid_search(name: str, grid: Dict[str, Sequence], data_dir: str = DATA_DIR,
+                metric: str = METRIC, max_workers: Optional[int] = MAX_WORKERS) -> Tuple[Dict, Dict]:
+    """穷举网格（全部组合跑全量历史），用于核对逐轮减半的结果"""
+    default = ADAPTER_FACTORIES[name]()
+    candidates = expand_grid(grid)
+    tasks = [(name, p, None, metric) for p in candidates]
+    with SharedCandles.from_archive(default.inst_id, default.bar, data_dir) as shared:
+        if max_workers == 1:
+            _init_worker(shared.descriptor)
+            reports = [evaluate(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(shared.descriptor,)) as executor:
+                reports = list(executor.map(evaluate, tasks))
+    return max(zip(candidates, reports), key=lambda x: x[1]['score'])
+
+
+def main():
+    optimizer = SuccessiveHalving("ethqa", DEFAULT_GRID)
+    best_params, report = optimizer.run()
+    print(f"[{get_shanghai_time()}] [OPTIMIZER] 最优参数: {best_params}, 交易 {report['trades']} 笔, "
+          f"胜率 {report['win_rate'] * 100:.2f}%, 总盈亏 {report['total_pnl']:.4f} USDT, "
+          f"最大回撤 {report['max_drawdown'] * 100:.2f}%, 计算量为穷举的 1/{optimizer.speedup():.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+路径依赖回测内核
+加仓上限（DOGE pyramiding）、存在未成交委托时跳过新信号（ETH脚本）、止盈止损离场都依赖逐K线状态，
+无法直接向量化。这里把单标的单策略的撮合状态机写成只操作numpy数组的K线循环：
+- 安装 numba 时以 njit 编译为本地代码运行
+- 未安装（或设置 PATH_KERNELS_JIT=0）时以同一份代码按纯Python执行，结果完全一致
+撮合规则与 BacktestBroker 相同（同K线同时触及止盈止损按止损处理）。
+"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils.backtester import MARGIN, LEVERAGE, FEE_RATE, INITIAL_EQUITY
+
+try:
+    if os.environ.get("PATH_KERNELS_JIT", "1") == "0":
+        raise ImportError("numba disabled by PATH_KERNELS_JIT=0")
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """numba 不可用时的占位装饰器，直接返回原函数"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# 离场原因编码
+EXIT_NONE = 0
+EXIT_TP = 1
+EXIT_SL = 2
+REASONS = {EXIT_TP: "tp", EXIT_SL: "sl"}
+
+
+# ========== 1. 内核 ==========
+@njit(cache=True)
+def _exit_code(direction, high, low, tp, sl):
+    if direction == 1:
+        hit_tp, hit_sl = high >= tp, low <= sl
+    else:
+        hit_tp, hit_sl = low <= tp, high >= sl
+    if hit_sl:
+        # 同时触及时无法判定先后，按止损处理（保守）
+        return EXIT_SL, hit_tp
+    if hit_tp:
+        return EXIT_TP, False
+    return EXIT_NONE, False
+
+
+@njit(cache=True)
+def simulate(high, low, close, sig_bar, sig_dir, sig_px, sig_tp, sig_sl,
+             margin, leverage, fee_rate, initial_equity,
+             max_open, skip_if_pending, cancel_when_tp_passed, expire_bars):
+    """
+    单标的单策略撮合状态机
+    :param sig_bar: 信号所在K线序号（升序），该K线收盘后挂单，下一根K线开始撮合
+    :param sig_dir: 1 做多 / -1 做空
+    :param max_open: 持仓+挂单数量上限（加仓上限），0 表示不限制
+    :param expire_bars: 挂单过期K线数，0 表示不过期
+    :return: (entry_bar, exit_bar, exit_px, reason, ambiguous, pnl, close_order, n_trades, equity)
+             按信号序号索引；entry_bar=-1 表示未成交/被跳过，close_order[:n_trades] 为平仓先后顺序
+    """
+    n = len(close)
+    m = len(sig_bar)
+    sz = np.zeros(m)
+    order_bars = np.zeros(m, dtype=np.int64)
+    entry_bar = np.full(m, -1, dtype=np.int64)
+    exit_bar = np.full(m, -1, dtype=np.int64)
+    exit_px = np.zeros(m)
+    reason = np.zeros(m, dtype=np.int8)
+    ambiguous = np.zeros(m, dtype=np.bool_)
+    pnl = np.zeros(m)
+    close_order = np.empty(m, dtype=np.int64)
+    pending = np.empty(m, dtype=np.int64)
+    positions = np.empty(m, dtype=np.int64)
+    equity = np.empty(n)
+    n_pending = 0
+    n_pos = 0
+    n_trades = 0
+    cash = initial_equity
+    j = 0
+
+    for i in range(n):
+        h, l, c = high[i], low[i], close[i]
+
+        # 1. 已有持仓的止盈止损
+        kept = 0
+        for k in range(n_pos):
+            s = positions[k]
+            code, both = _exit_code(sig_dir[s], h, l, sig_tp[s], sig_sl[s])
+            if code != EXIT_NONE:
+                px = sig_tp[s] if code == EXIT_TP else sig_sl[s]
+                fee = (sig_px[s] + px) * sz[s] * fee_rate
+                pnl[s] = (px - sig_px[s]) * sz[s] * sig_dir[s] - fee
+                cash += pnl[s]
+                exit_bar[s], exit_px[s], reason[s], ambiguous[s] = i, px, code, both
+                close_order[n_trades] = s
+                n_trades += 1
+            else:
+                positions[kept] = s
+                kept += 1
+        n_pos = kept
+
+        # 2. 挂单成交 / 撤单 / 过期
+        kept = 0
+        for k in range(n_pending):
+            s = pending[k]
+            order_bars[s] += 1
+            is_long = sig_dir[s] == 1
+            if (is_long and l <= sig_px[s]) or (not is_long and h >= sig_px[s]):
+                entry_bar[s] = i
+                code, both = _exit_code(sig_dir[s], h, l, sig_tp[s], sig_sl[s])
+                if code != EXIT_NONE:
+                    px = sig_tp[s] if code == EXIT_TP else sig_sl[s]
+                    fee = (sig_px[s] + px) * sz[s] * fee_rate
+                    pnl[s] = (px - sig_px[s]) * sz[s] * sig_dir[s] - fee
+                    cash += pnl[s]
+                    exit_bar[s], exit_px[s], reason[s], ambiguous[s] = i, px, code, both
+                    close_order[n_trades] = s
+                    n_trades += 1
+                else:
+                    positions[n_pos] = s
+                    n_pos += 1
+                continue
+            if cancel_when_tp_passed and ((is_long and c >= sig_tp[s]) or (not is_long and c <= sig_tp[s])):
+                continue
+            if expire_bars > 0 and order_bars[s] >= expire_bars:
+                continue
+            pending[kept] = s
+            kept += 1
+        n_pending = kept
+
+        # 3. 权益
+        unrealized = 0.0
+        for k in range(n_pos):
+            s = positions[k]
+            unrealized += (c - sig_px[s]) * sz[s] * sig_dir[s]
+        equity[i] = cash + unrealized
+
+        # 4. 本根K线收盘产生的信号挂单
+        while j < m and sig_bar[j] == i:
+            accept = True
+            if skip_if_pending and n_pending > 0:
+                accept = False
+            elif max_open > 0 and n_pos + n_pending >= max_open:
+                accept = False
+            elif sig_px[j] <= 0:
+                accept = False
+            if accept:
+                sz[j] = margin * leverage / sig_px[j]
+                pending[n_pending] = j
+                n_pending += 1
+            j += 1
+
+    return entry_bar, exit_bar, exit_px, reason, ambiguous, pnl, close_order, n_trades, equity
+
+
+# ========== 2. 封装 ==========
+def signals_to_arrays(signals: List[Dict], timestamp: np.ndarray) -> Dict[str, np.ndarray]:
+    """将统一格式信号列表转换为内核输入数组（信号时间戳映射为K线序号）"""
+    sig_ts = np.array([s['timestamp'] for s in signals], dtype=np.int64)
+    order = np.argsort(sig_ts, kind="stable")
+    return {
+        'sig_bar': np.searchsorted(timestamp, sig_ts[order]).astype(np.int64),
+        'sig_dir': np.array([1 if signals[k]['signal'] == "LONG" else -1 for k in order], dtype=np.int64),
+        'sig_px': np.array([signals[k]['entry_price'] for k in order], dtype=np.float64),
+        'sig_tp': np.array([signals[k]['take_profit'] for k in order], dtype=np.float64),
+        'sig_sl': np.array([signals[k]['stop_loss'] for k in order], dtype=np.float64),
+    }
+
+
+def run_path_backtest(arrays: Dict[str, np.ndarray], sig: Dict[str, np.ndarray],
+                      margin: float = MARGIN, leverage: float = LEVERAGE, fee_rate: float = FEE_RATE,
+                      initial_equity: float = INITIAL_EQUITY, max_open: int = 0,
+                      skip_if_pending: bool = True, cancel_when_tp_passed: bool = True,
+                      expire_bars: Optional[int] = None) -> Dict:
+    """
+    运行内核并整理结果
+    :param arrays: candle_archive.to_arrays 的输出
+    :param sig: signals_to_arrays 的输出（或直接由向量化信号构造）
+    :return: {'trades': 按平仓顺序的交易数组, 'equity': 每根K线权益, 统计字段...}
+    """
+    (entry_bar, exit_bar, exit_px, reason, ambiguous, pnl,
+     close_order, n_trades, equity) = simulate(
+        arrays['high'], arrays['low'], arrays['close'],
+        sig['sig_bar'], sig['sig_dir'], sig['sig_px'], sig['sig_tp'], sig['sig_sl'],
+        float(margin), float(leverage), float(fee_rate), float(initial_equity),
+        int(max_open), bool(skip_if_pending), bool(cancel_when_tp_passed), int(expire_bars or 0))
+    closed = close_order[:n_trades]
+    trade_pnl = pnl[closed]
+    peak = np.maximum.accumulate(equity) if len(equity) else equity
+    drawdown = np.where(peak > 0, (peak - equity) / np.where(peak > 0, peak, 1), 0.0)
+    return {
+        'trades': {
+            'signal': closed, 'entry_bar': entry_bar[closed], 'exit_bar': exit_bar[closed],
+            'exit_price': exit_px[closed], 'reason': reason[closed], 'pnl': trade_pnl,
+        },
+        'equity': equity,
+        'trades_count': int(n_trades),
+        'win_rate': float((trade_pnl > 0).mean()) if n_trades else 0.0,
+        'total_pnl': float(trade_pnl.sum()),
+        'max_drawdown': float(drawdown.max()) if len(drawdown) else 0.0,
+        'ambiguous_exits': int(ambiguous.sum()),
+        'open_positions': int(((entry_bar >= 0) & (exit_bar < 0)).sum()),
+    }
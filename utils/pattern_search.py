@@ -0,0 +1,197 @@
+"""
+任务名称
+name: 大振幅K线相似形态检索
+定时规则
+cron: 35 0 * * *
+历史相似形态检索（最近邻）
+出现大振幅K线时，在归档中查找与最近 window 根K线形态最相似的历史窗口，并统计这些窗口之后的走势。
+- 每个滑动窗口的特征向量：窗口内各K线开高低收相对窗口末收盘价的百分比（保留振幅信息），
+  可追加 FeatureStore 的特征列（如 range_perc）
+- 检索为分块的向量化暴力搜索（||x||² - 2x·q + ||q||²），纯 numpy、离线、仅CPU，
+  百万级窗口单次 top-k 查询为毫秒级，内存占用由块大小控制
+- 只返回“之后走势已完全发生在查询K线之前”的历史窗口，避免用到未来数据
+"""
+import os
+import sys
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles, to_arrays
+from utils.feature_store import FeatureStore
+from utils.okx_utils import get_shanghai_time
+
+# ========== 检索参数 ==========
+WINDOW = 12  # 窗口K线数（5m x 12 = 1小时）
+HORIZONS = (1, 3, 6, 12, 48)  # 统计之后 h 根K线的收益率
+TOP_K = 20
+BLOCK_SIZE = 262144  # 每块窗口数，控制 (查询数 x 块大小) 距离矩阵的内存
+
+# 报告任务：标的、周期、追加的特征列、大振幅判定分位
+PRESETS = [
+    {'inst_id': "ETH-USDT-SWAP", 'bar': "5m", 'features': ('range_perc',), 'quantile': 0.99},
+    {'inst_id': "VINE-USDT-SWAP", 'bar': "5m", 'features': ('range_perc',), 'quantile': 0.99},
+]
+
+
+# ========== 1. 索引 ==========
+class PatternIndex:
+    """单标的单周期的滑动窗口特征向量索引，第 r 行对应以第 r+window-1 根K线结尾的窗口"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], window: int = WINDOW,
+                 features: Optional[Dict[str, np.ndarray]] = None, feature_weight: float = 1.0,
+                 horizons: Sequence[int] = HORIZONS, block_size: int = BLOCK_SIZE):
+        """
+        :param arrays: candle_archive.to_arrays 的输出
+        :param features: 与 arrays 逐行对齐的特征列（如 FeatureStore.load 的结果），追加到特征向量
+        :param feature_weight: 特征列相对价格形态的权重
+        """
+        self.arrays = arrays
+        self.window = window
+        self.horizons = tuple(horizons)
+        self.block_size = block_size
+        self.vectors = self._build(arrays, window, features, feature_weight)
+        self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+
+    @staticmethod
+    def _build(arrays, window, features, feature_weight) -> np.ndarray:
+        close = arrays['close']
+        if len(close) < window:
+            return np.empty((0, 4 * window), dtype=np.float32)
+        ref = close[window - 1:, None]
+        parts = [(sliding_window_view(arrays[col], window) / ref - 1) * 100
+                 for col in ('open', 'high', 'low', 'close')]
+        for name, column in (features or {}).items():
+            if name == 'timestamp':
+                continue
+            parts.append(np.nan_to_num(sliding_window_view(column, window)) * feature_weight)
+        return np.concatenate(parts, axis=1).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def row_of(self, bar_index: int) -> int:
+        """以第 bar_index 根K线结尾的窗口所在行"""
+        return bar_index - self.window + 1
+
+    # ---------- 检索 ----------
+    def search(self, queries: np.ndarray, k: int = TOP_K, max_end: Optional[np.ndarray] = None):
+        """
+        批量 top-k 检索（欧氏距离）
+        :param queries: (m, d) 查询向量
+        :param max_end: (m,) 每个查询允许的最大窗口末K线序号（含），None 表示不限制
+        :return: (行号 (m, k), 距离 (m, k))，按距离升序；候选不足时行号为 -1、距离为 inf
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        m = len(queries)
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        best_rows = np.full((m, k), -1, dtype=np.int64)
+        best_dist = np.full((m, k), np.inf, dtype=np.float32)
+        max_row = None if max_end is None else np.asarray(max_end, dtype=np.int64) - self.window + 1
+        for start in range(0, len(self.vectors), self.block_size):
+            stop = min(len(self.vectors), start + self.block_size)
+            if max_row is not None and max_row.max() < start:
+                break
+            dist = self.sq_norms[None, start:stop] - 2 * queries @ self.vectors[start:stop].T
+            dist += q_norms[:, None]
+            if max_row is not None:
+                dist[np.arange(start, stop)[None, :] > max_row[:, None]] = np.inf
+            # 块内 top-k 与已有结果合并后再取 top-k
+            kk = min(k, stop - start)
+            part = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+            rows = np.concatenate([best_rows, part + start], axis=1)
+            dists = np.concatenate([best_dist, np.take_along_axis(dist, part, axis=1)], axis=1)
+            keep = np.argpartition(dists, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_dist = np.take_along_axis(dists, keep, axis=1)
+        order = np.argsort(best_dist, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_dist = np.take_along_axis(best_dist, order, axis=1)
+        best_rows[~np.isfinite(best_dist)] = -1
+        return best_rows, np.sqrt(np.maximum(best_dist, 0))
+
+    def query(self, bar_index: int, k: int = TOP_K) -> Dict[str, np.ndarray]:
+        """
+        查找与以第 bar_index 根K线结尾的窗口最相似的历史窗口，
+        只考虑之后 max(horizons) 根K线在 bar_index 之前（含）已走完的窗口
+        :return: {'end_index', 'timestamp', 'distance', 'forward': {h: 收益率数组}}
+        """
+        row = self.row_of(bar_index)
+        if row < 0:
+            raise ValueError(f"bar_index {bar_index} 之前不足 {self.window} 根K线")
+        max_end = bar_index - max(self.horizons)
+        rows, dist = self.search(self.vectors[row], k, max_end=np.array([max_end]))
+        valid = rows[0] >= 0
+        return self.outcomes(rows[0][valid] + self.window - 1, dist[0][valid])
+
+    def outcomes(self, end_index: np.ndarray, distance: np.ndarray) -> Dict[str, np.ndarray]:
+        """历史窗口之后各 horizon 根K线的收益率（数据不足时为 NaN）"""
+        close, n = self.arrays['close'], len(self.arrays['close'])
+        forward = {}
+        for h in self.horizons:
+            later = end_index + h
+            ret = np.full(len(end_index), np.nan)
+            ok = later < n
+            ret[ok] = close[later[ok]] / close[end_index[ok]] - 1
+            forward[h] = ret
+        return {
+            'end_index': end_index,
+            'timestamp': self.arrays['timestamp'][end_index],
+            'distance': distance,
+            'forward': forward,
+        }
+
+
+def summarize_outcomes(result: Dict) -> Dict[int, Dict]:
+    """相似窗口之后的收益率统计（上涨比例为收益率 > 0 的比例）"""
+    summary = {}
+    for h, ret in result['forward'].items():
+        ret = ret[~np.isnan(ret)]
+        summary[h] = {
+            'count': len(ret),
+            'mean': float(ret.mean()) if len(ret) else 0.0,
+            'median': float(np.median(ret)) if len(ret) else 0.0,
+            'up_rate': float((ret > 0).mean()) if len(ret) else 0.0,
+        }
+    return summary
+
+
+def main():
+    """对各标的最近一根大振幅K线检索历史相似形态并输出之后走势"""
+    store = FeatureStore(DATA_DIR)
+    for preset in PRESETS:
+        inst_id, bar = preset['inst_id'], preset['bar']
+        arrays = to_arrays(load_candles(inst_id, bar, DATA_DIR))
+        if len(arrays['close']) < WINDOW + max(HORIZONS):
+            print(f"[{get_shanghai_time()}] [PATTERN] {inst_id}-{bar}: 归档K线不足，跳过")
+            continue
+        # 与归档K线逐行对齐（按时间戳），bar_index 同时用于特征与K线
+        columns = store.load_aligned(inst_id, bar, arrays)
+        features = {name: columns[name] for name in preset['features']}
+        index = PatternIndex(arrays, features=features)
+
+        range_perc = columns['range_perc']
+        threshold = np.nanquantile(range_perc, preset['quantile'])
+        big = np.flatnonzero(range_perc > threshold)
+        big = big[big >= WINDOW + max(HORIZONS)]
+        if not len(big):
+            print(f"[{get_shanghai_time()}] [PATTERN] {inst_id}-{bar}: 无大振幅K线，跳过")
+            continue
+        bar_index = int(big[-1])
+        started = time.perf_counter()
+        result = index.query(bar_index)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"[{get_shanghai_time()}] [PATTERN] {inst_id}-{bar} 大振幅K线 ts={int(arrays['timestamp'][bar_index])} "
+              f"振幅 {range_perc[bar_index]:.2f}% (> p{preset['quantile'] * 100:.0f} {threshold:.2f}%), "
+              f"在 {len(index)} 个窗口中检索 top-{len(result['end_index'])} 耗时 {elapsed:.1f}ms")
+        for h, stats in summarize_outcomes(result).items():
+            print(f"  - 之后 {h} 根K线: 平均收益 {stats['mean'] * 100:.3f}%, 中位数 {stats['median'] * 100:.3f}%, "
+                  f"上涨比例 {stats['up_rate'] * 100:.1f}% (样本 {stats['count']})")
+
+
+if __name__ == "__main__":
+    main()
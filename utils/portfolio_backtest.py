@@ -0,0 +1,273 @@
+"""
+任务名称
+name: 多标的组合回测报告
+定时规则
+cron: 45 0 * * *
+多标的组合回测：各账户以全仓（tdMode: cross）同时交易多个永续合约，
+单标的回测无法反映共享保证金与同步回撤。
+- 各标的的信号生成相互独立，在进程池中并行完成（每个进程只返回K线价格列数组和信号）
+- 主进程按时间戳归并所有标的的K线，经同一个保证金/权益账本依次撮合
+- 可选：按滚动收益相关性拒绝与已有同向持仓高度相关的新委托
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles
+from utils.strategy_adapter import ADAPTER_FACTORIES, MultiStrategyEvaluator
+from utils.backtester import BacktestBroker, summarize
+from utils.rolling_correlation import RollingCovariance
+from utils.okx_utils import get_shanghai_time
+
+# ========== 组合参数 ==========
+MAX_WORKERS = int(os.environ.get("PORTFOLIO_WORKERS", "0")) or None  # 默认使用全部CPU
+MAX_CORRELATION = None  # 与已有同向持仓/挂单的标的相关系数超过该值时拒绝委托，None 表示不检查
+
+
+# ========== 1. 组合账本 ==========
+class PortfolioBroker(BacktestBroker):
+    """
+    全仓组合账本：挂单与持仓按标的分册存放，每根K线只撮合对应标的；
+    下单前检查可用保证金（权益 - 已占用保证金），不足时拒绝委托；
+    设置 max_correlation 时再检查与其他标的同向敞口的滚动相关性（由 merge_and_match 按时间戳更新）
+    """
+
+    def __init__(self, *args, max_correlation: Optional[float] = MAX_CORRELATION,
+                 correlation: Optional[RollingCovariance] = None, **kwargs):
+        self.books: Dict[str, Dict[str, List[Dict]]] = {}
+        super().__init__(*args, **kwargs)
+        self.rejected_orders = 0  # 因保证金不足被拒绝的委托数
+        self.max_correlation = max_correlation
+        self.correlation = correlation or RollingCovariance()
+        self.correlated_rejects = 0  # 因相关性过高被拒绝的委托数
+
+    def _book(self, inst_id: str) -> Dict[str, List[Dict]]:
+        if inst_id not in self.books:
+            self.books[inst_id] = {'positions': [], 'pending': []}
+        return self.books[inst_id]
+
+    # positions / pending_orders 对外仍表现为列表，兼容 summarize 与检查点
+    @property
+    def positions(self) -> List[Dict]:
+        return [p for book in self.books.values() for p in book['positions']]
+
+    @positions.setter
+    def positions(self, positions: List[Dict]):
+        for book in self.books.values():
+            book['positions'] = []
+        for position in positions:
+            self._book(position['inst_id'])['positions'].append(position)
+
+    @property
+    def pending_orders(self) -> List[Dict]:
+        return [o for book in self.books.values() for o in book['pending']]
+
+    @pending_orders.setter
+    def pending_orders(self, orders: List[Dict]):
+        for book in self.books.values():
+            book['pending'] = []
+        for order in orders:
+            self._book(order['inst_id'])['pending'].append(order)
+
+    def used_margin(self) -> float:
+        """已占用保证金：持仓与未成交委托各占一份保证金"""
+        return self.margin * sum(len(b['positions']) + len(b['pending']) for b in self.books.values())
+
+    def submit(self, signal: Dict) -> Optional[Dict]:
+        book = self._book(signal['inst_id'])
+        if self.skip_if_pending and any(o['strategy'] == signal['strategy'] for o in book['pending']):
+            return None
+        if self.equity() - self.used_margin() < self.margin:
+            self.rejected_orders += 1
+            return None
+        if self._too_correlated(signal):
+            self.correlated_rejects += 1
+            return None
+        order = self._new_order(signal)
+        if order:
+            book['pending'].append(order)
+        return order
+
+    def _too_correlated(self, signal: Dict) -> bool:
+        """其他标的存在同向持仓或挂单，且与本标的滚动相关系数超过 max_correlation"""
+        if self.max_correlation is None:
+            return False
+        for inst_id, book in self.books.items():
+            if inst_id == signal['inst_id']:
+                continue
+            if not any(o['pos_side'] == signal['pos_side'] for o in book['positions'] + book['pending']):
+                continue
+            corr = self.correlation.get(signal['inst_id'], inst_id)
+            if corr is not None and corr > self.max_correlation:
+                return True
+        return False
+
+    def on_bar(self, inst_id: str, kline, record_equity: bool = True) -> List[Dict]:
+        """只撮合该标的分册；组合回测中权益按时间戳统一记录（record_equity=False）"""
+        closed_before = len(self.trades)
+        book = self.books.get(inst_id)
+        if book and (book['positions'] or book['pending']):
+            book['positions'], book['pending'] = self._match(inst_id, kline, book['positions'], book['pending'])
+        self.last_prices[inst_id] = float(kline[4])
+        if record_equity:
+            self.equity_curve.append([int(kline[0]), self.equity()])
+        return self.trades[closed_before:]
+
+    def get_state(self) -> Dict:
+        state = super().get_state()
+        state['rejected_orders'] = self.rejected_orders
+        state['correlated_rejects'] = self.correlated_rejects
+        state['correlation'] = self.correlation.get_state()
+        return state
+
+    def set_state(self, state: Dict):
+        super().set_state(state)
+        self.rejected_orders = state.get('rejected_orders', 0)
+        self.correlated_rejects = state.get('correlated_rejects', 0)
+        if 'correlation' in state:
+            self.correlation.set_state(state['correlation'])
+
+
+# ========== 2. 单标的信号生成（子进程） ==========
+def generate_signals(task: Tuple) -> Dict:
+    """
+    子进程入口：读取一个标的的归档K线并运行策略评估器
+    :param task: (inst_id, bar, 策略名称列表, data_dir, start_ts, end_ts)
+                 策略按名称在 ADAPTER_FACTORIES 中构建，标的由任务指定
+    :return: {'inst_id', 'timestamp', 'high', 'low', 'close', 'signals': {K线序号: [信号]}}
+    """
+    inst_id, bar, names, data_dir, start_ts, end_ts = task
+    adapters = []
+    for name in names:
+        adapter = ADAPTER_FACTORIES[name]()
+        adapter.inst_id = inst_id
+        adapters.append(adapter)
+    evaluator = MultiStrategyEvaluator(adapters)
+    klines = load_candles(inst_id, bar, data_dir, start_ts, end_ts)
+    n = len(klines)
+    result = {
+        'inst_id': inst_id,
+        'timestamp': np.empty(n, dtype=np.int64),
+        'high': np.empty(n), 'low': np.empty(n), 'close': np.empty(n),
+        'signals': {}
+    }
+    for i, kline in enumerate(klines):
+        result['timestamp'][i] = int(kline[0])
+        result['high'][i] = float(kline[2])
+        result['low'][i] = float(kline[3])
+        result['close'][i] = float(kline[4])
+        signals = evaluator.feed(kline)
+        if signals:
+            # 账本不使用策略原始输出，去掉以减少进程间传输
+            result['signals'][i] = [dict(s, raw={}) for s in signals]
+    return result
+
+
+# ========== 3. 按时间戳归并撮合 ==========
+def merge_and_match(results: List[Dict], broker: PortfolioBroker) -> PortfolioBroker:
+    """
+    将各标的结果按 (时间戳, 标的顺序) 归并后依次撮合；
+    同一时间戳内先撮合全部标的再提交各自的新信号，权益每个时间戳记录一次；
+    提交新信号前以各标的最新价更新滚动相关性
+    """
+    if not results:
+        return broker
+    ts_all = np.concatenate([r['timestamp'] for r in results])
+    if not len(ts_all):
+        # 所有标的都没有K线（如归档为空）
+        return broker
+    inst_all = np.concatenate([np.full(len(r['timestamp']), k, dtype=np.int32) for k, r in enumerate(results)])
+    idx_all = np.concatenate([np.arange(len(r['timestamp'])) for r in results])
+    order = np.lexsort((inst_all, ts_all))
+    # 转为Python列表后逐个访问，避免逐元素读取numpy标量的开销
+    columns = [(r['inst_id'], r['high'].tolist(), r['low'].tolist(), r['close'].tolist(), r['signals'])
+               for r in results]
+
+    current_ts, pending_signals = None, []
+    for ts, k, i in zip(ts_all[order].tolist(), inst_all[order].tolist(), idx_all[order].tolist()):
+        if ts != current_ts:
+            if current_ts is not None:
+                broker.correlation.update(current_ts, broker.last_prices)
+                for signal in pending_signals:
+                    broker.submit(signal)
+                broker.equity_curve.append([current_ts, broker.equity()])
+            current_ts, pending_signals = ts, []
+        inst_id, high, low, close, signals = columns[k]
+        book = broker.books.get(inst_id)
+        if book and (book['positions'] or book['pending']):
+            broker.on_bar(inst_id, (ts, close[i], high[i], low[i], close[i]), record_equity=False)
+        else:
+            # 无挂单无持仓的标的只需更新最新价
+            broker.last_prices[inst_id] = close[i]
+        if i in signals:
+            pending_signals.extend(signals[i])
+    broker.correlation.update(current_ts, broker.last_prices)
+    for signal in pending_signals:
+        broker.submit(signal)
+    broker.equity_curve.append([current_ts, broker.equity()])
+    return broker
+
+
+def run_portfolio(specs: Sequence[Tuple[str, str, Sequence[str]]], data_dir: str = DATA_DIR,
+                  start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+                  broker: Optional[PortfolioBroker] = None,
+                  max_workers: Optional[int] = MAX_WORKERS) -> PortfolioBroker:
+    """
+    组合回测入口
+    :param specs: [(inst_id, bar, [策略名称])]，不同周期的K线同样按时间戳归并
+    """
+    tasks = [(inst_id, bar, list(names), data_dir, start_ts, end_ts) for inst_id, bar, names in specs]
+    broker = broker or PortfolioBroker()
+    if max_workers == 1 or len(tasks) <= 1:
+        results = [generate_signals(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(generate_signals, tasks))
+    bars = sum(len(r['timestamp']) for r in results)
+    signals = sum(len(s) for r in results for s in r['signals'].values())
+    print(f"[{get_shanghai_time()}] [PORTFOLIO] {len(tasks)} 个标的, {bars} 根K线, {signals} 个信号, 开始归并撮合")
+    return merge_and_match(results, broker)
+
+
+def portfolio_report(broker: PortfolioBroker) -> Dict:
+    """组合统计：在 summarize 基础上增加按标的统计与拒单数"""
+    report = summarize(broker)
+    by_inst = {}
+    for t in broker.trades:
+        stat = by_inst.setdefault(t['inst_id'], {'trades': 0, 'wins': 0, 'pnl': 0.0})
+        stat['trades'] += 1
+        stat['wins'] += 1 if t['pnl'] > 0 else 0
+        stat['pnl'] += t['pnl']
+    report['by_inst'] = by_inst
+    report['rejected_orders'] = broker.rejected_orders
+    report['correlated_rejects'] = broker.correlated_rejects
+    report['correlation'] = broker.correlation.to_table()
+    return report
+
+
+def main():
+    """以实盘策略的默认标的组成组合，输出共享保证金下的回测报告"""
+    groups = {}
+    for name, factory in ADAPTER_FACTORIES.items():
+        adapter = factory()
+        groups.setdefault((adapter.inst_id, adapter.bar), []).append(name)
+    broker = run_portfolio([(inst_id, bar, names) for (inst_id, bar), names in groups.items()])
+    report = portfolio_report(broker)
+    print(f"[{get_shanghai_time()}] [REPORT] 组合: 交易 {report['trades']} 笔, "
+          f"胜率 {report['win_rate'] * 100:.2f}%, 总盈亏 {report['total_pnl']:.4f} USDT, "
+          f"权益 {report['equity']:.4f}, 最大回撤 {report['max_drawdown'] * 100:.2f}%, "
+          f"保证金不足拒单 {report['rejected_orders']} 笔")
+    for inst_id, stat in report['by_inst'].items():
+        print(f"  - {inst_id}: 交易 {stat['trades']} 笔, 盈利 {stat['wins']} 笔, 盈亏 {stat['pnl']:.4f} USDT")
+    for inst_id, row in report['correlation'].items():
+        others = ", ".join(f"{other} {corr:+.2f}" for other, corr in row.items() if other != inst_id)
+        print(f"  - 最近 {broker.correlation.window} 根K线收益相关性 {inst_id}: {others}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+任务名称
+name: 振幅分位数阈值报告
+定时规则
+cron: 30 0 * * *
+流式分位数估计（P² 算法）
+RANGE2_THRESHOLD = 1.9、AMPLITUDE_PERC = 1.7 这类固定阈值在平静期和剧烈波动期含义完全不同。
+这里对每个标的滚动跟踪实体振幅% / 总振幅%的分布，每根K线 O(1) 更新、常数内存，
+策略可以用“最近一段时间的第95百分位”代替固定百分比作为阈值。
+- P2Quantile: 单个分位数的 P² 估计器（5个标记点，不保存样本）
+- RollingQuantile: 两个交错重置的 P² 估计器实现近似滚动窗口
+- AmplitudeQuantiles / QuantileBook: 单标的 / 多标的振幅分位数
+"""
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles
+from utils.okx_utils import get_shanghai_time
+
+# ========== 默认参数 ==========
+DEFAULT_LEVELS = (0.5, 0.75, 0.9, 0.95, 0.99)  # 跟踪的分位数
+DEFAULT_WINDOW = 2016  # 滚动窗口K线数（5m x 2016 = 7天）
+MIN_SAMPLES = 288  # 样本数不足时阈值回退为固定值（5m x 288 = 1天）
+BELOW_RANGE, ABOVE_RANGE = 0.0, 1.0  # rank 超出跟踪分位范围时的返回值（只表示低于最小 / 高于最大跟踪分位）
+FEATURES = ('body_perc', 'range_perc')
+
+# 各脚本固定阈值，用于报告其在当前分布中的分位
+FIXED_THRESHOLDS = [
+    # (脚本, 标的, 特征, 阈值)
+    ("ethqa.py RANGE2_THRESHOLD", "ETH-USDT-SWAP", 'body_perc', 1.9),
+    ("ETH_大振幅反转v1.py AMPLITUDE_PERC", "ETH-USDT-SWAP", 'range_perc', 0.9),
+    ("ETH_大振幅反转v2.py AMPLITUDE_PERC", "ETH-USDT-SWAP", 'range_perc', 1.7),
+    ("VINE-5m-大振幅反转开仓策略.py RANGE2_THRESHOLD", "ETH-USDT-SWAP", 'range_perc', 4.2),
+]
+
+
+# ========== 1. P² 单分位数估计 ==========
+class P2Quantile:
+    """
+    P² 分位数估计（Jain & Chlamtac, 1985）
+    维护5个标记点（最小值、p/2、p、(1+p)/2、最大值）的高度与位置，每个样本 O(1) 调整，
+    前5个样本直接保存，之后不再保存任何样本
+    """
+
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def update(self, x: float):
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            q.append(x)
+            if self.count == 5:
+                q.sort()
+            return
+
+        # 1. 定位样本所在区间，必要时更新极值
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # 2. 调整中间3个标记点
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = self._parabolic(i, d)
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if self.count < 5:
+            ordered = sorted(self.heights)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return self.heights[2]
+
+    def get_state(self) -> Dict:
+        return {'p': self.p, 'count': self.count, 'heights': list(self.heights),
+                'positions': list(self.positions), 'desired': list(self.desired)}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "P2Quantile":
+        sketch = cls(state['p'])
+        sketch.count = state['count']
+        sketch.heights = list(state['heights'])
+        sketch.positions = list(state['positions'])
+        sketch.desired = list(state['desired'])
+        return sketch
+
+
+# ========== 2. 滚动窗口 ==========
+class RollingQuantile:
+    """
+    近似滚动分位数：两个 P² 估计器错开半个窗口启动，各自累计满 window 个样本后重置，
+    估计值取样本较多的那个，即始终覆盖最近 window/2 ~ window 根K线
+    """
+
+    def __init__(self, p: float, window: int = DEFAULT_WINDOW):
+        self.p = p
+        self.window = window
+        self.total = 0
+        self.sketches = [P2Quantile(p)]
+
+    def update(self, x: float):
+        self.total += 1
+        if self.total == self.window // 2 + 1 and len(self.sketches) == 1:
+            self.sketches.append(P2Quantile(self.p))
+        for i, sketch in enumerate(self.sketches):
+            if sketch.count >= self.window:
+                sketch = self.sketches[i] = P2Quantile(self.p)
+            sketch.update(x)
+
+    @property
+    def count(self) -> int:
+        return max(sketch.count for sketch in self.sketches)
+
+    def value(self) -> Optional[float]:
+        return max(self.sketches, key=lambda s: s.count).value()
+
+    def get_state(self) -> Dict:
+        return {'p': self.p, 'window': self.window, 'total': self.total,
+                'sketches': [sketch.get_state() for sketch in self.sketches]}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "RollingQuantile":
+        rolling = cls(state['p'], state['window'])
+        rolling.total = state['total']
+        rolling.sketches = [P2Quantile.from_state(s) for s in state['sketches']]
+        return rolling
+
+
+class RollingDistribution:
+    """同一序列的多个滚动分位数，可估计任意值在当前分布中的分位"""
+
+    def __init__(self, levels: Sequence[float] = DEFAULT_LEVELS, window: int = DEFAULT_WINDOW):
+        self.levels = tuple(sorted(levels))
+        self.quantiles = {p: RollingQuantile(p, window) for p in self.levels}
+
+    def update(self, x: float):
+        for rolling in self.quantiles.values():
+            rolling.update(x)
+
+    @property
+    def count(self) -> int:
+        return self.quantiles[self.levels[0]].count
+
+    def quantile(self, p: float) -> Optional[float]:
+        """p 需为跟踪的分位数之一"""
+        return self.quantiles[p].value()
+
+    def rank(self, x: float) -> Optional[float]:
+        """
+        x 在当前分布中的近似分位（相邻跟踪分位数之间线性插值）
+        低于最小跟踪分位时返回 BELOW_RANGE，高于最大跟踪分位时返回 ABOVE_RANGE（范围外无法插值）
+        """
+        values = [self.quantiles[p].value() for p in self.levels]
+        if values[0] is None:
+            return None
+        if x < values[0]:
+            return BELOW_RANGE
+        if x == values[0]:
+            return self.levels[0]
+        for i in range(1, len(values)):
+            if x <= values[i]:
+                span = values[i] - values[i - 1]
+                frac = (x - values[i - 1]) / span if span > 0 else 1.0
+                return self.levels[i - 1] + frac * (self.levels[i] - self.levels[i - 1])
+        return ABOVE_RANGE
+
+    def get_state(self) -> Dict:
+        return {str(p): rolling.get_state() for p, rolling in self.quantiles.items()}
+
+    def set_state(self, state: Dict):
+        self.quantiles = {float(p): RollingQuantile.from_state(s) for p, s in state.items()}
+        self.levels = tuple(sorted(self.quantiles))
+
+
+# ========== 3. 振幅分位数 ==========
+class AmplitudeQuantiles:
+    """单个标的的实体振幅% / 总振幅%滚动分位数（计算方式与 feature_store.compute_bar_shape 一致）"""
+
+    def __init__(self, levels: Sequence[float] = DEFAULT_LEVELS, window: int = DEFAULT_WINDOW,
+                 min_samples: int = MIN_SAMPLES):
+        self.min_samples = min_samples
+        self.last_ts = 0
+        self.dists = {name: RollingDistribution(levels, window) for name in FEATURES}
+
+    def update(self, kline) -> bool:
+        """
+        输入一根已完结K线（OKX格式），同一时间戳或更早的K线忽略
+        :return: 是否已更新
+        """
+        ts = int(kline[0])
+        if ts <= self.last_ts:
+            return False
+        o, h, l, c = float(kline[1]), float(kline[2]), float(kline[3]), float(kline[4])
+        self.dists['body_perc'].update(abs(c - o) / o * 100)
+        self.dists['range_perc'].update((h - l) / l * 100)
+        self.last_ts = ts
+        return True
+
+    def ready(self) -> bool:
+        return self.dists['range_perc'].count >= self.min_samples
+
+    def threshold(self, feature: str, p: float, default: Optional[float] = None) -> Optional[float]:
+        """
+        分位数阈值：样本不足 min_samples 时返回固定的 default
+        例: threshold('range_perc', 0.95, default=AMPLITUDE_PERC)
+        """
+        if not self.ready():
+            return default
+        return self.dists[feature].quantile(p)
+
+    def rank(self, feature: str, value: float) -> Optional[float]:
+        return self.dists[feature].rank(value) if self.ready() else None
+
+    def get_state(self) -> Dict:
+        return {'last_ts': self.last_ts, 'min_samples': self.min_samples,
+                'dists': {name: dist.get_state() for name, dist in self.dists.items()}}
+
+    def set_state(self, state: Dict):
+        self.last_ts = state['last_ts']
+        self.min_samples = state['min_samples']
+        for name, dist_state in state['dists'].items():
+            self.dists[name].set_state(dist_state)
+
+
+class QuantileBook:
+    """多标的振幅分位数（按 instId 惰性创建）"""
+
+    def __init__(self, levels: Sequence[float] = DEFAULT_LEVELS, window: int = DEFAULT_WINDOW,
+                 min_samples: int = MIN_SAMPLES):
+        self.levels, self.window, self.min_samples = tuple(levels), window, min_samples
+        self.instruments: Dict[str, AmplitudeQuantiles] = {}
+
+    def get(self, inst_id: str) -> AmplitudeQuantiles:
+        if inst_id not in self.instruments:
+            self.instruments[inst_id] = AmplitudeQuantiles(self.levels, self.window, self.min_samples)
+        return self.instruments[inst_id]
+
+    def update(self, inst_id: str, kline) -> bool:
+        return self.get(inst_id).update(kline)
+
+    def threshold(self, inst_id: str, feature: str, p: float, default: Optional[float] = None) -> Optional[float]:
+        return self.get(inst_id).threshold(feature, p, default)
+
+    def get_state(self) -> Dict:
+        return {inst_id: q.get_state() for inst_id, q in self.instruments.items()}
+
+    def set_state(self, state: Dict):
+        for inst_id, inst_state in state.items():
+            self.get(inst_id).set_state(inst_state)
+
+
+def main():
+    """按归档K线计算各标的当前振幅分位数，并给出各脚本固定阈值所处的分位"""
+    book = QuantileBook()
+    for inst_id in sorted({inst for _, inst, _, _ in FIXED_THRESHOLDS}):
+        klines = load_candles(inst_id, "5m", DATA_DIR)
+        for kline in klines:
+            book.update(inst_id, kline)
+        quantiles = book.get(inst_id)
+        if not quantiles.ready():
+            print(f"[{get_shanghai_time()}] [QUANTILE] {inst_id}: 归档K线不足 {MIN_SAMPLES} 根，跳过")
+            continue
+        for feature in FEATURES:
+            dist = quantiles.dists[feature]
+            values = ", ".join(f"p{int(p * 100)}={dist.quantile(p):.3f}%" for p in dist.levels)
+            print(f"[{get_shanghai_time()}] [QUANTILE] {inst_id} {feature}: {values}")
+    for script, inst_id, feature, value in FIXED_THRESHOLDS:
+        quantiles = book.get(inst_id)
+        rank = quantiles.rank(feature, value)
+        if rank is None:
+            continue
+        dist = quantiles.dists[feature]
+        if rank == BELOW_RANGE:
+            print(f"  - {script} = {value}% 低于最近分布的第 {dist.levels[0] * 100:.0f} 百分位")
+        elif rank == ABOVE_RANGE:
+            print(f"  - {script} = {value}% 高于最近分布的第 {dist.levels[-1] * 100:.0f} 百分位")
+        else:
+            print(f"  - {script} = {value}% 约为最近分布的第 {rank * 100:.1f} 百分位")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+任务名称
+name: 振幅分组统计报告
+定时规则
+cron: 0 5 * * 0
+振幅分组统计
+为在 K8 的 0.9%~3.5% 实体、ethqa 的 >1.9% 实体等阈值之间做选择，按小时（北京时间）、星期、
+波动率区间与标的分组，统计实体振幅% / 总振幅% / 上下影线% 的分布以及之后的延续收益（顺K线方向）。
+分组计算全部用 np.bincount（计数、求和、平方和、直方图）完成，不做逐行循环，全量归档重算为秒级。
+"""
+import os
+import sys
+import csv
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles, to_arrays
+from utils.feature_store import FeatureStore
+from utils.okx_utils import get_shanghai_time
+
+# ========== 统计参数 ==========
+HOUR_MS = 3600000
+TZ_OFFSET_HOURS = 8  # 按北京时间分组
+REGIME_WINDOW = 288  # 波动率区间：之前 288 根K线（5m 为1天）的平均总振幅
+REGIME_LABELS = ("低波动", "中波动", "高波动")  # 按各标的平均总振幅的三分位划分
+FOLLOW_BARS = (1, 3)  # 延续收益统计的K线数
+QUANTILES = (0.5, 0.9, 0.95)
+# 直方图分箱（%）：0~5% 每 0.02%，5%~20% 每 0.25%，超出范围计入首尾箱
+EDGES = np.r_[np.arange(0, 5, 0.02), np.arange(5, 20.001, 0.25)]
+
+# 各脚本阈值（特征, 下限, 上限）
+THRESHOLDS = {
+    'K8 实体0.9%~3.5%': ('body_perc', 0.9, 3.5),
+    'ethqa 实体>1.9%': ('body_perc', 1.9, np.inf),
+    'ETH v2 振幅>1.7%': ('range_perc', 1.7, np.inf),
+}
+
+INSTRUMENTS = ["ETH-USDT-SWAP", "VINE-USDT-SWAP", "DOGE-USDT-SWAP", "BTC-USDT-SWAP"]
+
+
+# ========== 1. 列与分组键 ==========
+def amplitude_columns(arrays: Dict[str, np.ndarray], features: Optional[Dict[str, np.ndarray]] = None
+                      ) -> Dict[str, np.ndarray]:
+    """
+    统计用的列（与 arrays 逐行对齐）
+    - body_perc / range_perc: 取自 FeatureStore 的 bar_shape 特征（未提供时现算）
+    - upper_wick_perc / lower_wick_perc: 上/下影线相对开盘价的百分比
+    - follow_{n}: 之后 n 根K线顺本K线方向的收益率%（十字星为 0，数据不足为 NaN）
+    """
+    o, h, l, c = arrays['open'], arrays['high'], arrays['low'], arrays['close']
+    if features is None:
+        features = {
+            'body_perc': np.abs(c - o) / o * 100,
+            'range_perc': (h - l) / l * 100,
+            'upper_wick': h - np.maximum(o, c),
+            'lower_wick': np.minimum(o, c) - l,
+        }
+    columns = {
+        'body_perc': features['body_perc'],
+        'range_perc': features['range_perc'],
+        'upper_wick_perc': features['upper_wick'] / o * 100,
+        'lower_wick_perc': features['lower_wick'] / o * 100,
+    }
+    direction = np.sign(c - o)
+    for n in FOLLOW_BARS:
+        follow = np.full(len(c), np.nan)
+        follow[:-n] = direction[:-n] * (c[n:] / c[:-n] - 1) * 100
+        columns[f'follow_{n}'] = follow
+    return columns
+
+
+def group_keys(timestamp: np.ndarray, range_perc: np.ndarray) -> Dict[str, Tuple[np.ndarray, List[str]]]:
+    """
+    分组键：{名称: (每行的组编号, 组标签)}
+    波动率区间只用之前的K线计算（首个窗口内记为 -1，不参与统计）
+    """
+    hours = timestamp // HOUR_MS + TZ_OFFSET_HOURS
+    hour = (hours % 24).astype(np.int64)
+    weekday = ((hours // 24 + 3) % 7).astype(np.int64)  # 1970-01-01 为星期四，星期一为 0
+
+    csum = np.r_[0.0, np.cumsum(np.nan_to_num(range_perc))]
+    regime = np.full(len(range_perc), -1, dtype=np.int64)
+    if len(range_perc) > REGIME_WINDOW:
+        prev_mean = (csum[REGIME_WINDOW:-1] - csum[:-REGIME_WINDOW - 1]) / REGIME_WINDOW
+        cuts = np.quantile(prev_mean, [1 / 3, 2 / 3])
+        regime[REGIME_WINDOW:] = np.searchsorted(cuts, prev_mean, side="right")
+    return {
+        'hour': (hour, [f"{h:02d}时" for h in range(24)]),
+        'weekday': (weekday, ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]),
+        'regime': (regime, list(REGIME_LABELS)),
+    }
+
+
+# ========== 2. 分组归约 ==========
+def group_reduce(values: np.ndarray, codes: np.ndarray, n_groups: int,
+                 mask: Optional[np.ndarray] = None, edges: np.ndarray = EDGES) -> Dict[str, np.ndarray]:
+    """
+    单列按组统计：计数、均值、标准差，以及由分组直方图得到的近似分位数
+    :param codes: 每行的组编号，负数表示不参与统计
+    :return: 各统计量为长度 n_groups 的数组
+    """
+    keep = (codes >= 0) & ~np.isnan(values)
+    if mask is not None:
+        keep &= mask
+    x, g = values[keep], codes[keep]
+    count = np.bincount(g, minlength=n_groups)
+    total = np.bincount(g, weights=x, minlength=n_groups)
+    sq = np.bincount(g, weights=x * x, minlength=n_groups)
+    safe = np.maximum(count, 1)
+    mean = total / safe
+    std = np.sqrt(np.maximum(sq / safe - mean ** 2, 0))
+    result = {'count': count, 'mean': np.where(count > 0, mean, np.nan), 'std': np.where(count > 0, std, np.nan)}
+
+    # 分组直方图：组编号 x 箱数 + 箱号，一次 bincount 得到全部组的直方图
+    n_bins = len(edges) - 1
+    bins = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, n_bins - 1)
+    hist = np.bincount(g * n_bins + bins, minlength=n_groups * n_bins).reshape(n_groups, n_bins)
+    cdf = np.cumsum(hist, axis=1)
+    for p in QUANTILES:
+        pos = np.argmax(cdf >= np.ceil(p * count)[:, None], axis=1)
+        result[f'p{int(p * 100)}'] = np.where(count > 0, edges[pos + 1], np.nan)
+    return result
+
+
+def threshold_reduce(columns: Dict[str, np.ndarray], codes: np.ndarray, n_groups: int,
+                     thresholds: Dict[str, Tuple[str, float, float]] = THRESHOLDS) -> Dict[str, Dict[str, np.ndarray]]:
+    """各阈值条件的按组命中率与命中K线之后的平均延续收益"""
+    valid = codes >= 0
+    total = np.maximum(np.bincount(codes[valid], minlength=n_groups), 1)
+    result = {}
+    for name, (feature, low, high) in thresholds.items():
+        hit = (columns[feature] >= low) & (columns[feature] <= high) & valid
+        stats = {'hit_rate': np.bincount(codes[hit], minlength=n_groups) / total}
+        for n in FOLLOW_BARS:
+            stats[f'follow_{n}'] = group_reduce(columns[f'follow_{n}'], codes, n_groups, mask=hit)['mean']
+        result[name] = stats
+    return result
+
+
+# ========== 3. 汇总表 ==========
+def regime_table(columns: Dict[str, np.ndarray], codes: np.ndarray, labels: Sequence[str],
+                 features: Sequence[str] = ('body_perc', 'range_perc', 'upper_wick_perc', 'lower_wick_perc'),
+                 thresholds: Dict[str, Tuple[str, float, float]] = THRESHOLDS) -> List[Dict]:
+    """按组汇总为表格行（每组一行）"""
+    n_groups = len(labels)
+    rows = [{'group': label} for label in labels]
+    for feature in features:
+        stats = group_reduce(columns[feature], codes, n_groups)
+        for i, row in enumerate(rows):
+            row['count'] = int(stats['count'][i])
+            row[f'{feature}_mean'] = round(float(stats['mean'][i]), 4)
+            for p in QUANTILES:
+                row[f'{feature}_p{int(p * 100)}'] = round(float(stats[f'p{int(p * 100)}'][i]), 4)
+    for name, stats in threshold_reduce(columns, codes, n_groups, thresholds).items():
+        for i, row in enumerate(rows):
+            row[f'{name}_hit%'] = round(float(stats['hit_rate'][i]) * 100, 3)
+            for n in FOLLOW_BARS:
+                row[f'{name}_follow{n}%'] = round(float(stats[f'follow_{n}'][i]), 4)
+    return rows
+
+
+def build_tables(arrays_by_inst: Dict[str, Dict[str, np.ndarray]], by: Sequence[str] = ('hour', 'weekday', 'regime'),
+                 features_by_inst: Optional[Dict[str, Dict[str, np.ndarray]]] = None) -> Dict[str, List[Dict]]:
+    """
+    多标的分组统计：每个分组维度一张表，另附 inst 表（按标的）
+    各标的的列与分组键分别计算后拼接，再统一做一次 bincount
+    """
+    inst_ids = [inst for inst, arrays in arrays_by_inst.items() if len(arrays['close'])]
+    parts, keys = [], {name: [] for name in by}
+    labels = {}
+    for inst_code, inst_id in enumerate(inst_ids):
+        arrays = arrays_by_inst[inst_id]
+        features = (features_by_inst or {}).get(inst_id)
+        columns = amplitude_columns(arrays, features)
+        columns['inst'] = np.full(len(arrays['close']), inst_code, dtype=np.int64)
+        parts.append(columns)
+        inst_keys = group_keys(arrays['timestamp'], columns['range_perc'])
+        for name in by:
+            keys[name].append(inst_keys[name][0])
+            labels[name] = inst_keys[name][1]
+    if not parts:
+        return {}
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    tables = {'inst': regime_table(merged, merged['inst'], inst_ids)}
+    for name in by:
+        tables[name] = regime_table(merged, np.concatenate(keys[name]), labels[name])
+    return tables
+
+
+def save_table(rows: List[Dict], path: str):
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    """对归档中的各标的 5m K线计算分组统计，输出摘要并写入 {DATA_DIR}/stats/"""
+    store = FeatureStore(DATA_DIR)
+    arrays_by_inst, features_by_inst = {}, {}
+    for inst_id in INSTRUMENTS:
+        arrays = to_arrays(load_candles(inst_id, "5m", DATA_DIR))
+        if not len(arrays['close']):
+            continue
+        arrays_by_inst[inst_id] = arrays
+        # 按时间戳与归档K线逐行对齐
+        features_by_inst[inst_id] = store.load_aligned(inst_id, "5m", arrays)
+    tables = build_tables(arrays_by_inst, features_by_inst=features_by_inst)
+    if not tables:
+        print(f"[{get_shanghai_time()}] [REGIME] 无归档K线")
+        return
+    for name, rows in tables.items():
+        save_table(rows, os.path.join(DATA_DIR, "stats", f"amplitude_by_{name}.csv"))
+    for name in ('inst', 'regime'):
+        print(f"[{get_shanghai_time()}] [REGIME] 按 {name} 分组:")
+        for row in tables[name]:
+            hits = ", ".join(f"{t} {row[f'{t}_hit%']:.2f}%/{row[f'{t}_follow3%']:+.3f}%" for t in THRESHOLDS)
+            print(f"  - {row['group']}: 样本 {row['count']}, 实体p50/p95 {row['body_perc_p50']:.2f}/{row['body_perc_p95']:.2f}%, "
+                  f"振幅p50/p95 {row['range_perc_p50']:.2f}/{row['range_perc_p95']:.2f}% | 命中率/3根延续 {hits}")
+
+
+if __name__ == "__main__":
+    main()
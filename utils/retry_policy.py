@@ -0,0 +1,204 @@
+"""
+统一重试策略
+原先 okx_utils / ethqa / okx_test_order / 通知服务各自复制了“固定间隔 sleep + 吞掉异常”的重试循环：
+交易所异常的一分钟内，每次调用都要阻塞 (MAX_RETRIES+1) x RETRY_DELAY 秒，且会一直尝试已经不可用的接口。
+这里统一为：
+- RetryPolicy: 按接口配置的指数退避（带抖动，避免多账户同时重试），可覆盖次数与最大间隔
+- Deadline: 单次运行的总截止时间，所有重试共享，到期后不再等待重试（脚本在 main() 开始时调用 start_run_deadline()，
+  未调用时不限，避免长时间运行的进程在导入后固定时间停止重试）
+- CircuitBreaker: 连续失败达到阈值后熔断，冷却期内直接失败（快速失败），冷却后放行一次试探请求
+"""
+import os
+import time
+import random
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# ========== 默认参数 ==========
+RUN_DEADLINE = float(os.environ.get("OKX_RUN_DEADLINE", "60"))  # 单次运行所有重试的总时限（秒），0 表示不限
+FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+RESET_TIMEOUT = 30.0  # 熔断冷却时间（秒）
+
+# 表示交易所服务异常（而非业务错误）的返回码：计入熔断失败次数
+# 50001 服务暂不可用 / 50004 接口请求超时 / 50011 请求过于频繁 / 50013 系统繁忙 / 50026 系统错误
+DEGRADED_CODES = ("50001", "50004", "50011", "50013", "50026")
+
+
+class CircuitOpenError(Exception):
+    """熔断中，请求未发出"""
+
+
+# ========== 1. 截止时间 ==========
+class Deadline:
+    """总截止时间（monotonic），seconds 为 None 或 <= 0 时不限"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+    def remaining(self) -> float:
+        return float("inf") if self.expires is None else self.expires - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_run_deadline = Deadline(None)  # 调用 start_run_deadline() 之前不限
+
+
+def start_run_deadline(seconds: Optional[float] = RUN_DEADLINE) -> Deadline:
+    """开始（或重新开始）本次运行的总时限：各脚本 main() 开始时、等待K线收盘之后"""
+    global _run_deadline
+    _run_deadline = Deadline(seconds)
+    return _run_deadline
+
+
+def run_deadline() -> Deadline:
+    return _run_deadline
+
+
+# ========== 2. 熔断器 ==========
+class CircuitBreaker:
+    """
+    连续失败计数熔断器（线程安全，多账户线程共享）
+    closed: 正常放行；open: 冷却期内拒绝；冷却结束后 half_open 放行一次试探，成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.probing:
+                    print(f"[retry_policy] [{self.name}] 连续失败 {self.failures} 次，熔断 {self.reset_timeout:.0f}秒")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# ========== 3. 重试策略 ==========
+def okx_success(result: Any) -> bool:
+    """OKX 接口返回 code == '0'"""
+    return isinstance(result, dict) and result.get('code') == '0'
+
+
+def okx_degraded(result: Any) -> bool:
+    """无响应或服务异常返回码（业务错误不计入熔断）"""
+    return not isinstance(result, dict) or str(result.get('code')) in DEGRADED_CODES
+
+
+class RetryPolicy:
+    """
+    单类接口的重试策略
+    第 n 次重试前等待 min(max_delay, base_delay x multiplier^n)，按 jitter 比例随机缩短
+    """
+
+    def __init__(self, name: str, attempts: int = 4, base_delay: float = 0.2, max_delay: float = 2.0,
+                 multiplier: float = 2.0, jitter: float = 0.5, breaker: Optional[CircuitBreaker] = None,
+                 is_success: Callable[[Any], bool] = okx_success, is_degraded: Callable[[Any], bool] = okx_degraded):
+        self.name = name
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.breaker = breaker
+        self.is_success = is_success
+        self.is_degraded = is_degraded
+
+    def delay(self, retry: int, max_delay: Optional[float] = None) -> float:
+        delay = min(self.max_delay if max_delay is None else max_delay, self.base_delay * self.multiplier ** retry)
+        return delay * (1 - self.jitter * random.random())
+
+    def call(self, fn: Callable[[], Any], attempts: Optional[int] = None, max_delay: Optional[float] = None,
+             deadline: Optional[Deadline] = None, is_success: Optional[Callable[[Any], bool]] = None,
+             label: str = "", reraise: bool = False) -> Any:
+        """
+        执行 fn()，直到 is_success(结果) 为真、次数用完、截止时间已到或熔断
+        :param attempts / max_delay: 覆盖策略的总次数与最大间隔（兼容原 max_retries + 1 / retry_delay 参数）
+        :param deadline: 默认为本次运行的总时限
+        :param reraise: 最后一次为异常（或熔断）时抛出，否则返回 None
+        :return: 成功的结果，或最后一次的结果
+        """
+        attempts = attempts or self.attempts
+        deadline = deadline or _run_deadline
+        is_success = is_success or self.is_success
+        tag = f"[retry_policy] [{self.name}]{' ' + label if label else ''}"
+        result, error = None, None
+        for attempt in range(attempts):
+            if self.breaker is not None and not self.breaker.allow():
+                print(f"{tag} {self.breaker.name} 熔断中，放弃请求")
+                error = CircuitOpenError(f"{self.breaker.name} 熔断中")
+                break
+            try:
+                result, error = fn(), None
+            except Exception as e:
+                result, error = None, e
+                print(f"{tag} 异常 (尝试 {attempt + 1}/{attempts}): {e}")
+            if self.breaker is not None:
+                if error is not None or self.is_degraded(result):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+            if error is None and is_success(result):
+                return result
+            if attempt + 1 >= attempts:
+                break
+            wait = self.delay(attempt, max_delay)
+            if wait >= deadline.remaining():
+                print(f"{tag} 已到本次运行截止时间，停止重试")
+                break
+            time.sleep(wait)
+        if error is not None and reraise:
+            raise error
+        return result
+
+
+# ========== 4. 各接口策略 ==========
+OKX_BREAKER = CircuitBreaker("OKX")
+BARK_BREAKER = CircuitBreaker("Bark", failure_threshold=3, reset_timeout=60.0)
+
+POLICIES: Dict[str, RetryPolicy] = {
+    # 查询类：未成交订单、订单详情
+    'okx_query': RetryPolicy('okx_query', attempts=4, base_delay=0.2, max_delay=2.0, breaker=OKX_BREAKER),
+    # 交易类：下单 / 撤单，间隔更短
+    'okx_trade': RetryPolicy('okx_trade', attempts=4, base_delay=0.1, max_delay=1.0, breaker=OKX_BREAKER),
+    # 行情类：K线
+    'okx_market': RetryPolicy('okx_market', attempts=4, base_delay=0.2, max_delay=2.0, breaker=OKX_BREAKER),
+    # 通知：HTTP 200 视为成功
+    'bark': RetryPolicy('bark', attempts=4, base_delay=0.5, max_delay=2.0, breaker=BARK_BREAKER,
+                        is_success=lambda r: getattr(r, 'status_code', None) == 200,
+                        is_degraded=lambda r: getattr(r, 'status_code', 500) >= 500),
+}
+
+
+def get_policy(name: str) -> RetryPolicy:
+    return POLICIES[name]
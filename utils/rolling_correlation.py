@@ -0,0 +1,167 @@
+"""
+多标的滚动收益相关性 / 协方差
+ETH、DOGE、VINE、BTC 策略在同一全仓账户上运行，回撤往往同时出现。
+这里对所有跟踪的标的维护最近 window 根K线的对数收益协方差：
+每根K线只加入最新收益向量、移除窗口外最旧的收益向量（外积更新），O(n²)，不重算整个窗口；
+每 refresh 次更新用窗口缓冲重算一次累加量，消除浮点误差累积（摊还后仍为 O(n²)）。
+供下单前风控检查与组合回测（PortfolioBroker）读取。
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# ========== 默认参数 ==========
+DEFAULT_WINDOW = 2016  # 滚动窗口K线数（5m x 2016 = 7天）
+MIN_SAMPLES = 30  # 样本数不足时相关系数视为未知
+
+
+class RollingCovariance:
+    """
+    滚动协方差矩阵
+    标的首次出现时自动加入（此前的窗口收益按 0 补齐）；某时间戳缺少某标的价格时该标的收益记为 0
+    """
+
+    def __init__(self, inst_ids: Optional[Sequence[str]] = None, window: int = DEFAULT_WINDOW,
+                 refresh: Optional[int] = None):
+        self.window = window
+        self.refresh = refresh or window
+        self.inst_ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.buffer = np.zeros((window, 0))  # 环形缓冲：最近 window 个收益向量
+        self.sums = np.zeros(0)
+        self.cross = np.zeros((0, 0))
+        self.pos = 0
+        self.count = 0
+        self.updates = 0
+        self.last_ts = 0
+        self.last_prices: Dict[str, float] = {}
+        for inst_id in inst_ids or []:
+            self.add_instrument(inst_id)
+
+    def add_instrument(self, inst_id: str):
+        if inst_id in self.index:
+            return
+        self.index[inst_id] = len(self.inst_ids)
+        self.inst_ids.append(inst_id)
+        n = len(self.inst_ids)
+        self.buffer = np.hstack([self.buffer, np.zeros((self.window, 1))])
+        self.sums = np.r_[self.sums, 0.0]
+        cross = np.zeros((n, n))
+        cross[:n - 1, :n - 1] = self.cross
+        self.cross = cross
+
+    # ---------- 更新 ----------
+    def update(self, timestamp: int, prices: Dict[str, float]) -> bool:
+        """
+        输入某时间戳各标的最新价（收盘价），同一时间戳或更早的数据忽略
+        :return: 是否加入了新的收益向量（首个时间戳只记录价格）
+        """
+        if timestamp <= self.last_ts:
+            return False
+        for inst_id in prices:
+            self.add_instrument(inst_id)
+        returns = np.zeros(len(self.inst_ids))
+        has_return = False
+        for inst_id, price in prices.items():
+            price = float(price)
+            last = self.last_prices.get(inst_id)
+            if last and price > 0:
+                returns[self.index[inst_id]] = np.log(price / last)
+                has_return = True
+            if price > 0:
+                self.last_prices[inst_id] = price
+        self.last_ts = timestamp
+        if not has_return:
+            return False
+        self.push(returns)
+        return True
+
+    def push(self, returns: np.ndarray):
+        """加入一个收益向量（按 inst_ids 顺序），窗口已满时同时移除最旧的向量"""
+        if self.count == self.window:
+            old = self.buffer[self.pos]
+            self.sums -= old
+            self.cross -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.buffer[self.pos] = returns
+        self.sums += returns
+        self.cross += np.outer(returns, returns)
+        self.pos = (self.pos + 1) % self.window
+        self.updates += 1
+        if self.updates % self.refresh == 0:
+            filled = self.buffer[:self.count] if self.count < self.window else self.buffer
+            self.sums = filled.sum(axis=0)
+            self.cross = filled.T @ filled
+
+    # ---------- 读取 ----------
+    def covariance(self) -> np.ndarray:
+        """样本协方差矩阵（对数收益，按 inst_ids 顺序）"""
+        n = len(self.inst_ids)
+        if self.count < 2:
+            return np.full((n, n), np.nan)
+        return (self.cross - np.outer(self.sums, self.sums) / self.count) / (self.count - 1)
+
+    def correlation(self) -> np.ndarray:
+        """相关系数矩阵，方差为 0 的标的与其他标的相关系数记为 0"""
+        cov = self.covariance()
+        std = np.sqrt(np.maximum(np.diag(cov), 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = cov / np.outer(std, std)
+        corr[~np.isfinite(corr)] = 0.0
+        np.fill_diagonal(corr, 1.0)
+        return np.clip(corr, -1.0, 1.0)
+
+    def get(self, inst_a: str, inst_b: str) -> Optional[float]:
+        """两个标的的相关系数，未跟踪或样本不足时返回 None"""
+        if inst_a not in self.index or inst_b not in self.index or self.count < MIN_SAMPLES:
+            return None
+        if inst_a == inst_b:
+            return 1.0
+        i, j = self.index[inst_a], self.index[inst_b]
+        # 只算所需的三个协方差元素，O(1)，供逐信号的风控检查调用
+        var_i, var_j = self._cov(i, i), self._cov(j, j)
+        if var_i <= 0 or var_j <= 0:
+            return 0.0
+        return float(np.clip(self._cov(i, j) / np.sqrt(var_i * var_j), -1.0, 1.0))
+
+    def _cov(self, i: int, j: int) -> float:
+        """协方差矩阵的单个元素（count >= 2）"""
+        return (self.cross[i, j] - self.sums[i] * self.sums[j] / self.count) / (self.count - 1)
+
+    def portfolio_volatility(self, exposures: Dict[str, float]) -> Optional[float]:
+        """
+        组合每根K线收益的标准差（USDT）
+        :param exposures: {instId: 带方向的名义价值（USDT，多为正、空为负）}
+        """
+        if self.count < MIN_SAMPLES:
+            return None
+        w = np.zeros(len(self.inst_ids))
+        for inst_id, value in exposures.items():
+            if inst_id in self.index:
+                w[self.index[inst_id]] += value
+        return float(np.sqrt(max(w @ self.covariance() @ w, 0.0)))
+
+    def to_table(self, kind: str = "correlation") -> Dict[str, Dict[str, float]]:
+        matrix = self.correlation() if kind == "correlation" else self.covariance()
+        return {a: {b: float(matrix[i, j]) for j, b in enumerate(self.inst_ids)}
+                for i, a in enumerate(self.inst_ids)}
+
+    # ---------- 状态 ----------
+    def get_state(self) -> Dict:
+        return {
+            'window': self.window, 'refresh': self.refresh, 'inst_ids': list(self.inst_ids),
+            'buffer': self.buffer.tolist(), 'pos': self.pos, 'count': self.count, 'updates': self.updates,
+            'last_ts': self.last_ts, 'last_prices': dict(self.last_prices),
+        }
+
+    def set_state(self, state: Dict):
+        self.window, self.refresh = state['window'], state['refresh']
+        self.inst_ids = list(state['inst_ids'])
+        self.index = {inst_id: i for i, inst_id in enumerate(self.inst_ids)}
+        self.buffer = np.array(state['buffer'], dtype=np.float64).reshape(self.window, len(self.inst_ids))
+        self.pos, self.count, self.updates = state['pos'], state['count'], state['updates']
+        self.last_ts, self.last_prices = state['last_ts'], dict(state['last_prices'])
+        filled = self.buffer[:self.count] if self.count < self.window else self.buffer
+        self.sums = filled.sum(axis=0)
+        self.cross = filled.T @ filled
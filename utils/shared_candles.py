@@ -0,0 +1,131 @@
+"""
+共享内存K线数组
+参数寻优、滚动验证等任务分发到多个进程时，每个进程各自读取CSV或反序列化整段K线，
+内存随进程数线性增长、启动也慢。这里把归档列数组（candle_archive.to_arrays）一次性放入
+multiprocessing.shared_memory，子进程只接收很小的描述符并以只读视图挂载，不复制数据。
+"""
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from utils.candle_archive import DATA_DIR, load_candles, to_arrays
+
+# 子进程内已挂载的共享内存（保持引用，防止被回收后视图失效）
+_ATTACHED: Dict[str, tuple] = {}
+
+
+# ========== 1. 创建与挂载 ==========
+class SharedCandles:
+    """
+    共享内存中的一组K线列数组（所有列放在同一块共享内存中）
+    创建方负责释放：with SharedCandles.create(arrays) as shared: ...
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, descriptor: Dict):
+        self.shm = shm
+        self.descriptor = descriptor
+
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray]) -> "SharedCandles":
+        """将列数组复制到新建的共享内存，返回可传给子进程的描述符"""
+        columns, offset = [], 0
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            columns.append((name, arr.dtype.str, offset, len(arr)))
+            # 每列按8字节对齐
+            offset += (arr.nbytes + 7) // 8 * 8
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (name, dtype, start, length), arr in zip(columns, arrays.values()):
+            view = np.ndarray((length,), dtype=dtype, buffer=shm.buf, offset=start)
+            view[:] = arr
+        return cls(shm, {'shm_name': shm.name, 'columns': columns})
+
+    @classmethod
+    def from_archive(cls, inst_id: str, bar: str, data_dir: str = DATA_DIR,
+                     start_ts: Optional[int] = None, end_ts: Optional[int] = None) -> "SharedCandles":
+        """读取归档并放入共享内存（主进程只读取一次）"""
+        return cls.create(to_arrays(load_candles(inst_id, bar, data_dir, start_ts, end_ts)))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return _views(self.shm, self.descriptor)
+
+    def close(self):
+        """关闭并释放共享内存（仅创建方调用）；同一进程内挂载过的视图一并释放"""
+        detach(self.shm.name)
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _views(shm: shared_memory.SharedMemory, descriptor: Dict) -> Dict[str, np.ndarray]:
+    arrays = {}
+    for name, dtype, start, length in descriptor['columns']:
+        view = np.ndarray((length,), dtype=dtype, buffer=shm.buf, offset=start)
+        view.flags.writeable = False
+        arrays[name] = view
+    return arrays
+
+
+def attach(descriptor: Dict) -> Dict[str, np.ndarray]:
+    """子进程挂载共享内存，返回只读列数组视图（同一进程内重复挂载直接复用）"""
+    name = descriptor['shm_name']
+    if name not in _ATTACHED:
+        shm = shared_memory.SharedMemory(name=name)
+        _ATTACHED[name] = (shm, _views(shm, descriptor))
+    return _ATTACHED[name][1]
+
+
+def detach(name: str):
+    """释放本进程对某块共享内存的挂载（未挂载时忽略）；挂载返回的视图此后不可再用"""
+    attached = _ATTACHED.pop(name, None)
+    if attached is not None:
+        attached[0].close()
+
+
+# ========== 2. 行视图 ==========
+class ArrayKlines(Sequence):
+    """
+    把列数组包装成按时间正序的OKX格式K线序列，按需生成单行，
+    可直接交给 Backtester.run / MultiStrategyEvaluator.run；切片返回新的视图而不复制数组
+    行格式与归档一致：含成交量为9字段（volCcy/volCcyQuote 以成交量占位，策略均未使用），
+    标记价格（volume为NaN）为6字段
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], start: int = 0, stop: Optional[int] = None):
+        self.arrays = arrays
+        self.start = start
+        self.stop = len(arrays['timestamp']) if stop is None else stop
+        self._has_volume = not np.isnan(arrays['volume'][:1]).all() if len(arrays['volume']) else False
+
+    def __len__(self) -> int:
+        return max(0, self.stop - self.start)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return ArrayKlines(self.arrays, self.start + start, self.start + max(start, stop))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(item)
+        i = self.start + item
+        a = self.arrays
+        row = [int(a['timestamp'][i]), float(a['open'][i]), float(a['high'][i]),
+               float(a['low'][i]), float(a['close'][i])]
+        if self._has_volume:
+            volume = float(a['volume'][i])
+            return row + [volume, volume, volume, "1"]
+        return row + ["1"]
+
+
+def attach_klines(descriptor: Dict) -> ArrayKlines:
+    """子进程挂载共享内存并返回K线行视图"""
+    return ArrayKlines(attach(descriptor))
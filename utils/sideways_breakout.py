@@ -0,0 +1,558 @@
+"""
+横盘突破策略（Pine脚本的Python移植）
+对应 横盘突破策略.pine / 横盘突破策略V2.pine / 横盘突破策略V3-合约版.pine / BTC-USDT-SWAP横盘突破策略.pine
+
+- compute_signals: 向量化版本，输入归档列数组（candle_archive.to_arrays），一次算出整段历史的信号
+- SidewaysBreakoutStream: 流式版本，逐根K线更新，供实盘使用，与向量化版本逐K线结果一致
+- SidewaysBreakoutAdapter: 接入 MultiStrategyEvaluator / Backtester
+
+说明：
+1. Pine 中 request.security 周线压力位按UTC周一为周起点从5m数据聚合；
+2. 资金费率时段按UTC小时判断（TradingView上OKX品种的交易所时区为UTC）；
+3. Pine 的分批止盈/移动止损在实盘中以单一附带止盈止损下单，止盈止损百分比随信号输出；
+4. 同一根K线多空条件同时满足时与Pine下单顺序一致，以做空为准。
+"""
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.strategy_adapter import StrategyAdapter, make_signal
+
+# ========== 策略参数（与各Pine脚本默认输入一致） ==========
+VARIANTS = {
+    # 横盘突破策略.pine
+    'v1': {
+        'family': 'range', 'lookback': 8, 'volume_confirm': True,
+        'take_profit_pct': 1.0, 'stop_loss_pct': 2.7,
+        'enable_volatility_filter': False, 'enable_trend_filter': False,
+        'atr_period': 14, 'sma_period': 50, 'volatility_threshold': 0.01,
+        'risk_mode': 'fixed', 'atr_multiplier': 3.0,
+        'enable_signal_strength': False, 'min_signal_score': 1,
+        'volume_ma_period': 20, 'volume_breakout_mult': 1.0,
+        'bb_length': 20, 'bb_mult': 1.5, 'k_period': 9, 'd_period': 3,
+        'apply_filters': True, 'enable_funding_filter': False,
+    },
+    # 横盘突破策略V3-合约版.pine（基础条件只含突破、成交量和资金费率过滤）
+    'v3': {
+        'family': 'range', 'lookback': 3, 'volume_confirm': False,
+        'take_profit_pct': 0.5, 'stop_loss_pct': 1.0,
+        'enable_volatility_filter': False, 'enable_trend_filter': False,
+        'atr_period': 10, 'sma_period': 30, 'volatility_threshold': 0.008,
+        'risk_mode': 'fixed', 'atr_multiplier': 2.5,
+        'enable_signal_strength': False, 'min_signal_score': 1,
+        'volume_ma_period': 15, 'volume_breakout_mult': 1.0,
+        'bb_length': 15, 'bb_mult': 1.5, 'k_period': 9, 'd_period': 3,
+        'apply_filters': False, 'enable_funding_filter': True,
+    },
+    # 横盘突破策略V2.pine（BTC横盘突破策略强化版）
+    'v2': {
+        'family': 'trend', 'lookback': 8, 'two_bar_break': True,
+        'sma_period': 60, 'adx_period': 14, 'adx_threshold': 25, 'enable_pressure': True,
+        'use_trend_filters': True, 'atr_period': 14, 'volatility_threshold': 0.016,
+        'max_risk_pct': 10.0, 'take_profit_pct': 1.0, 'stop_loss_pct': 2.6,
+        'size_tiers': (1.3, 0.5), 'stop_tiers': (1.2, 0.8),
+    },
+    # BTC-USDT-SWAP横盘突破策略.pine（只保留基础突破）
+    'btc': {
+        'family': 'trend', 'lookback': 2, 'two_bar_break': False,
+        'sma_period': 10, 'adx_period': 14, 'adx_threshold': 40, 'enable_pressure': False,
+        'use_trend_filters': False, 'atr_period': 5, 'volatility_threshold': 0.005,
+        'max_risk_pct': 15.0, 'take_profit_pct': 0.4, 'stop_loss_pct': 0.8,
+        'size_tiers': (1.2, 0.3), 'stop_tiers': (1.1, 0.9),
+    },
+}
+
+WEEK_SECONDS = 7 * 86400
+WEEK_OFFSET = 3 * 86400  # 1970-01-01为周四，偏移3天使周起点为周一
+PRESSURE_WEEKS = 20
+
+
+# ========== 1. 向量化指标 ==========
+def _shift(x: np.ndarray, k: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if k < len(x):
+        out[k:] = x[:len(x) - k]
+    return out
+
+
+def _rolling(x: np.ndarray, window: int, func) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = func(sliding_window_view(x, window), axis=1)
+    return out
+
+
+def _rma(x: np.ndarray, length: int) -> np.ndarray:
+    """Pine ta.rma：以前 length 个有效值的均值为种子的Wilder平滑（前导NaN跳过）"""
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) < length:
+        return out
+    start = valid[0] + length - 1
+    alpha = 1.0 / length
+    value = float(np.mean(x[valid[0]:start + 1]))
+    out[start] = value
+    for i in range(start + 1, len(x)):
+        value = alpha * x[i] + (1 - alpha) * value
+        out[i] = value
+    return out
+
+
+def _true_range(high, low, close, handle_na: bool) -> np.ndarray:
+    prev_close = _shift(close, 1)
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    tr[0] = high[0] - low[0] if handle_na else np.nan
+    return tr
+
+
+def _adx(high, low, close, length: int) -> np.ndarray:
+    """Pine ta.dmi(length, length) 的 ADX"""
+    up = high - _shift(high, 1)
+    down = _shift(low, 1) - low
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    plus_dm[0] = minus_dm[0] = np.nan
+    trur = _rma(_true_range(high, low, close, False), length)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus = 100 * _rma(plus_dm, length) / trur
+        minus = 100 * _rma(minus_dm, length) / trur
+        total = plus + minus
+        dx = np.abs(plus - minus) / np.where(total == 0, 1, total)
+    return 100 * _rma(dx, length)
+
+
+def _weekly_pressure(timestamp: np.ndarray, high, low, weeks: int = PRESSURE_WEEKS):
+    """request.security(W, ta.highest(high, 20)[1])：截至上一周的20周最高/最低价"""
+    week = (timestamp // 1000 + WEEK_OFFSET) // WEEK_SECONDS
+    starts = np.flatnonzero(np.r_[True, week[1:] != week[:-1]])
+    week_high = np.maximum.reduceat(high, starts)
+    week_low = np.minimum.reduceat(low, starts)
+    prev_high = _shift(_rolling(week_high, weeks, np.max), 1)
+    prev_low = _shift(_rolling(week_low, weeks, np.min), 1)
+    week_idx = np.cumsum(np.r_[True, week[1:] != week[:-1]]) - 1
+    return prev_high[week_idx], prev_low[week_idx]
+
+
+def _tiers(ratio, threshold, base, low_mult, high_mult, low_cut, high_cut):
+    """波动率分层：ratio < threshold*low_cut 取 base*low_mult，> threshold*high_cut 取 base*high_mult"""
+    return np.where(ratio < threshold * low_cut, base * low_mult,
+                    np.where(ratio > threshold * high_cut, base * high_mult, base))
+
+
+# ========== 2. 向量化信号 ==========
+def compute_signals(arrays: Dict[str, np.ndarray], variant: str = 'v3', params: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+    """
+    计算整段K线的开仓信号
+    :param arrays: candle_archive.to_arrays 的输出（时间正序）
+    :return: {'long', 'short'(bool), 'tp_pct', 'sl_pct'(%), 'size_pct'(仅trend类), 以及主要指标}
+    """
+    p = dict(VARIANTS[variant], **(params or {}))
+    high, low, close = arrays['high'], arrays['low'], arrays['close']
+    high_range = _rolling(_shift(high, 2), p['lookback'], np.max)
+    low_range = _rolling(_shift(low, 2), p['lookback'], np.min)
+    if p['family'] == 'range':
+        return _range_signals(arrays, p, high_range, low_range)
+    return _trend_signals(arrays, p, high_range, low_range)
+
+
+def _range_signals(arrays, p, high_range, low_range):
+    high, low, close, volume = arrays['high'], arrays['low'], arrays['close'], arrays['volume']
+    with np.errstate(invalid='ignore'):
+        bullish_break = (high > high_range) & (_shift(high, 1) > high_range)
+        bearish_break = (low < low_range) & (_shift(low, 1) < low_range)
+        volume_breakout = volume > _rolling(volume, p['volume_ma_period'], np.mean) * p['volume_breakout_mult']
+        volume_condition = (volume > _shift(volume, 2)) & volume_breakout if p['volume_confirm'] \
+            else np.ones(len(close), dtype=bool)
+
+        basis = _rolling(close, p['bb_length'], np.mean)
+        dev = p['bb_mult'] * _rolling(close, p['bb_length'], np.std)
+        bb_upper, bb_lower = basis + dev, basis - dev
+        bb_bullish = (close > bb_upper) & (_shift(close, 1) <= _shift(bb_upper, 1))
+        bb_bearish = (close < bb_lower) & (_shift(close, 1) >= _shift(bb_lower, 1))
+
+        hh = _rolling(high, p['k_period'], np.max)
+        ll = _rolling(low, p['k_period'], np.min)
+        denom = hh - ll
+        k = np.where(denom == 0, np.nan, 100 * (close - ll) / np.where(denom == 0, 1, denom))
+        d = _rolling(k, p['d_period'], np.mean)
+        kdj_bullish = (k > d) & (k < 85) & (d < 85)
+        kdj_bearish = (k < d) & (k > 15) & (d > 15)
+
+        score_long = np.where(bullish_break, 1 + bb_bullish + kdj_bullish + volume_breakout, 0)
+        score_short = np.where(bearish_break, 1 + bb_bearish + kdj_bearish + volume_breakout, 0)
+
+        atr = _rma(_true_range(high, low, close, True), p['atr_period'])
+        base_long = bullish_break & volume_condition
+        base_short = bearish_break & volume_condition
+        if p['apply_filters']:
+            avoid_high_vol = (atr / close < p['volatility_threshold']) if p['enable_volatility_filter'] else True
+            sma = _rolling(close, p['sma_period'], np.mean)
+            long_trend = close > sma if p['enable_trend_filter'] else True
+            short_trend = close < sma if p['enable_trend_filter'] else True
+            base_long = base_long & avoid_high_vol & long_trend
+            base_short = base_short & avoid_high_vol & short_trend
+        if p['enable_funding_filter']:
+            hour = (arrays['timestamp'] // 3600000) % 24
+            avoid_funding = ~np.isin(hour, (0, 8, 16))
+            base_long = base_long & avoid_funding
+            base_short = base_short & avoid_funding
+        if p['enable_signal_strength']:
+            base_long = base_long & (score_long >= p['min_signal_score'])
+            base_short = base_short & (score_short >= p['min_signal_score'])
+
+        if p['risk_mode'] == 'atr':
+            sl_pct = np.fmin(p['stop_loss_pct'], atr / close * 100 * p['atr_multiplier'])
+        else:
+            sl_pct = np.full(len(close), float(p['stop_loss_pct']))
+    return {
+        'long': base_long & ~base_short, 'short': base_short,
+        'tp_pct': np.full(len(close), float(p['take_profit_pct'])), 'sl_pct': sl_pct,
+        'high_range': high_range, 'low_range': low_range, 'atr': atr,
+        'score_long': score_long, 'score_short': score_short,
+    }
+
+
+def _trend_signals(arrays, p, high_range, low_range):
+    high, low, close = arrays['high'], arrays['low'], arrays['close']
+    with np.errstate(invalid='ignore'):
+        upper_break = close > high_range
+        lower_break = close < low_range
+        if p['two_bar_break']:
+            upper_break &= _shift(close, 1) > high_range
+            lower_break &= _shift(close, 1) < low_range
+        if p['use_trend_filters']:
+            sma = _rolling(close, p['sma_period'], np.mean)
+            adx_filter = _adx(high, low, close, p['adx_period']) < p['adx_threshold']
+            trend_up = close > sma
+            if p['enable_pressure']:
+                weekly_high, weekly_low = _weekly_pressure(arrays['timestamp'], high, low)
+                upper_break &= np.abs(close - weekly_high) / close < 0.01
+                lower_break &= np.abs(close - weekly_low) / close < 0.01
+            long_signal = upper_break & trend_up & adx_filter
+            short_signal = lower_break & ~trend_up & adx_filter
+        else:
+            long_signal, short_signal = upper_break, lower_break
+
+        atr = _rma(_true_range(high, low, close, True), p['atr_period'])
+        ratio = atr / close
+        size_high, size_low = p['size_tiers']
+        stop_high, stop_low = p['stop_tiers']
+        size_pct = _tiers(ratio, p['volatility_threshold'], p['max_risk_pct'], size_high, size_low, 0.7, 1.3)
+        sl_pct = _tiers(ratio, p['volatility_threshold'], p['stop_loss_pct'], stop_low, stop_high, 0.8, 1.5)
+    return {
+        'long': long_signal & ~short_signal, 'short': short_signal,
+        'tp_pct': np.full(len(close), float(p['take_profit_pct'])), 'sl_pct': sl_pct, 'size_pct': size_pct,
+        'high_range': high_range, 'low_range': low_range, 'atr': atr,
+    }
+
+
+def signals_to_list(arrays: Dict[str, np.ndarray], result: Dict[str, np.ndarray],
+                    name: str, inst_id: str) -> List[Dict]:
+    """将向量化结果转换为统一格式信号列表（以收盘价入场）"""
+    signals = []
+    for i in np.flatnonzero(result['long'] | result['short']):
+        close = float(arrays['close'][i])
+        tp, sl = result['tp_pct'][i] / 100, result['sl_pct'][i] / 100
+        kline = [int(arrays['timestamp'][i])]
+        if result['long'][i]:
+            signals.append(make_signal(name, inst_id, kline, "LONG", close, close * (1 + tp), close * (1 - sl)))
+        else:
+            signals.append(make_signal(name, inst_id, kline, "SHORT", close, close * (1 - tp), close * (1 + sl)))
+    return signals
+
+
+# ========== 3. 流式版本 ==========
+class _RMA:
+    """Pine ta.rma 的增量实现（与 _rma 相同的种子规则）"""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.seed: List[float] = []
+        self.value = math.nan
+
+    def update(self, x: float) -> float:
+        if math.isnan(x):
+            return self.value
+        if math.isnan(self.value):
+            self.seed.append(x)
+            if len(self.seed) == self.length:
+                self.value = float(np.mean(self.seed))
+                self.seed = []
+            return self.value
+        self.value = x / self.length + (1 - 1.0 / self.length) * self.value
+        return self.value
+
+    def get_state(self):
+        return {'seed': self.seed, 'value': None if math.isnan(self.value) else self.value}
+
+    def set_state(self, state):
+        self.seed = list(state['seed'])
+        self.value = math.nan if state['value'] is None else state['value']
+
+
+def _window(values, n: int, func) -> float:
+    if len(values) < n:
+        return math.nan
+    return float(func(np.array(list(values)[-n:], dtype=np.float64)))
+
+
+class SidewaysBreakoutStream:
+    """
+    横盘突破策略流式计算：每根已完结K线调用一次 update，
+    内存只保留各指标所需的最短窗口，RMA类指标增量更新
+    """
+
+    def __init__(self, variant: str = 'v3', params: Optional[Dict] = None):
+        self.variant = variant
+        self.p = dict(VARIANTS[variant], **(params or {}))
+        p = self.p
+        depth = p['lookback'] + 2
+        for key in ('volume_ma_period', 'bb_length', 'k_period', 'sma_period'):
+            if key in p:
+                depth = max(depth, p[key])
+        self.depth = depth + 1
+        self.bars = deque(maxlen=self.depth)   # [ts, o, h, l, c, vol]
+        self.k_values = deque(maxlen=p.get('d_period', 1))
+        self.prev = {}                         # 上一根K线的布林带等中间值
+        self.atr = _RMA(p['atr_period'])
+        if p['family'] == 'trend':
+            self.tr_rma = _RMA(p['adx_period'])
+            self.plus_rma = _RMA(p['adx_period'])
+            self.minus_rma = _RMA(p['adx_period'])
+            self.dx_rma = _RMA(p['adx_period'])
+            self.week_extremes = deque(maxlen=PRESSURE_WEEKS + 1)  # [week, high, low]
+        self.last_ts = 0
+
+    # ---------- 更新 ----------
+    def update(self, kline) -> Optional[Dict]:
+        """
+        推入一根已完结K线（OKX格式，时间正序调用）
+        :return: 有信号时返回 {'signal', 'tp_pct', 'sl_pct', ...}，否则 None
+        """
+        ts = int(kline[0])
+        high, low, close = float(kline[2]), float(kline[3]), float(kline[4])
+        volume = float(kline[5]) if len(kline) >= 9 else math.nan
+        prev_close = self.bars[-1][4] if self.bars else math.nan
+        self.bars.append([ts, float(kline[1]), high, low, close, volume])
+        self.last_ts = ts
+
+        tr = high - low if math.isnan(prev_close) else max(high - low, abs(high - prev_close), abs(low - prev_close))
+        atr = self.atr.update(tr)
+        highs = [b[2] for b in self.bars]
+        lows = [b[3] for b in self.bars]
+        lookback = self.p['lookback']
+        if len(self.bars) >= lookback + 2:
+            high_range = max(highs[-lookback - 2:-2])
+            low_range = min(lows[-lookback - 2:-2])
+        else:
+            high_range = low_range = math.nan
+
+        if self.p['family'] == 'range':
+            result = self._update_range(ts, high, low, close, volume, atr, high_range, low_range)
+        else:
+            result = self._update_trend(ts, high, low, close, prev_close, tr, atr, high_range, low_range)
+        if result is None:
+            return None
+        result.update(timestamp=ts, close=close, high_range=high_range, low_range=low_range, atr=atr)
+        return result
+
+    def _update_range(self, ts, high, low, close, volume, atr, high_range, low_range):
+        p = self.p
+        closes = [b[4] for b in self.bars]
+        volumes = [b[5] for b in self.bars]
+        prev_high = self.bars[-2][2] if len(self.bars) >= 2 else math.nan
+        prev_low = self.bars[-2][3] if len(self.bars) >= 2 else math.nan
+
+        bullish_break = high > high_range and prev_high > high_range
+        bearish_break = low < low_range and prev_low < low_range
+        volume_breakout = volume > _window(volumes, p['volume_ma_period'], np.mean) * p['volume_breakout_mult']
+        if p['volume_confirm']:
+            volume_condition = len(volumes) >= 3 and volume > volumes[-3] and volume_breakout
+        else:
+            volume_condition = True
+
+        basis = _window(closes, p['bb_length'], np.mean)
+        dev = p['bb_mult'] * _window(closes, p['bb_length'], np.std)
+        bb_upper, bb_lower = basis + dev, basis - dev
+        prev_close = closes[-2] if len(closes) >= 2 else math.nan
+        bb_bullish = close > bb_upper and prev_close <= self.prev.get('bb_upper', math.nan)
+        bb_bearish = close < bb_lower and prev_close >= self.prev.get('bb_lower', math.nan)
+        self.prev.update(bb_upper=bb_upper, bb_lower=bb_lower)
+
+        hh = _window([b[2] for b in self.bars], p['k_period'], np.max)
+        ll = _window([b[3] for b in self.bars], p['k_period'], np.min)
+        k = math.nan if (math.isnan(hh) or hh == ll) else 100 * (close - ll) / (hh - ll)
+        self.k_values.append(k)
+        d = _window(self.k_values, p['d_period'], np.mean)
+        kdj_bullish = k > d and k < 85 and d < 85
+        kdj_bearish = k < d and k > 15 and d > 15
+
+        score_long = (1 + bb_bullish + kdj_bullish + volume_breakout) if bullish_break else 0
+        score_short = (1 + bb_bearish + kdj_bearish + volume_breakout) if bearish_break else 0
+
+        base_long = bullish_break and volume_condition
+        base_short = bearish_break and volume_condition
+        if p['apply_filters']:
+            avoid_high_vol = (atr / close < p['volatility_threshold']) if p['enable_volatility_filter'] else True
+            sma = _window(closes, p['sma_period'], np.mean)
+            long_trend = close > sma if p['enable_trend_filter'] else True
+            short_trend = close < sma if p['enable_trend_filter'] else True
+            base_long = base_long and avoid_high_vol and long_trend
+            base_short = base_short and avoid_high_vol and short_trend
+        if p['enable_funding_filter'] and (ts // 3600000) % 24 in (0, 8, 16):
+            base_long = base_short = False
+        if p['enable_signal_strength']:
+            base_long = base_long and score_long >= p['min_signal_score']
+            base_short = base_short and score_short >= p['min_signal_score']
+        if not (base_long or base_short):
+            return None
+        sl_pct = float(p['stop_loss_pct'])
+        if p['risk_mode'] == 'atr' and not math.isnan(atr):
+            sl_pct = min(sl_pct, atr / close * 100 * p['atr_multiplier'])
+        return {
+            'signal': "SHORT" if base_short else "LONG",
+            'tp_pct': float(p['take_profit_pct']), 'sl_pct': sl_pct,
+            'score_long': score_long, 'score_short': score_short,
+        }
+
+    def _update_trend(self, ts, high, low, close, prev_close, tr, atr, high_range, low_range):
+        p = self.p
+        closes = [b[4] for b in self.bars]
+        upper_break = close > high_range
+        lower_break = close < low_range
+        if p['two_bar_break']:
+            prev = closes[-2] if len(closes) >= 2 else math.nan
+            upper_break = upper_break and prev > high_range
+            lower_break = lower_break and prev < low_range
+
+        # ADX（先于信号判断更新，保证状态连续）
+        adx = math.nan
+        if len(self.bars) >= 2:
+            up = high - self.bars[-2][2]
+            down = self.bars[-2][3] - low
+            trur = self.tr_rma.update(tr)
+            plus = 100 * self.plus_rma.update(up if (up > down and up > 0) else 0.0) / trur
+            minus = 100 * self.minus_rma.update(down if (down > up and down > 0) else 0.0) / trur
+            total = plus + minus
+            if not math.isnan(total):
+                adx = 100 * self.dx_rma.update(abs(plus - minus) / (1 if total == 0 else total))
+
+        # 周线压力位
+        week = (ts // 1000 + WEEK_OFFSET) // WEEK_SECONDS
+        if self.week_extremes and self.week_extremes[-1][0] == week:
+            self.week_extremes[-1][1] = max(self.week_extremes[-1][1], high)
+            self.week_extremes[-1][2] = min(self.week_extremes[-1][2], low)
+        else:
+            self.week_extremes.append([week, high, low])
+
+        if p['use_trend_filters']:
+            sma = _window(closes, p['sma_period'], np.mean)
+            adx_filter = adx < p['adx_threshold']
+            trend_up = close > sma
+            if p['enable_pressure']:
+                done = list(self.week_extremes)[:-1]
+                if len(done) >= PRESSURE_WEEKS:
+                    weekly_high = max(w[1] for w in done[-PRESSURE_WEEKS:])
+                    weekly_low = min(w[2] for w in done[-PRESSURE_WEEKS:])
+                    upper_break = upper_break and abs(close - weekly_high) / close < 0.01
+                    lower_break = lower_break and abs(close - weekly_low) / close < 0.01
+                else:
+                    upper_break = lower_break = False
+            long_signal = upper_break and trend_up and adx_filter
+            short_signal = lower_break and not trend_up and adx_filter
+        else:
+            long_signal, short_signal = upper_break, lower_break
+        if not (long_signal or short_signal):
+            return None
+
+        ratio = atr / close
+        threshold = p['volatility_threshold']
+        size_high, size_low = p['size_tiers']
+        stop_high, stop_low = p['stop_tiers']
+        size_pct = p['max_risk_pct']
+        if ratio < threshold * 0.7:
+            size_pct *= size_high
+        elif ratio > threshold * 1.3:
+            size_pct *= size_low
+        sl_pct = p['stop_loss_pct']
+        if ratio > threshold * 1.5:
+            sl_pct *= stop_high
+        elif ratio < threshold * 0.8:
+            sl_pct *= stop_low
+        return {
+            'signal': "SHORT" if short_signal else "LONG",
+            'tp_pct': float(p['take_profit_pct']), 'sl_pct': float(sl_pct), 'size_pct': float(size_pct),
+            'adx': adx,
+        }
+
+    # ---------- 状态 ----------
+    def get_state(self) -> Dict:
+        state = {
+            'bars': list(self.bars), 'k_values': [None if math.isnan(v) else v for v in self.k_values],
+            'prev': {k: (None if math.isnan(v) else v) for k, v in self.prev.items()},
+            'atr': self.atr.get_state(), 'last_ts': self.last_ts,
+        }
+        if self.p['family'] == 'trend':
+            state.update(tr_rma=self.tr_rma.get_state(), plus_rma=self.plus_rma.get_state(),
+                         minus_rma=self.minus_rma.get_state(), dx_rma=self.dx_rma.get_state(),
+                         week_extremes=list(self.week_extremes))
+        return state
+
+    def set_state(self, state: Dict):
+        nan = lambda v: math.nan if v is None else v
+        self.bars = deque([[b[0]] + [nan(v) for v in b[1:]] for b in state['bars']], maxlen=self.depth)
+        self.k_values = deque([nan(v) for v in state['k_values']], maxlen=self.k_values.maxlen)
+        self.prev = {k: nan(v) for k, v in state['prev'].items()}
+        self.atr.set_state(state['atr'])
+        self.last_ts = state['last_ts']
+        if self.p['family'] == 'trend':
+            self.tr_rma.set_state(state['tr_rma'])
+            self.plus_rma.set_state(state['plus_rma'])
+            self.minus_rma.set_state(state['minus_rma'])
+            self.dx_rma.set_state(state['dx_rma'])
+            self.week_extremes = deque(state['week_extremes'], maxlen=PRESSURE_WEEKS + 1)
+
+
+# ========== 4. 评估器适配 ==========
+class SidewaysBreakoutAdapter(StrategyAdapter):
+    """
+    横盘突破策略适配器：内部持有流式状态，
+    回测时每根K线只推入最新一根；实盘首次调用时用窗口内全部K线预热
+    lookback 为规则实际需要的K线数（区间 lookback + 2），不放大评估器的共享窗口
+    """
+    warmup = 300  # 实盘预热所需K线数（OKX单次最多返回300根）
+
+    def __init__(self, variant: str = 'v3', inst_id: str = "BTC-USDT-SWAP", bar: str = "5m",
+                 params: Optional[Dict] = None):
+        self.name = f"sideways_breakout_{variant}"
+        self.inst_id = inst_id
+        self.bar = bar
+        self.variant = variant
+        self.params = params
+        self.stream = SidewaysBreakoutStream(variant, params)
+        self.lookback = self.stream.p['lookback'] + 2
+
+    def on_bar(self, window):
+        result = None
+        for kline in reversed(window):
+            if int(kline[0]) > self.stream.last_ts:
+                result = self.stream.update(kline)
+        if result is None:
+            return []
+        close = result['close']
+        tp, sl = result['tp_pct'] / 100, result['sl_pct'] / 100
+        if result['signal'] == "LONG":
+            take_profit, stop_loss = close * (1 + tp), close * (1 - sl)
+        else:
+            take_profit, stop_loss = close * (1 - tp), close * (1 + sl)
+        return [make_signal(self.name, self.inst_id, window[0], result['signal'], close,
+                            take_profit, stop_loss, result)]
+
+    def get_state(self):
+        return self.stream.get_state()
+
+    def set_state(self, state):
+        self.stream.set_state(state)
@@ -0,0 +1,194 @@
+"""
+任务名称
+name: 策略信号索引增量更新
+定时规则
+cron: 25 0 * * *
+历史信号索引
+对每个 (策略, 参数组) 在归档上批量运行一次策略，记录所有开仓条件成立的K线时间戳、方向与开仓价位：
+    {data_dir}/{instId}/signals/{bar}_{策略}_{参数哈希}.npz   信号列
+    {data_dir}/{instId}/signals/{bar}_{策略}_{参数哈希}.json  评估器状态（K线窗口 + 策略状态，用于增量续算）
+之后“最近90天触发了几次、触发后走势如何”这类问题只需查询索引，无需逐K线重跑策略。
+"""
+import os
+import sys
+import json
+import hashlib
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+# 支持直接以脚本方式运行（青龙面板）
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.candle_archive import DATA_DIR, load_candles, to_arrays
+from utils.feature_store import FeatureStore
+from utils.strategy_adapter import ADAPTER_FACTORIES, MultiStrategyEvaluator
+from utils.barrier_labels import barrier_labels, LABEL_TP, LABEL_SL
+from utils.okx_utils import get_shanghai_time
+
+INDEX_VERSION = 1
+DAY_MS = 86400000
+COLUMNS = ('timestamp', 'direction', 'entry_price', 'take_profit', 'stop_loss')
+
+
+def params_hash(params: Optional[Dict]) -> str:
+    """参数组哈希（参数按键排序后序列化），无参数时为 default"""
+    if not params:
+        return "default"
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+# ========== 1. 索引 ==========
+class SignalIndex:
+    """单个 (标的, 周期, 策略, 参数组) 的信号索引"""
+
+    def __init__(self, name: str, params: Optional[Dict] = None, inst_id: Optional[str] = None,
+                 bar: Optional[str] = None, data_dir: str = DATA_DIR):
+        self.name = name
+        self.params = params or {}
+        self.adapter = ADAPTER_FACTORIES[name](params=params) if params else ADAPTER_FACTORIES[name]()
+        self.inst_id = inst_id or self.adapter.inst_id
+        self.bar = bar or self.adapter.bar
+        self.adapter.inst_id = self.inst_id
+        self.data_dir = data_dir
+        base = os.path.join(data_dir, self.inst_id, "signals", f"{self.bar}_{name}_{params_hash(params)}")
+        self.npz_path, self.state_path = base + ".npz", base + ".json"
+        self.columns: Dict[str, np.ndarray] = {
+            'timestamp': np.empty(0, dtype=np.int64), 'direction': np.empty(0, dtype=np.int8),
+            'entry_price': np.empty(0), 'take_profit': np.empty(0), 'stop_loss': np.empty(0),
+        }
+        self.last_ts = 0
+        self.evaluator = MultiStrategyEvaluator([self.adapter])
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.npz_path) and os.path.exists(self.state_path)):
+            return
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        # 参数经JSON往返后元组变为列表，按哈希比较
+        if state.get('version') != INDEX_VERSION or params_hash(state.get('params')) != params_hash(self.params):
+            return
+        with np.load(self.npz_path) as data:
+            self.columns = {key: data[key] for key in COLUMNS}
+        self.last_ts = state['last_ts']
+        self.evaluator.set_state(state['evaluator'])
+
+    def save(self):
+        """原子写入信号列与评估器状态"""
+        os.makedirs(os.path.dirname(self.npz_path), exist_ok=True)
+        with open(self.npz_path + ".tmp", "wb") as f:
+            np.savez(f, **self.columns)
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({'version': INDEX_VERSION, 'strategy': self.name, 'params': self.params,
+                       'last_ts': self.last_ts, 'evaluator': self.evaluator.get_state()}, f)
+        os.replace(self.npz_path + ".tmp", self.npz_path)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def update(self, klines: Optional[Sequence] = None) -> int:
+        """
+        从上次处理位置继续评估归档（或传入的时间正序K线），追加新信号并保存
+        评估归档时读取特征存储供无状态策略预筛；传入的K线来源未知，不预筛
+        :return: 新增信号数
+        """
+        features = {}
+        if klines is None:
+            start_ts = self.last_ts + 1 if self.last_ts else None
+            klines = load_candles(self.inst_id, self.bar, self.data_dir, start_ts=start_ts)
+            features = FeatureStore(self.data_dir).load(self.inst_id, self.bar, start_ts=start_ts)
+        self.evaluator.set_features(features)
+        rows = []
+        for kline in klines:
+            if int(kline[0]) <= self.last_ts:
+                continue
+            for s in self.evaluator.feed(kline):
+                rows.append((s['timestamp'], 1 if s['signal'] == "LONG" else -1,
+                             s['entry_price'], s['take_profit'], s['stop_loss']))
+            self.last_ts = int(kline[0])
+        if rows:
+            new = list(zip(*rows))
+            dtypes = (np.int64, np.int8, np.float64, np.float64, np.float64)
+            for key, values, dtype in zip(COLUMNS, new, dtypes):
+                self.columns[key] = np.concatenate([self.columns[key], np.array(values, dtype=dtype)])
+        self.save()
+        return len(rows)
+
+    # ---------- 查询 ----------
+    def query(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+              direction: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """按时间范围（含端点）与方向（1 做多 / -1 做空）筛选信号"""
+        ts = self.columns['timestamp']
+        lo = 0 if start_ts is None else np.searchsorted(ts, start_ts, side="left")
+        hi = len(ts) if end_ts is None else np.searchsorted(ts, end_ts, side="right")
+        result = {key: value[lo:hi] for key, value in self.columns.items()}
+        if direction is not None:
+            keep = result['direction'] == direction
+            result = {key: value[keep] for key, value in result.items()}
+        return result
+
+    def recent(self, days: int, direction: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """最近 days 天（以最后处理的K线为准）内的信号"""
+        return self.query(self.last_ts - days * DAY_MS, None, direction)
+
+
+# ========== 2. 事件研究 ==========
+def event_study(events: Dict[str, np.ndarray], arrays: Dict[str, np.ndarray],
+                horizons: Sequence[int] = (1, 3, 6, 12, 48), barrier_horizon: int = 48) -> Dict:
+    """
+    统计信号触发后的走势
+    - 各 horizon 根K线后的收益率（按信号方向计，以信号K线收盘价为基准）
+    - 以信号自带止盈止损比例、信号K线收盘价入场计算的障碍结果（先止盈/先止损/超时）
+    :param events: SignalIndex.query 的结果
+    :param arrays: 同标的同周期的 candle_archive.to_arrays 结果
+    """
+    close = arrays['close']
+    idx = np.searchsorted(arrays['timestamp'], events['timestamp'])
+    valid = (idx < len(close)) & (arrays['timestamp'][np.minimum(idx, len(close) - 1)] == events['timestamp'])
+    idx, direction = idx[valid], events['direction'][valid].astype(np.float64)
+    result = {'events': int(valid.sum()), 'forward': {}}
+    for h in horizons:
+        ok = idx + h < len(close)
+        ret = direction[ok] * (close[idx[ok] + h] - close[idx[ok]]) / close[idx[ok]]
+        result['forward'][h] = {
+            'count': int(ok.sum()),
+            'mean': float(ret.mean()) if len(ret) else 0.0,
+            'median': float(np.median(ret)) if len(ret) else 0.0,
+            'win_rate': float((ret > 0).mean()) if len(ret) else 0.0,
+        }
+    # 障碍结果：按方向分组，止盈止损比例取各组信号的中位数（同一参数组下比例固定）
+    outcome = {'tp': 0, 'sl': 0, 'timeout': 0}
+    entry = events['entry_price'][valid]
+    for d in (1, -1):
+        sel = direction == d
+        if not sel.any():
+            continue
+        tp = float(np.median(np.abs(events['take_profit'][valid][sel] / entry[sel] - 1)))
+        sl = float(np.median(np.abs(events['stop_loss'][valid][sel] / entry[sel] - 1)))
+        labels = barrier_labels(arrays, tp, sl, barrier_horizon, direction=d)
+        label = labels['label'][idx[sel]]
+        outcome['tp'] += int((label == LABEL_TP).sum())
+        outcome['sl'] += int((label == LABEL_SL).sum())
+        outcome['timeout'] += int(((label != LABEL_TP) & (label != LABEL_SL)).sum())
+    result['barrier'] = outcome
+    return result
+
+
+def main():
+    """增量更新所有实盘策略默认参数的信号索引，并输出最近90天触发情况"""
+    for name in ADAPTER_FACTORIES:
+        index = SignalIndex(name)
+        added = index.update()
+        recent = index.recent(90)
+        longs = int((recent['direction'] == 1).sum())
+        print(f"[{get_shanghai_time()}] [SIGNAL_INDEX] {index.inst_id}-{index.bar} {name}: 新增 {added} 个信号, "
+              f"最近90天 {len(recent['timestamp'])} 次(做多 {longs}, 做空 {len(recent['timestamp']) - longs})")
+        if len(recent['timestamp']):
+            arrays = to_arrays(load_candles(index.inst_id, index.bar, index.data_dir,
+                                            start_ts=int(recent['timestamp'][0])))
+            study = event_study(recent, arrays)
+            forward = study['forward'][12]
+            print(f"  - 触发后12根K线: 平均收益 {forward['mean'] * 100:.4f}%, 胜率 {forward['win_rate'] * 100:.2f}%, "
+                  f"止盈/止损/超时 {study['barrier']['tp']}/{study['barrier']['sl']}/{study['barrier']['timeout']}")
+
+
+if __name__ == "__main__":
+    main()
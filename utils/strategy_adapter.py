@@ -0,0 +1,389 @@
+"""
+策略适配器模块
+将各策略脚本中形态各异的信号入口（函数、main内联逻辑、策略类方法）包装为统一接口，
+由 MultiStrategyEvaluator 在一次K线遍历中同时驱动所有已注册策略。
+实盘: 拉取一次K线 -> evaluate_latest；回测: 加载一次归档 -> run。
+回测时可通过 set_features 传入特征存储（utils.feature_store）中预先物化的K线形态特征，
+无状态的单K线策略先按特征预筛，确定不会触发的K线不再逐根解析。
+"""
+import os
+import sys
+import importlib.util
+from collections import deque
+from typing import Dict, List, Optional
+
+from utils.candle_archive import is_confirmed
+from utils.okx_utils import get_shanghai_time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+_MODULE_CACHE = {}
+
+
+# ========== 1. 策略脚本加载 ==========
+def load_script_module(filename: str, params: Optional[Dict] = None):
+    """
+    按文件名加载根目录下的策略脚本（文件名含中文/连字符，无法直接import）
+    传入 params 时加载一份独立副本并覆盖其模块常量（如 RANGE1_MIN），不影响缓存中的模块
+    """
+    if not params and filename in _MODULE_CACHE:
+        return _MODULE_CACHE[filename]
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    path = os.path.join(ROOT_DIR, filename)
+    module_name = "strategy_" + "".join(ch if ch.isalnum() else "_" for ch in filename[:-3])
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if params:
+        apply_params(module, params)
+    else:
+        _MODULE_CACHE[filename] = module
+    return module
+
+
+def apply_params(target, params: Optional[Dict]):
+    """覆盖策略参数（模块常量或策略实例属性），参数名必须已存在"""
+    for key, value in (params or {}).items():
+        if not hasattr(target, key):
+            raise ValueError(f"未知策略参数: {key}")
+        setattr(target, key, value)
+
+
+def make_signal(strategy: str, inst_id: str, kline, signal: str, entry_price: float,
+                take_profit: float, stop_loss: float, raw: Optional[Dict] = None) -> Dict:
+    """构建统一格式的信号字典"""
+    is_long = signal == "LONG"
+    return {
+        'strategy': strategy,
+        'inst_id': inst_id,
+        'timestamp': int(kline[0]),
+        'signal': signal,
+        'side': "buy" if is_long else "sell",
+        'pos_side': "long" if is_long else "short",
+        'entry_price': float(entry_price),
+        'take_profit': float(take_profit),
+        'stop_loss': float(stop_loss),
+        'raw': raw or {}
+    }
+
+
+# ========== 2. 适配器基类 ==========
+class StrategyAdapter:
+    """
+    策略适配器基类
+    on_bar 接收最新在前的已完结K线窗口（window[0] 为刚收盘的K线，长度等于 lookback），
+    返回统一格式的信号列表（无信号返回空列表）
+    构造参数 params 用于覆盖策略参数（参数寻优），名称与脚本中的常量/属性一致
+    """
+    name = "base"
+    inst_id = ""
+    bar = "5m"
+    lookback = 1  # 所需已完结K线数量
+    warmup = 0  # 有内部状态的策略：实盘首次评估时额外使用的预热K线数（0 表示不需要）
+
+    def on_bar(self, window: List) -> List[Dict]:
+        raise NotImplementedError
+
+    def feature_gate(self, features: Dict[str, List[float]], i: int) -> bool:
+        """
+        按当前K线的 bar_shape 特征（features[列名][i]）预筛：只有确定不会产生信号时返回 False（跳过 on_bar）
+        条件须与脚本中的判断逐位一致；有跨K线状态的策略不能预筛，保持默认
+        """
+        return True
+
+    def get_state(self) -> Dict:
+        """返回需要跨K线保留的内部状态（用于断点续跑）"""
+        return {}
+
+    def set_state(self, state: Dict):
+        pass
+
+
+# ========== 3. 各策略适配器 ==========
+class EthQAAdapter(StrategyAdapter):
+    """ethqa.py: analyze_kline(kline) 单根K线振幅信号"""
+    name = "ethqa"
+    lookback = 1
+
+    def __init__(self, params: Optional[Dict] = None):
+        self.module = load_script_module("ethqa.py", params)
+        self.inst_id = self.module.INST_ID
+        self.bar = self.module.BAR
+
+    def feature_gate(self, features, i):
+        m, body_perc = self.module, features['body_perc'][i]
+        return m.RANGE1_MIN <= body_perc <= m.RANGE1_MAX or body_perc > m.RANGE2_THRESHOLD
+
+    def on_bar(self, window):
+        signal, entry_price, amp_info = self.module.analyze_kline(window[0])
+        if not signal:
+            return []
+        tp_perc, sl_perc = self.module.TAKE_PROFIT_PERCENT, self.module.STOP_LOSS_PERCENT
+        if signal == "LONG":
+            take_profit, stop_loss = entry_price * (1 + tp_perc), entry_price * (1 - sl_perc)
+        else:
+            take_profit, stop_loss = entry_price * (1 - tp_perc), entry_price * (1 + sl_perc)
+        return [make_signal(self.name, self.inst_id, window[0], signal, entry_price,
+                            round(take_profit, 4), round(stop_loss, 4), amp_info)]
+
+
+class EthK6Adapter(StrategyAdapter):
+    """ETH_K6趋势策略QA.py: analyze_signal(klines)，klines[1]为K1，klines[2:6]为K2~K5"""
+    name = "eth_k6"
+    lookback = 5
+
+    def __init__(self, params: Optional[Dict] = None):
+        self.module = load_script_module("ETH_K6趋势策略QA.py", params)
+        self.inst_id = self.module.INST_ID
+        self.bar = self.module.BAR
+
+    def feature_gate(self, features, i):
+        # 只用当前K线（K1）自身的列；K2~K5之和依赖相邻行，归档补齐缺口后可能与特征存储不一致
+        return self.module.MIN_BODY1 < features['body'][i] < self.module.MAX_BODY1
+
+    def on_bar(self, window):
+        # 脚本按实盘格式读取（klines[0]为未完结K线），此处以K1占位
+        result = self.module.analyze_signal([window[0]] + window[:5])
+        if not result.get('can_entry'):
+            return []
+        signal = "LONG" if result['pos_side'] == "long" else "SHORT"
+        return [make_signal(self.name, self.inst_id, window[0], signal, round(result['entry_price'], 2),
+                            round(result['take_profit'], 2), round(result['stop_loss'], 2), result)]
+
+
+class EthReversalAdapter(StrategyAdapter):
+    """ETH_大振幅反转v1/v2.py: main 中的单K线大振幅反转逻辑（analyze_kline）"""
+    lookback = 1
+
+    def __init__(self, filename: str = "ETH_大振幅反转v2.py", name: str = "eth_reversal_v2",
+                 params: Optional[Dict] = None):
+        self.module = load_script_module(filename, params)
+        self.name = name
+        self.inst_id = self.module.INST_ID
+        self.bar = self.module.BAR
+
+    def feature_gate(self, features, i):
+        return features['range_perc'][i] > self.module.AMPLITUDE_PERC
+
+    def on_bar(self, window):
+        analysis = self.module.analyze_kline(window[0])
+        if not analysis['signal']:
+            return []
+        return [make_signal(self.name, self.inst_id, window[0], analysis['signal'],
+                            round(analysis['order_price'], 4), round(analysis['take_profit'], 4),
+                            round(analysis['stop_loss'], 4), analysis)]
+
+
+class Vine5mReversalAdapter(StrategyAdapter):
+    """VINE-5m-大振幅反转开仓策略.py: main 中的大振幅反转逻辑（analyze_kline）"""
+    name = "vine_5m_reversal"
+    lookback = 1
+
+    def __init__(self, params: Optional[Dict] = None):
+        self.module = load_script_module("VINE-5m-大振幅反转开仓策略.py", params)
+        self.inst_id = self.module.SYMBOL
+        self.bar = self.module.KLINE_INTERVAL
+
+    def feature_gate(self, features, i):
+        return features['range_perc'][i] > self.module.RANGE2_THRESHOLD
+
+    def on_bar(self, window):
+        analysis = self.module.analyze_kline(window[0])
+        if not analysis['signal']:
+            return []
+        return [make_signal(self.name, self.inst_id, window[0], analysis['signal'], analysis['order_price'],
+                            analysis['take_profit'], analysis['stop_loss'], analysis)]
+
+
+class VineK8Adapter(StrategyAdapter):
+    """VINE-K8趋势策略.py: VINEK8Strategy.analyze_kline + check_trend"""
+    name = "vine_k8"
+
+    def __init__(self, params: Optional[Dict] = None):
+        module = load_script_module("VINE-K8趋势策略.py")
+        self.strategy = module.VINEK8Strategy()
+        apply_params(self.strategy, params)
+        self.inst_id = self.strategy.inst_id
+        self.bar = self.strategy.bar
+        # 与实盘 get_kline_data_with_cache 的 MIN_ROWS 一致，保证EMA预热长度相同
+        self.lookback = max(module.MIN_ROWS, self.strategy.ema144)
+
+    def on_bar(self, window):
+        s = self.strategy
+        analysis = s.analyze_kline([window[0]] + window[:6])
+        if not analysis or not analysis['signal']:
+            return []
+        # check_trend 需要时间正序的K线
+        bullish_trend, bearish_trend = s.check_trend(window[::-1])
+        signal = analysis['signal']
+        if signal == "LONG" and s.enable_trend_filter and not bullish_trend:
+            return []
+        if signal == "SHORT" and s.enable_trend_filter and not bearish_trend:
+            return []
+        entry_price = analysis['entry_price']
+        if signal == "LONG":
+            take_profit = entry_price * (1 + s.take_profit_percent)
+            stop_loss = entry_price * (1 - s.stop_loss_percent)
+        else:
+            take_profit = entry_price * (1 - s.take_profit_percent)
+            stop_loss = entry_price * (1 + s.stop_loss_percent)
+        return [make_signal(self.name, self.inst_id, window[0], signal, entry_price,
+                            take_profit, stop_loss, analysis)]
+
+
+class DogeBollingerAdapter(StrategyAdapter):
+    """doge_bollinger_band_reversal_strategy.py: BollingerStrategy.generate_signal"""
+    name = "doge_bollinger"
+    lookback = 100  # 与实盘 main 中拉取的K线数量一致
+
+    def __init__(self, params: Optional[Dict] = None):
+        module = load_script_module("doge_bollinger_band_reversal_strategy.py")
+        self.strategy = module.BollingerStrategy()
+        for key in params or {}:
+            if key not in module.STRATEGY_PARAMS:
+                raise ValueError(f"未知策略参数: {key}")
+        # STRATEGY_PARAMS 为模块级共享字典，覆盖时复制一份
+        self.strategy.params = dict(module.STRATEGY_PARAMS, **(params or {}))
+        self.inst_id = self.strategy.inst_id
+        self.bar = self.strategy.bar
+
+    def on_bar(self, window):
+        s = self.strategy
+        result = s.generate_signal(window)
+        if not result:
+            return []
+        # 与 execute_trade 一致：记录信号时间戳防重
+        s.last_signal_ts = int(result['timestamp']) // 1000
+        signals = []
+        if result['short_signal']:
+            signals.append(make_signal(self.name, self.inst_id, window[0], "SHORT",
+                                       s.format_price(result['entry_short']), s.format_price(result['tp_short']),
+                                       s.format_price(result['sl_short']), result))
+        if result['long_signal']:
+            signals.append(make_signal(self.name, self.inst_id, window[0], "LONG",
+                                       s.format_price(result['entry_long']), s.format_price(result['tp_long']),
+                                       s.format_price(result['sl_long']), result))
+        return signals
+
+    def get_state(self):
+        return {'last_signal_ts': self.strategy.last_signal_ts}
+
+    def set_state(self, state):
+        self.strategy.last_signal_ts = state.get('last_signal_ts', 0)
+
+
+def _sideways_breakout_adapter(params: Optional[Dict] = None, variant: str = "v3") -> StrategyAdapter:
+    """横盘突破策略适配器（延迟导入，避免与 utils.sideways_breakout 循环引用）"""
+    from utils.sideways_breakout import SidewaysBreakoutAdapter
+    return SidewaysBreakoutAdapter(variant, params=params)
+
+
+ADAPTER_FACTORIES = {
+    'ethqa': EthQAAdapter,
+    'eth_k6': EthK6Adapter,
+    'eth_reversal_v1': lambda params=None: EthReversalAdapter("ETH_大振幅反转v1.py", "eth_reversal_v1", params),
+    'eth_reversal_v2': lambda params=None: EthReversalAdapter("ETH_大振幅反转v2.py", "eth_reversal_v2", params),
+    'vine_5m_reversal': Vine5mReversalAdapter,
+    'vine_k8': VineK8Adapter,
+    'doge_bollinger': DogeBollingerAdapter,
+    'btc_sideways_breakout': _sideways_breakout_adapter,
+}
+
+
+def build_default_adapters(inst_id: Optional[str] = None, names: Optional[List[str]] = None) -> List[StrategyAdapter]:
+    """构建所有（或指定名称的）策略适配器，可按交易标的过滤"""
+    adapters = []
+    for name in (names or ADAPTER_FACTORIES):
+        adapter = ADAPTER_FACTORIES[name]()
+        if inst_id is None or adapter.inst_id == inst_id:
+            adapters.append(adapter)
+    return adapters
+
+
+# ========== 4. 多策略评估器 ==========
+class MultiStrategyEvaluator:
+    """
+    多策略评估器：对同一根K线序列只遍历一次，
+    每根K线只构建一次共享窗口，再依次喂给所有已注册策略
+    """
+
+    def __init__(self, adapters: Optional[List[StrategyAdapter]] = None):
+        self.adapters: List[StrategyAdapter] = []
+        self.window = deque(maxlen=1)
+        self.features: Dict[str, List[float]] = {}
+        self.feature_rows: Dict[int, int] = {}
+        for adapter in adapters or []:
+            self.register(adapter)
+
+    def register(self, adapter: StrategyAdapter):
+        """注册策略，窗口长度取所有策略 lookback 的最大值"""
+        self.adapters.append(adapter)
+        maxlen = max(a.lookback for a in self.adapters)
+        if maxlen != self.window.maxlen:
+            self.window = deque(self.window, maxlen=maxlen)
+
+    def set_features(self, columns: Dict):
+        """
+        传入特征存储的列（FeatureStore.load / load_aligned 的结果），按时间戳匹配K线；
+        找不到对应行的K线不预筛
+        """
+        # 转为列表：逐行取值比 numpy 标量索引快，且得到 Python float
+        self.features = {key: values.tolist() for key, values in columns.items() if key != 'timestamp'}
+        self.feature_rows = {ts: i for i, ts in enumerate(columns['timestamp'].tolist())} if columns else {}
+
+    def _evaluate(self, window: List, warm: bool = False,
+                  adapters: Optional[List[StrategyAdapter]] = None) -> List[Dict]:
+        """
+        :param warm: 实盘评估时按 adapter.warmup 传入更长的窗口，供有状态的策略预热
+        :param adapters: 只评估其中的策略（默认全部）
+        """
+        signals = []
+        for adapter in self.adapters if adapters is None else adapters:
+            if len(window) < adapter.lookback:
+                continue
+            size = max(adapter.lookback, adapter.warmup) if warm else adapter.lookback
+            try:
+                signals.extend(adapter.on_bar(window[:size]))
+            except Exception as e:
+                print(f"[{get_shanghai_time()}] [EVALUATOR] [ERROR] 策略 {adapter.name} 计算异常: {e}")
+        return signals
+
+    def feed(self, kline) -> List[Dict]:
+        """推入一根已完结K线（时间正序），返回本根K线触发的所有信号"""
+        self.window.append(kline)
+        adapters = None
+        i = self.feature_rows.get(int(kline[0])) if self.feature_rows else None
+        if i is not None:
+            # 按预计算特征预筛，本根K线确定不会触发的策略不再解析窗口
+            adapters = [a for a in self.adapters if a.feature_gate(self.features, i)]
+            if not adapters:
+                return []
+        return self._evaluate(list(reversed(self.window)), adapters=adapters)
+
+    def run(self, klines: List) -> List[Dict]:
+        """回测模式：按时间正序遍历K线，返回全部信号"""
+        signals = []
+        for kline in klines:
+            if is_confirmed(kline):
+                signals.extend(self.feed(kline))
+        return signals
+
+    def get_state(self) -> Dict:
+        """评估器状态：K线窗口 + 各策略内部状态"""
+        return {
+            'window': list(self.window),
+            'adapters': {a.name: a.get_state() for a in self.adapters}
+        }
+
+    def set_state(self, state: Dict):
+        self.window = deque(state.get('window', []), maxlen=self.window.maxlen)
+        adapter_states = state.get('adapters', {})
+        for adapter in self.adapters:
+            if adapter.name in adapter_states:
+                adapter.set_state(adapter_states[adapter.name])
+
+    def evaluate_latest(self, klines: List) -> List[Dict]:
+        """实盘模式：输入OKX原始返回（最新在前），只评估最新一根已完结K线"""
+        window = [k for k in klines if is_confirmed(k)]
+        return self._evaluate(window, warm=True)
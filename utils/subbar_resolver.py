@@ -0,0 +1,111 @@
+"""
+子K线成交判定模块
+当一根K线同时触及持仓的止盈价和止损价时，K线级回测无法得知谁先发生。
+SubBarResolver 只为这些有歧义的K线按需加载归档中对应时间段的1m（或更细）K线，
+按时间顺序回放以确定先触发的一方。
+返回 'tp' / 'sl'；成交当根K线的细分数据显示成交之后两者都未触及时返回 NO_EXIT（持仓保留）；
+缺少细分数据或无法判定时返回 None（由调用方保守处理）。
+"""
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from utils.candle_archive import DATA_DIR, list_archive_files, load_kline_csv, merge_klines
+
+# K线周期对应的毫秒数
+BAR_MS = {
+    "1s": 1000, "1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000,
+    "30m": 1800000, "1H": 3600000, "2H": 7200000, "4H": 14400000
+}
+
+# 细分数据覆盖该K线、但成交之后止盈止损都未触发
+NO_EXIT = "none"
+
+
+class SubBarResolver:
+    """
+    可直接作为 BacktestBroker 的 ambiguity_resolver 使用
+    fine_bars 由粗到细排列，如 ("1m", "1s")：1m仍有歧义时再向下一级细分
+    """
+
+    def __init__(self, bar: str = "5m", fine_bars: Sequence[str] = ("1m",),
+                 data_dir: str = DATA_DIR, max_cached_files: int = 16):
+        self.bar = bar
+        self.fine_bars = list(fine_bars)
+        self.data_dir = data_dir
+        self.max_cached_files = max_cached_files
+        self._file_lists: Dict[tuple, List] = {}
+        self._file_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lookups = 0   # 触发细分判定的次数
+        self.resolved = 0  # 成功判定的次数
+
+    # ---------- 按需加载 ----------
+    def _load_file(self, path: str) -> tuple:
+        """读取单个归档文件并缓存 (时间戳列表, K线行)，超出上限时淘汰最久未用的文件"""
+        if path in self._file_cache:
+            self._file_cache.move_to_end(path)
+            return self._file_cache[path]
+        rows = merge_klines(load_kline_csv(path))
+        entry = ([int(r[0]) for r in rows], rows)
+        self._file_cache[path] = entry
+        if len(self._file_cache) > self.max_cached_files:
+            self._file_cache.popitem(last=False)
+        return entry
+
+    def load_range(self, inst_id: str, bar: str, start_ts: int, end_ts: int) -> List:
+        """读取 [start_ts, end_ts) 区间内的细粒度K线，只打开时间范围有交集的文件"""
+        key = (inst_id, bar)
+        if key not in self._file_lists:
+            self._file_lists[key] = list_archive_files(inst_id, bar, self.data_dir)
+        rows = []
+        for f_start, f_end, path in self._file_lists[key]:
+            if f_end < start_ts or f_start >= end_ts:
+                continue
+            ts_list, file_rows = self._load_file(path)
+            i = bisect_left(ts_list, start_ts)
+            while i < len(ts_list) and ts_list[i] < end_ts:
+                rows.append(file_rows[i])
+                i += 1
+        rows.sort(key=lambda r: int(r[0]))
+        return rows
+
+    # ---------- 判定 ----------
+    def _resolve(self, inst_id: str, position: Dict, start_ts: int, end_ts: int,
+                 levels: List[str], need_fill: bool) -> Optional[str]:
+        if not levels:
+            return None
+        fine_bar = levels[0]
+        rows = self.load_range(inst_id, fine_bar, start_ts, end_ts)
+        if not rows:
+            return self._resolve(inst_id, position, start_ts, end_ts, levels[1:], need_fill)
+        is_long = position['pos_side'] == "long"
+        fill_bar = need_fill
+        for row in rows:
+            high, low = float(row[2]), float(row[3])
+            if need_fill:
+                # 成交当根K线：只回放限价单成交之后的走势
+                if (is_long and low > position['entry_price']) or (not is_long and high < position['entry_price']):
+                    continue
+                need_fill = False
+            if is_long:
+                hit_tp, hit_sl = high >= position['tp'], low <= position['sl']
+            else:
+                hit_tp, hit_sl = low <= position['tp'], high >= position['sl']
+            if hit_tp and hit_sl:
+                ts = int(row[0])
+                return self._resolve(inst_id, position, ts, ts + BAR_MS[fine_bar], levels[1:], False)
+            if hit_tp:
+                return "tp"
+            if hit_sl:
+                return "sl"
+        # 成交当根K线：触及发生在成交之前（或之后都未触及），持仓继续；其他情况为数据不一致，无法判定
+        return NO_EXIT if fill_bar else None
+
+    def __call__(self, inst_id: str, position: Dict, kline) -> Optional[str]:
+        ts = int(kline[0])
+        self.lookups += 1
+        need_fill = position.get('entry_ts') == ts
+        reason = self._resolve(inst_id, position, ts, ts + BAR_MS[self.bar], self.fine_bars, need_fill)
+        if reason:
+            self.resolved += 1
+        return reason